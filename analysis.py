@@ -0,0 +1,521 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from appdata import data_path
+from binaries import binary, POPEN_FLAGS
+from formats import CODECS
+from supervisor import POSTPROCESS_LIMIT
+from waveform import Scratch, clean_scratch, sidecar_path, write_sidecar
+
+#optional analysis of every finished file - tempo, musical key, integrated loudness (EBU R128) and peak,
+#written into its tags so dj software doesn't have to analyse the crate all over again.
+#  - ffmpeg decodes to float pcm on a pipe, read CHUNK_SECONDS at a time - memory stays flat for any length
+#  - the dsp is numpy on whole chunks (fft filtering, framed stft, block means), no python loop per sample/frame
+#  - one worker process per core - the download threads only hand over a path, so they never wait on it
+#  - results are cached by content hash (analysis.db), the tagged file's hash as well - a re-run, or the
+#    same file in another folder, costs one hash and no decode
+#  - the same decode makes the waveform overview for the results view (see waveform.py)
+#needs numpy - without it the stage says so once and the downloads carry on untagged
+
+VERSION = 1 #bump when the results would change - older cache rows are ignored then
+
+RATE = 44100
+CHUNK_SECONDS = 30
+WORKERS = os.cpu_count() or 2
+
+#loudness: 400ms blocks every 100ms (BS.1770), gated at -70 LUFS and 10 LU under the ungated level
+STEP = RATE // 10
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+REPLAYGAIN_REFERENCE = -18.0 #LUFS, replaygain 2.0
+
+#tempo and key: mono at half rate. onsets from 2048-point frames every 512 samples (~43 per second),
+#pitch classes from 8192-point frames (~2.7hz bins - a semitone is 4hz wide at C2) every 4096
+LOW_RATE = RATE // 2
+N_FFT = 2048
+HOP = 512
+FPS = LOW_RATE / HOP
+CHROMA_FFT = 8192
+CHROMA_HOP = 4096
+MIN_BPM, MAX_BPM = 70.0, 180.0 #dj range - a 60 or 200 bpm track reads as its half/double
+MIN_SECONDS = 8 #shorter than this: no tempo
+MIN_FLUX = 1.0 #average onset strength under this = nothing ever starts (a drone, a test tone): no tempo
+MIN_PERIODICITY = 0.1 #onsets that don't repeat (noise, ambient): no tempo either
+TEMPO_HORIZON = 4 #seconds of beat multiples that back a candidate period up
+TEMPO_CENTER = 128 #bpm - breaks half/double ties (one octave either side costs about the same)
+CHROMA_RANGE = (65.0, 2100.0) #C2..C7, where the harmony is
+
+NOTES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+#temperley (kostka-payne) key profiles, tonic first - the third weighs more than in krumhansl's, which
+#otherwise reads a lot of minor tracks as their parallel major
+MAJOR = [0.748, 0.060, 0.488, 0.082, 0.670, 0.460, 0.096, 0.715, 0.104, 0.366, 0.057, 0.400]
+MINOR = [0.712, 0.084, 0.474, 0.618, 0.049, 0.460, 0.105, 0.747, 0.404, 0.067, 0.133, 0.330]
+
+#extension -> muxer for the tag rewrite
+MUXERS = {"." + extension: muxer for extension, _, muxer in CODECS.values()}
+
+
+def available():
+    try:
+        import numpy  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+#K-weighting (pre-filter shelf + RLB high-pass) as a frequency response - the same biquads ebur128 uses,
+#for any sample rate, evaluated on an rfft grid of n points (n even)
+def k_weighting(n, rate=RATE):
+    import numpy as np
+
+    def biquad(b, a):
+        z = np.exp(-1j * np.pi * np.arange(n // 2 + 1) / (n // 2))
+        return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+
+    k = np.tan(np.pi * 1681.974450955533 / rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = biquad(
+        [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0],
+        [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0],
+    )
+
+    k = np.tan(np.pi * 38.13547087602444 / rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass = biquad([1.0, -2.0, 1.0], [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    return shelf * highpass
+
+
+#running state for one file - feed() takes (frames, 2) float32 chunks, result() does the rest
+class Analysis:
+
+    def __init__(self):
+        import numpy as np
+
+        self.np = np
+        #|K-weighting|^2 per rfft bin of a step, bins other than dc/nyquist counted twice (parseval)
+        weights = np.abs(k_weighting(STEP)) ** 2
+        weights[1:-1] *= 2
+        self.weights = (weights / (STEP * STEP)).astype(np.float32)
+        self.steps = [] #K-weighted mean square per channel per 100ms
+        self.rest = np.zeros((0, 2), dtype=np.float32) #samples short of a whole step
+        self.peak = 0.0
+        self.frames = 0
+
+        self.window = np.hanning(N_FFT).astype(np.float32)
+        self.onsets = [] #spectral flux per frame
+        self.tail = np.zeros(0, dtype=np.float32) #low-rate samples not framed yet
+        self.previous = None #last frame's log spectrum
+
+        self.chroma_window = np.hanning(CHROMA_FFT).astype(np.float32)
+        frequencies = np.fft.rfftfreq(CHROMA_FFT, 1 / LOW_RATE)
+        self.chroma_bins = np.flatnonzero((frequencies >= CHROMA_RANGE[0]) & (frequencies <= CHROMA_RANGE[1]))
+        self.pitch_class = np.round(69 + 12 * np.log2(frequencies[self.chroma_bins] / 440.0)).astype(int) % 12
+        self.chroma = np.zeros(12)
+        self.chroma_tail = np.zeros(0, dtype=np.float32)
+
+    def feed(self, chunk):
+        np = self.np
+        self.frames += len(chunk)
+        if len(chunk):
+            self.peak = max(self.peak, float(np.abs(chunk).max()))
+        self.feed_loudness(chunk)
+
+        #mono, halved rate (pairs averaged - crude, but nothing above 5khz matters for beats and harmony)
+        mono = chunk.mean(axis=1)
+        mono = mono[:len(mono) // 2 * 2].reshape(-1, 2).mean(axis=1).astype(np.float32)
+        self.tail, frames = self.frame(self.tail, mono, N_FFT, HOP)
+        if frames is not None:
+            self.feed_onsets(frames)
+        self.chroma_tail, frames = self.frame(self.chroma_tail, mono, CHROMA_FFT, CHROMA_HOP)
+        if frames is not None:
+            self.feed_chroma(frames)
+
+    def feed_loudness(self, chunk):
+        np = self.np
+        samples = np.concatenate([self.rest, chunk])
+        whole = len(samples) // STEP * STEP
+        self.rest = samples[whole:]
+        if not whole:
+            return
+
+        #K-weighted mean square of every step straight from its spectrum - no filter state to carry between
+        #steps or chunks, and lots of small ffts instead of one huge one
+        steps = samples[:whole].reshape(-1, STEP, 2).transpose(0, 2, 1)
+        spectrum = np.fft.rfft(steps, axis=2)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        self.steps.append(power @ self.weights)
+
+    #overlapping frames (a view, no copy) of what's left from last time + the new samples -> (rest, frames or None)
+    def frame(self, tail, samples, size, hop):
+        np = self.np
+        samples = np.concatenate([tail, samples])
+        count = (len(samples) - size) // hop + 1
+        if count <= 0:
+            return samples, None
+        return samples[count * hop:], np.lib.stride_tricks.sliding_window_view(samples, size)[::hop][:count]
+
+    def feed_onsets(self, frames):
+        np = self.np
+        magnitude = np.abs(np.fft.rfft(frames * self.window, axis=1))
+
+        #onset strength: how much the log spectrum rose since the frame before, summed over the bins
+        spectrum = np.log1p(100 * magnitude)
+        previous = spectrum[:1] if self.previous is None else self.previous[None, :]
+        self.onsets.append(np.maximum(0, np.diff(spectrum, axis=0, prepend=previous)).sum(axis=1))
+        self.previous = spectrum[-1]
+
+    #pitch class energy over the whole track (square root - loud bass notes don't drown the chords)
+    def feed_chroma(self, frames):
+        np = self.np
+        magnitude = np.sqrt(np.abs(np.fft.rfft(frames * self.chroma_window, axis=1)[:, self.chroma_bins]))
+        self.chroma += np.bincount(self.pitch_class, weights=magnitude.sum(axis=0), minlength=12)
+
+    def result(self):
+        return {
+            "bpm": self.tempo(),
+            "key": self.key(),
+            "lufs": self.loudness(),
+            "peak": round(self.peak, 6),
+            "duration": round(self.frames / RATE, 2),
+        }
+
+    #integrated loudness, BS.1770-4 gating
+    def loudness(self):
+        np = self.np
+        if not self.steps:
+            return None
+        steps = np.concatenate(self.steps)
+        if len(steps) < 4:
+            return None
+        #400ms blocks = 4 steps, every step. channels summed with weight 1 (stereo)
+        total = np.concatenate([[0.0], np.cumsum(steps.sum(axis=1))])
+        power = (total[4:] - total[:-4]) / 4
+        with np.errstate(divide="ignore"):
+            level = -0.691 + 10 * np.log10(power)
+        gated = power[level > ABSOLUTE_GATE]
+        if not len(gated):
+            return None
+        relative = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+        gated = power[(level > ABSOLUTE_GATE) & (level > relative)]
+        return round(float(-0.691 + 10 * np.log10(gated.mean())), 2)
+
+    #autocorrelation of the onset envelope: the period in the dj range whose multiples (up to TEMPO_HORIZON)
+    #line up best, then refined on the 8th multiple with a parabolic peak fit for decimal precision
+    def tempo(self):
+        np = self.np
+        if not self.onsets:
+            return None
+        envelope = np.concatenate(self.onsets)
+        if len(envelope) < MIN_SECONDS * FPS or envelope.mean() < MIN_FLUX:
+            return None
+        #a little smoothing - single-frame onset peaks would make the fractional lags hit or miss
+        envelope = np.convolve(envelope, [0.25, 0.5, 0.25], "same")
+        envelope = envelope - envelope.mean()
+        spectrum = np.fft.rfft(envelope, n=2 * len(envelope))
+        correlation = np.fft.irfft(spectrum * np.conj(spectrum))[:len(envelope)]
+        if correlation[0] <= 0:
+            return None
+        correlation /= correlation[0]
+
+        candidates = np.arange(MIN_BPM, MAX_BPM + 0.25, 0.5)
+        lags = 60 * FPS / candidates
+        multiples = lags[:, None] * np.arange(1, int(TEMPO_HORIZON * FPS / lags.min()) + 1)
+        inside = multiples <= TEMPO_HORIZON * FPS
+        comb = (np.interp(multiples, np.arange(len(correlation)), correlation) * inside).sum(axis=1) / inside.sum(axis=1)
+        score = comb * np.exp(-0.5 * np.log2(candidates / TEMPO_CENTER) ** 2)
+        best = int(np.argmax(score))
+        if comb[best] < MIN_PERIODICITY:
+            return None
+        lag = lags[best]
+
+        multiple = 8 if 8 * lag + 8 < len(correlation) - 1 else 1
+        low, high = int(multiple * lag - multiple), int(multiple * lag + multiple) + 1
+        peak = low + int(np.argmax(correlation[low:high]))
+        if 0 < peak < len(correlation) - 1:
+            before, at, after = correlation[peak - 1:peak + 2]
+            curve = before - 2 * at + after
+            if curve < 0:
+                peak = peak + 0.5 * (before - after) / curve
+        bpm = 60 * FPS * multiple / peak
+        while bpm < MIN_BPM:
+            bpm *= 2
+        while bpm > MAX_BPM:
+            bpm /= 2
+        return round(float(bpm), 1)
+
+    #the 24 major/minor profiles against the track's pitch class energy - best correlation wins
+    def key(self):
+        np = self.np
+        if not self.chroma.any():
+            return None
+        profiles = np.array([np.roll(MAJOR, tonic) for tonic in range(12)] + [np.roll(MINOR, tonic) for tonic in range(12)])
+        profiles = (profiles - profiles.mean(axis=1, keepdims=True)) / profiles.std(axis=1, keepdims=True)
+        chroma = (self.chroma - self.chroma.mean()) / (self.chroma.std() or 1)
+        best = int(np.argmax(profiles @ chroma))
+        return NOTES[best % 12] + ("m" if best >= 12 else "")
+
+
+def decode_command(path):
+    return [
+        binary("ffmpeg"),
+        "-v", "error",
+        "-nostdin",
+        "-i", path,
+        "-vn",
+        "-ac", "2",
+        "-ar", str(RATE),
+        "-f", "f32le",
+        "-",
+    ]
+
+
+#decode and analyse one file -> (result, packed waveform overview or None), None if ffmpeg couldn't read it
+def analyze(path):
+    import numpy as np
+
+    analysis = Analysis()
+    chunk_bytes = RATE * CHUNK_SECONDS * 2 * 4
+    with Scratch() as scratch:
+        process = subprocess.Popen(decode_command(path), **POPEN_FLAGS, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            leftover = b""
+            while True:
+                data = process.stdout.read(chunk_bytes)
+                if not data:
+                    break
+                data = leftover + data
+                whole = len(data) // 8 * 8
+                leftover = data[whole:]
+                chunk = np.frombuffer(data[:whole], dtype=np.float32).reshape(-1, 2)
+                analysis.feed(chunk)
+                scratch.write(chunk)
+            process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+        if process.returncode != 0 or not analysis.frames:
+            return None
+        return analysis.result(), scratch.overview(analysis.frames / RATE)
+
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+#what goes in the tags - id3 frames for mp3, vorbis comment style names everywhere else
+def tag_args(path, result):
+    mp3 = path.lower().endswith(".mp3")
+    tags = {}
+    if result.get("bpm"):
+        tags["TBPM" if mp3 else "BPM"] = str(round(result["bpm"])) if mp3 else f"{result['bpm']:g}"
+    if result.get("key"):
+        tags["TKEY" if mp3 else "INITIALKEY"] = result["key"]
+    if result.get("lufs") is not None:
+        tags["REPLAYGAIN_TRACK_GAIN"] = f"{REPLAYGAIN_REFERENCE - result['lufs']:.2f} dB"
+        tags["REPLAYGAIN_TRACK_PEAK"] = f"{result['peak']:.6f}"
+
+    args = []
+    for name, value in tags.items():
+        args += ["-metadata", f"{name}={value}"]
+    return args
+
+
+#rewrite the file with the tags added (stream copy, so it's mostly disk time) - False if it couldn't
+def write_tags(path, result):
+    extension = os.path.splitext(path)[1].lower()
+    muxer = MUXERS.get(extension)
+    args = tag_args(path, result)
+    if not muxer or extension == ".wav" or not args:
+        return False
+
+    extra = {
+        ".mp3": ["-id3v2_version", "3"], #what most dj software reads best
+        ".m4a": ["-movflags", "use_metadata_tags"], #keep the custom keys
+    }.get(extension, [])
+    #cover art comes along, except into ogg/opus where ffmpeg can't copy it as a stream
+    streams = ["-map", "0:a"] if extension in (".ogg", ".opus") else ["-map", "0"]
+    temp = path + ".part"
+    command = [
+        binary("ffmpeg"), "-y", "-v", "error", "-nostdin",
+        "-i", path,
+        *streams, "-c", "copy", "-map_metadata", "0",
+        *args, *extra,
+        "-f", muxer, temp,
+    ]
+    try:
+        done = subprocess.run(
+            command, **POPEN_FLAGS, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=POSTPROCESS_LIMIT
+        ).returncode == 0
+    except subprocess.TimeoutExpired:
+        done = False
+    if done:
+        os.replace(temp, path)
+    elif os.path.exists(temp):
+        os.remove(temp)
+    return done
+
+
+class AnalysisCache:
+
+    def __init__(self, path=None):
+        self.path = path or data_path("analysis.db")
+        self.lock = threading.Lock()
+        #every worker process has its own connection - WAL plus a busy timeout sorts out the writers
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                hash TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                tagged INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL
+            )
+        """)
+        #packed waveform overview - came later, rows from before get one on their next run
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(results)")}
+        if "waveform" not in columns:
+            self.db.execute("ALTER TABLE results ADD COLUMN waveform BLOB")
+
+    #(result, tagged, waveform) for a content hash, None if it was never analysed (by this version)
+    def get(self, digest):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT result, tagged, waveform FROM results WHERE hash = ? AND version = ?", (digest, VERSION)
+            ).fetchone()
+        if not row:
+            return None
+        return json.loads(row[0]), bool(row[1]), row[2]
+
+    def put(self, digest, result, tagged=False, waveform=None):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results (hash, version, result, tagged, created, waveform) VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, VERSION, json.dumps(result), int(tagged), time.time(), waveform)
+            )
+
+
+_cache = None
+
+
+#one per process - the workers each open their own
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = AnalysisCache()
+    return _cache
+
+
+#worker process: cache lookup, else decode + analyse, then the waveform sidecar and tags - returns the result
+#with how it went
+def analyze_file(path, tag=True):
+    start = time.monotonic()
+    cache = get_cache()
+    digest = file_hash(path)
+    result, tagged, overview = cache.get(digest) or (None, False, None)
+    cached = result is not None and overview is not None
+    if not cached:
+        decoded = analyze(path)
+        if decoded is None:
+            return {"path": path, "error": "could not decode", "seconds": round(time.monotonic() - start, 3)}
+        result, overview = decoded
+        cache.put(digest, result, tagged, overview)
+
+    #written every time - 3kb, and whatever sidecar is there could be from an older file of the same name
+    sidecar = sidecar_path(path) if overview is not None and write_sidecar(path, overview) else None
+
+    #a file that already has them (the hash of a tagged file) isn't rewritten
+    if tag and not tagged and write_tags(path, result):
+        cache.put(file_hash(path), result, tagged=True, waveform=overview)
+    return dict(result, path=path, waveform=sidecar, cached=cached, seconds=round(time.monotonic() - start, 3))
+
+
+def describe(result):
+    name = os.path.splitext(os.path.basename(result["path"]))[0]
+    if result.get("error"):
+        return f"{name}: analysis failed ({result['error']})"
+    parts = [
+        f"{result['bpm']:g} bpm" if result.get("bpm") else None,
+        result.get("key"),
+        f"{result['lufs']:g} LUFS" if result.get("lufs") is not None else None,
+    ]
+    return f"{name}: " + ", ".join(part for part in parts if part)
+
+
+class Analyzer:
+
+    def __init__(self, workers=WORKERS):
+        self.workers = max(1, workers)
+        self.lock = threading.Lock()
+        self.pool = None
+        self.missing = False #numpy not installed - reported once
+
+    #queue a finished file - the status line comes when it's analysed. None if analysis isn't possible
+    def submit(self, path, status_callback=None, tag=True):
+        with self.lock:
+            if self.pool is None:
+                if not available():
+                    if not self.missing and status_callback:
+                        status_callback("analysis skipped: numpy isn't installed")
+                    self.missing = True
+                    return None
+                clean_scratch()
+                #spawned, not forked - the gui/daemon has threads running that a fork would copy mid-lock
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            future = self.pool.submit(analyze_file, path, tag)
+        future.reported = threading.Event() #result() can return before the done callback ran
+
+        def finished(future):
+            from metrics import get_metrics
+
+            metrics = get_metrics()
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"path": path, "error": str(e)}
+            outcome = "failed" if result.get("error") else "cached" if result.get("cached") else "analyzed"
+            metrics.inc("analyzed_total", outcome=outcome)
+            if outcome == "analyzed":
+                metrics.observe("analyze_seconds", result.get("seconds"))
+            if status_callback:
+                status_callback(describe(result))
+            future.reported.set()
+
+        future.add_done_callback(finished)
+        return future
+
+    #block until these are done and reported (the end of a job - its last files are usually still in the pool)
+    def wait(self, futures):
+        for future in futures:
+            if future is not None:
+                future.reported.wait()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_analyzer():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Analyzer()
+        return _shared
@@ -0,0 +1,18 @@
+import os
+import sys
+
+#where crateplug keeps its own state (job queue, indexes, caches) - never inside the download folder
+
+def data_dir():
+    if sys.platform == "win32":
+        base = os.getenv("APPDATA") or os.path.expanduser("~")
+    else:
+        base = os.getenv("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+
+    path = os.path.join(base, "crateplug")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def data_path(name):
+    return os.path.join(data_dir(), name)
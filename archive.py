@@ -0,0 +1,147 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from appdata import data_path
+
+#one download archive for every folder and every mode, keyed by extractor + video id.
+#sqlite keeps it on disk (with the file it went to and when), and a set in memory answers
+#"already have it?" in O(1) so all modes can check before yt-dlp touches the network
+
+#youtube.com/watch?v=ID, youtu.be/ID, /shorts/ID, /live/ID, music.youtube.com/watch?v=ID
+YOUTUBE_ID = re.compile(
+    r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|live/|embed/)|youtu\.be/)([0-9A-Za-z_-]{11})(?![0-9A-Za-z_-])"
+)
+
+
+#("youtube", id) for a single-video url, None if the id can't be known without extracting
+def video_key_from_url(url):
+    found = YOUTUBE_ID.search(url)
+    if found:
+        return "youtube", found.group(1)
+    return None
+
+
+class ArchiveIndex:
+
+    def __init__(self, path=None):
+        self.path = path or data_path("archive.db")
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS archive (
+                extractor TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                path TEXT,
+                added REAL NOT NULL,
+                PRIMARY KEY (extractor, video_id)
+            ) WITHOUT ROWID
+        """)
+        #archive.txt files already imported, so unchanged ones aren't read again
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS imports (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+
+        self.keys = {f"{extractor} {video_id}" for extractor, video_id in self.db.execute("SELECT extractor, video_id FROM archive")}
+        self.version = 0 #bumped on every add, export_archive_txt only rewrites when this moved
+        self.exported = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def contains(self, extractor, video_id):
+        return f"{extractor.lower()} {video_id}" in self.keys
+
+    def add(self, extractor, video_id, path=None):
+        key = f"{extractor.lower()} {video_id}"
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO archive (extractor, video_id, path, added) VALUES (?, ?, ?, ?)",
+                (extractor.lower(), video_id, path, time.time())
+            )
+            if key not in self.keys:
+                self.keys.add(key)
+                self.version += 1
+
+    #remember a finished download (a "done" event from any mode)
+    def record(self, event):
+        if event.category == "done" and event.video_id:
+            self.add(event.extractor or "youtube", event.video_id, event.path)
+
+    def get_path(self, extractor, video_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT path FROM archive WHERE extractor = ? AND video_id = ?", (extractor.lower(), video_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    #pull in an old per-folder archive.txt (yt-dlp's "<extractor> <id>" lines)
+    def import_archive_txt(self, archive_file):
+        try:
+            stat = os.stat(archive_file)
+        except OSError:
+            return 0
+
+        with self.lock:
+            seen = self.db.execute("SELECT mtime, size FROM imports WHERE path = ?", (archive_file,)).fetchone()
+        if seen and seen[0] == stat.st_mtime and seen[1] == stat.st_size:
+            return 0
+
+        rows = []
+        with open(archive_file, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and f"{parts[0].lower()} {parts[1]}" not in self.keys:
+                    rows.append((parts[0].lower(), parts[1], None, stat.st_mtime))
+
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany("INSERT OR IGNORE INTO archive (extractor, video_id, path, added) VALUES (?, ?, ?, ?)", rows)
+            self.db.execute(
+                "INSERT OR REPLACE INTO imports (path, mtime, size) VALUES (?, ?, ?)",
+                (archive_file, stat.st_mtime, stat.st_size)
+            )
+            self.db.execute("COMMIT")
+            for extractor, video_id, _, _ in rows:
+                self.keys.add(f"{extractor} {video_id}")
+            if rows:
+                self.version += 1
+
+        return len(rows)
+
+    #the single-process playlist modes hand yt-dlp a plain archive file - written from the index when it changed
+    def export_archive_txt(self, archive_file=None):
+        archive_file = archive_file or data_path("archive.txt")
+        with self.lock:
+            if self.exported == (archive_file, self.version) and os.path.exists(archive_file):
+                return archive_file
+            keys = sorted(self.keys)
+            version = self.version
+
+        temp = archive_file + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write("\n".join(keys) + ("\n" if keys else ""))
+        os.replace(temp, archive_file)
+
+        self.exported = (archive_file, version)
+        return archive_file
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+#one index per process, shared by every mode and worker thread
+def get_archive():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ArchiveIndex()
+        return _shared
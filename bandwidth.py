@@ -0,0 +1,172 @@
+import os
+import threading
+from contextlib import contextmanager
+
+#one budget of connections and bytes/s for everything this process downloads.
+#every running job joins with a weight (its priority), every yt-dlp process / in-process download takes a
+#lease for as long as it runs. a lease gets its job's weighted share of the budget split over the downloads
+#the job runs side by side: fragment concurrency (-N) and a rate limit (--limit-rate, only with a rate budget).
+#the split is per lease, worked out when the lease starts - nothing is rebalanced afterwards, a running yt-dlp
+#can't change its flags. so it follows the job's downloads starting and finishing one entry at a time
+#(per-entry modes), and stays what it was for a whole job in the one-process playlist modes.
+#the gui and the runner run one job at a time, so in practice that job has the whole budget and the weights
+#only decide anything if jobs ever overlap (a job finishing while the next one starts)
+#
+#defaults come from CRATEPLUG_MAX_CONNECTIONS / CRATEPLUG_MAX_RATE (bytes/s, 0 = unlimited), the gui's
+#max_connections / max_rate settings or the cli's --connections / --limit-rate
+
+DEFAULT_CONNECTIONS = 16
+MAX_FRAGMENTS = 8 #per process - more parallel fragments than this just trips throttling
+MIN_RATE = 64 * 1024 #never starve a download below this, even with lots of leases
+
+#job priority -> weight. single tracks are someone waiting for them, big playlists are background work
+PRIORITIES = {"high": 4, "normal": 2, "low": 1}
+MODE_PRIORITY = {"single": "high", "playlist": "normal", "large_playlist": "low"}
+
+
+def job_priority(job):
+    options = job.get("options") or {}
+    if options.get("priority") in PRIORITIES:
+        return options["priority"]
+    return MODE_PRIORITY.get(job.get("mode"), "normal")
+
+
+#"500K", "2.5M", "1048576" -> bytes/s (same suffixes as yt-dlp's --limit-rate)
+def parse_rate(text):
+    text = str(text).strip().upper().rstrip("B")
+    scale = 1
+    if text and text[-1] in "KMG":
+        scale = 1024 ** ("KMG".index(text[-1]) + 1)
+        text = text[:-1]
+    return int(float(text) * scale)
+
+
+def env_rate(name, default):
+    try:
+        return parse_rate(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+#a plain count - no rate suffixes
+def env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class JobShare:
+
+    def __init__(self, budget, key, weight, slots=1):
+        self.budget = budget
+        self.key = key
+        self.weight = weight
+        self.slots = slots #downloads the job runs side by side (playlist workers)
+        self.leases = 0
+
+    #yt-dlp args for one process of this job, held until the process ends
+    @contextmanager
+    def lease(self):
+        fragments, rate = self.budget.acquire(self)
+        try:
+            yield ["-N", str(fragments), *(["--limit-rate", str(rate)] if rate else [])]
+        finally:
+            self.budget.release(self)
+
+    #the same for an in-process download (YoutubeDL params)
+    @contextmanager
+    def lease_params(self):
+        fragments, rate = self.budget.acquire(self)
+        try:
+            yield {"concurrent_fragment_downloads": fragments, "ratelimit": rate}
+        finally:
+            self.budget.release(self)
+
+
+class BandwidthBudget:
+
+    def __init__(self, connections=None, rate=None):
+        self.lock = threading.Lock()
+        self.shares = []
+        self.configure(
+            connections if connections is not None else env_int("CRATEPLUG_MAX_CONNECTIONS", DEFAULT_CONNECTIONS),
+            rate if rate is not None else env_rate("CRATEPLUG_MAX_RATE", 0),
+        )
+
+    #rate in bytes/s, 0 or None = unlimited. applies to leases taken from now on
+    def configure(self, connections=None, rate=None):
+        with self.lock:
+            if connections is not None:
+                self.connections = max(1, int(connections))
+            if rate is not None:
+                self.rate = max(0, int(rate)) or None
+
+    @contextmanager
+    def join(self, job):
+        slots = (job.get("workers") or 1) if job.get("mode") == "playlist" else 1
+        share = JobShare(self, job.get("id"), PRIORITIES[job_priority(job)], max(1, slots))
+        with self.lock:
+            self.shares.append(share)
+        try:
+            yield share
+        finally:
+            with self.lock:
+                self.shares.remove(share)
+
+    #weighted share of the active jobs, split over the downloads the job runs side by side
+    def acquire(self, share):
+        with self.lock:
+            share.leases += 1
+            fraction = share.weight / sum(s.weight for s in self.shares)
+            split = max(share.slots, share.leases)
+
+            fragments = max(1, min(MAX_FRAGMENTS, int(self.connections * fraction / split)))
+            rate = None
+            if self.rate:
+                rate = max(MIN_RATE, int(self.rate * fraction / split))
+            return fragments, rate
+
+    def release(self, share):
+        with self.lock:
+            share.leases -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "connections": self.connections,
+                "rate": self.rate or 0,
+                "jobs": len(self.shares),
+                "leases": sum(s.leases for s in self.shares),
+            }
+
+
+#download functions take share=None when called outside a job (bench, scripts) - no limits then
+@contextmanager
+def lease(share):
+    if share is None:
+        yield []
+        return
+    with share.lease() as args:
+        yield args
+
+
+@contextmanager
+def lease_params(share):
+    if share is None:
+        yield {}
+        return
+    with share.lease_params() as params:
+        yield params
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_budget():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = BandwidthBudget()
+        return _shared
@@ -0,0 +1,137 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+#throughput and accuracy of the analysis stage (analysis.py) - writes synthetic tracks with a known tempo and
+#key (kick on every beat, i-iv-V-i chords a bar each), runs them through the real pool (ffmpeg decode included)
+#and reports files/s and audio minutes/s against the download rate it has to keep up with, then the same
+#files again from the cache. --mix-minutes first runs one long dj mix on its own and reports the worker's peak
+#memory, which should come out about the same for 3 hours as for 3 minutes (decode and waveform both stream).
+#  python bench/analysis_bench.py --files 32 --seconds 240
+#  python bench/analysis_bench.py --workers 1                  single core, for the per-file cost
+#  python bench/analysis_bench.py --files 1000 --seconds 60 --mix-minutes 180
+#needs numpy and a real ffmpeg (CRATEPLUG_FFMPEG or on PATH). uses its own data folder, so the cache starts cold
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RATE = 44100
+TEMPOS = [118.0, 122.0, 124.0, 126.0, 128.0, 132.0, 140.0, 174.0, 95.0, 100.0]
+
+
+def synth(bpm, root, minor, t):
+    import numpy as np
+
+    def tone(frequency):
+        return sum(np.sin(2 * np.pi * frequency * h * t) / h for h in range(1, 6))
+
+    tonic = 130.81 * 2 ** (root / 12)
+    triad = (0, 3, 7) if minor else (0, 4, 7)
+    bar = 8 * 60 / bpm
+    x = np.zeros_like(t)
+    for n, (degree, intervals) in enumerate([(0, triad), (5, triad), (7, (0, 4, 7)), (0, triad)]):
+        section = (t // bar).astype(int) % 4 == n
+        x += section * (sum(0.04 * tone(tonic * 2 ** ((degree + i) / 12)) for i in intervals) + 0.06 * tone(tonic / 2 * 2 ** (degree / 12)))
+    x += np.exp(-(t % (60 / bpm)) * 40) * np.sin(2 * np.pi * 50 * t) * 0.5
+    return (np.clip(np.stack([x, x], axis=1), -1, 1) * 32767).astype(np.int16).tobytes()
+
+
+#written a minute at a time - a long mix doesn't fit in memory here either
+def synth_track(path, bpm, root, minor, seconds):
+    import numpy as np
+
+    with wave.open(path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        for start in range(0, int(RATE * seconds), RATE * 60):
+            t = np.arange(start, min(start + RATE * 60, int(RATE * seconds))) / RATE
+            f.writeframes(synth(bpm, root, minor, t))
+
+
+#peak rss of the worker processes that have exited so far, in MB - None where there's no getrusage (windows)
+def children_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / 1024 if sys.platform != "darwin" else peak / 1024 ** 2
+
+
+#one long file through a pool of its own, so the peak is that worker's
+def run_mix(tmp, minutes):
+    from analysis import Analyzer
+
+    path = os.path.join(tmp, "mix.wav")
+    print(f"writing a {minutes:g} minute mix...", flush=True)
+    synth_track(path, 126.0, 9, True, minutes * 60)
+    analyzer = Analyzer(1)
+    elapsed, (result,) = run_pass(analyzer, [path])
+    analyzer.pool.shutdown()
+    os.remove(path)
+    return elapsed, result, children_rss()
+
+
+def run_pass(analyzer, paths):
+    start = time.perf_counter()
+    futures = [analyzer.submit(path, tag=False) for path in paths]
+    analyzer.wait(futures)
+    return time.perf_counter() - start, [future.result() for future in futures]
+
+
+def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--files", type=int, default=32)
+    args.add_argument("--seconds", type=float, default=240, help="length of every track")
+    args.add_argument("--workers", type=int, help="analysis processes (default: one per core)")
+    args.add_argument("--download-rate", type=float, default=1.0, help="finished downloads per second to compare against")
+    args.add_argument("--mix-minutes", type=float, help="also run one mix this long on its own, for its memory")
+    args = args.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="crateplug-analysis-") as tmp:
+        os.environ["XDG_DATA_HOME"] = os.path.join(tmp, "data") #cold cache, inherited by the workers
+        from analysis import Analyzer, NOTES, WORKERS, available, describe
+
+        if not available():
+            sys.exit("numpy isn't installed")
+
+        mix = run_mix(tmp, args.mix_minutes) if args.mix_minutes else None
+
+        print(f"writing {args.files} tracks of {args.seconds:g}s...", flush=True)
+        expected = {}
+        for n in range(args.files):
+            bpm, root, minor = TEMPOS[n % len(TEMPOS)], (n * 5) % 12, n % 2 == 1
+            path = os.path.join(tmp, f"track {n:03d}.wav")
+            synth_track(path, bpm, root, minor, args.seconds)
+            expected[path] = (bpm, NOTES[root] + ("m" if minor else ""))
+
+        analyzer = Analyzer(args.workers or WORKERS)
+        paths = sorted(expected)
+        elapsed, results = run_pass(analyzer, paths)
+        cached, _ = run_pass(analyzer, paths)
+
+    if mix:
+        elapsed_mix, result, rss = mix
+        print(f"mix               {args.mix_minutes:g} min in {elapsed_mix:.1f}s  worker peak {rss or 0:.0f}MB  {describe(result)}")
+
+    failed = [result for result in results if result.get("error")]
+    waveforms = sum(1 for result in results if result.get("waveform"))
+    tempo_ok = sum(1 for r in results if r.get("bpm") and abs(r["bpm"] - expected[r["path"]][0]) <= 0.5)
+    key_ok = sum(1 for r in results if r.get("key") == expected[r["path"]][1])
+    files_per_sec = args.files / elapsed
+    print(f"workers           {analyzer.workers}")
+    print(f"analysis          {elapsed:.2f}s  {files_per_sec:.2f} files/s  {args.files * args.seconds / 60 / elapsed:.1f} audio min/s")
+    print(f"per file (1 core) {elapsed * analyzer.workers / args.files:.2f}s")
+    print(f"cached re-run     {cached:.2f}s")
+    print(f"tempo within 0.5  {tempo_ok}/{args.files}   key {key_ok}/{args.files}   failed {len(failed)}")
+    print(f"waveforms         {waveforms}/{args.files}")
+    verdict = "keeps up with" if files_per_sec >= args.download_rate else "falls behind"
+    print(f"{verdict} {args.download_rate:g} downloads/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+#micro-benchmark for classifier.py - per-line parse cost over a recorded large-playlist log.
+#run from the repo root:  python bench/bench_classifier.py [--extra-rules 50]
+#--extra-rules pads the table with fake rules to check the cost stays flat as patterns get added.
+#  rules   the rule lookup alone, on the log lines that reach it - the matcher against the old substring chain.
+#          at today's ~17 rules the two cost about the same (a few needles are as quick to find one by one),
+#          from there the chain grows with every rule and the matcher barely moves (3x at 117, 16x at 1017)
+#  feed    whole lines. not like for like: the parser turns every [done] line into a full event (position, id,
+#          extractor, path) where the baseline only checks for ".mp3", so most of the gap is that
+#before timing anything the matcher is checked against the chain's first-rule-wins order, on the log and on
+#needles that overlap each other - exits 1 if they disagree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from classifier import OutputParser, RULES, build_matcher, match_rule  # noqa: E402
+
+DEFAULT_LOG = os.path.join(ROOT, "bench", "logs", "large_playlist.log")
+
+
+#the old per-module if/elif chain (dlsingle.py before the classifier) - kept here only as a baseline
+def legacy_feed(line, state, rules):
+    line = line.strip()
+    lower = line.lower()
+
+    if line.startswith("[") and "]" in line:
+        state["prefix"] = line
+        return None
+    if line.endswith(".mp3"):
+        return "done"
+
+    n = legacy_rule(lower, rules)
+    return None if n is None else rules[n][2]
+
+
+#first rule (in table order) with a needle in the line
+def legacy_rule(lower, rules):
+    for n, (_, needles, _) in enumerate(rules):
+        for needle in needles:
+            if needle in lower:
+                return n
+    return None
+
+
+#needles that overlap, start each other or sit inside each other, in both priority orders
+OVERLAPS = [
+    ([("a", ["bcd"], ""), ("b", ["abc"], "")], ["abcd", "xabcd", "abc", "bcd abc", "ab cd"]),
+    ([("a", ["abc"], ""), ("b", ["bcd"], "")], ["abcd", "bcd", "bcdabc"]),
+    ([("a", ["error"], ""), ("b", ["error: x"], "")], ["error: x", "an error: y"]),
+    ([("a", ["error: x"], ""), ("b", ["error"], "")], ["error: x", "error: y"]),
+    ([("a", ["video"], ""), ("b", ["private video"], ""), ("c", ["ate vi"], "")], ["private video", "privateavideo"]),
+    ([("a", ["ate vi"], ""), ("b", ["private video"], ""), ("c", ["video"], "")], ["private video", "a video"]),
+]
+
+
+#(line, expected rule, got) for every line where the matcher and the chain disagree
+def check(lines, rules):
+    mismatches = []
+    cases = [(rules, [line.strip().lower() for line in lines])] + OVERLAPS
+    for table, samples in cases:
+        matcher = build_matcher(table)
+        for lower in samples:
+            expected, got = legacy_rule(lower, table), match_rule(lower, matcher)
+            if expected != got:
+                mismatches.append((lower, expected, got))
+    return mismatches
+
+
+#random lowercase phrases, so the padding doesn't all share one prefix
+def padded_rules(extra):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    rng = random.Random(extra)
+    fake = []
+    for n in range(extra):
+        phrase = " ".join("".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(2))
+        fake.append((f"fake{n}", [phrase], "{prefix} fake"))
+    #fake rules go before the catch-all "error:" so they are really checked
+    return RULES[:-1] + fake + RULES[-1:]
+
+
+def time_per_line(lines, feed, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        feed(lines)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(lines) * 1e9
+
+
+def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--log", default=DEFAULT_LOG)
+    args.add_argument("--repeat", type=int, default=20)
+    args.add_argument("--extra-rules", type=int, default=0)
+    args = args.parse_args()
+
+    with open(args.log, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+
+    rules = padded_rules(args.extra_rules) if args.extra_rules else RULES
+
+    mismatches = check(lines, rules)
+    for lower, expected, got in mismatches[:10]:
+        print(f"mismatch: rule {got}, expected {expected}: {lower!r}")
+    if mismatches:
+        sys.exit(1)
+
+    #the lines that get past the markers and "[...]" chatter to the rule lookup
+    reaching = [line.strip().lower() for line in lines if line.strip() and not line.strip().startswith("[")]
+    matcher = build_matcher(rules)
+
+    def run_rules(lines):
+        for lower in lines:
+            match_rule(lower, matcher)
+
+    def run_chain(lines):
+        for lower in lines:
+            legacy_rule(lower, rules)
+
+    def run_classifier(lines):
+        parser = OutputParser(rules=rules)
+        for line in lines:
+            parser.feed(line)
+
+    def run_legacy(lines):
+        state = {}
+        for line in lines:
+            legacy_feed(line, state, rules)
+
+    events = {}
+    parser = OutputParser(rules=rules)
+    for line in lines:
+        event = parser.feed(line)
+        if event:
+            events[event.category] = events.get(event.category, 0) + 1
+
+    print(f"log: {len(lines)} lines, {len(rules)} rules, {len(reaching)} reach the rules, overlap check ok")
+    print(f"rules  classifier: {time_per_line(reaching, run_rules, args.repeat):8.0f} ns/line")
+    print(f"rules  legacy:     {time_per_line(reaching, run_chain, args.repeat):8.0f} ns/line")
+    print(f"feed   classifier: {time_per_line(lines, run_classifier, args.repeat):8.0f} ns/line  (full events)")
+    print(f"feed   legacy:     {time_per_line(lines, run_legacy, args.repeat):8.0f} ns/line  (no [done] parsing)")
+    print("events:", ", ".join(f"{k}={v}" for k, v in sorted(events.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import json
+import os
+import shutil
+import sys
+import time
+
+#stand-in for ffmpeg, for bench/run_bench.py - "encodes" by sleeping transcode_time (from CRATEPLUG_FAKE,
+#same config as fake_ytdlp.py) and copying the -i input to every output path (the argument after each -f MUXER,
+#or the last argument)
+
+
+def main(argv):
+    config = json.loads(os.getenv("CRATEPLUG_FAKE") or "{}")
+    if "-i" not in argv or len(argv) < 3:
+        print("fake ffmpeg: need -i INPUT ... OUTPUT", file=sys.stderr)
+        return 1
+
+    source = argv[argv.index("-i") + 1]
+    targets = [argv[n + 2] for n, arg in enumerate(argv[:-2]) if arg == "-f"] or [argv[-1]]
+    time.sleep(config.get("transcode_time", 0))
+    try:
+        for target in targets:
+            shutil.copyfile(source, target)
+    except OSError as e:
+        print(f"{source}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
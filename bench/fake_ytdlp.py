@@ -0,0 +1,243 @@
+import json
+import os
+import re
+import sys
+import time
+
+#stand-in for the yt-dlp executable, for bench/run_bench.py - no network, no real media.
+#understands the command lines crateplug builds (--flat-playlist listings, --print markers, -x / -f bestaudio,
+#--playlist-items, --download-archive, --load-info-json, infojson output) and answers with synthetic output:
+#noise lines, [entry]/[progress]/[transcoded]/[done] markers, 429s, private-video errors and hung downloads.
+#behaviour comes from the CRATEPLUG_FAKE environment variable (json, keys as in CONFIG below)
+#
+#playlist urls (anything with list=) have "entries" videos with ids bn000000001..., other urls are one video
+
+CONFIG = {
+    "entries": 50,           #videos in a playlist
+    "progress_lines": 8,     #[progress] lines per download
+    "extract_latency": 0.0,  #seconds of "extraction" per video (skipped with --load-info-json)
+    "download_time": 0.0,    #seconds per download, spread over the progress lines
+    "transcode_time": 0.0,   #seconds of "encoding" when -x has to re-encode
+    "line_delay": 0.0,       #extra seconds after every line (slow consoles, replay pacing)
+    "rate_limit_every": 0,   #every n-th video answers 429 on its first attempt
+    "private_every": 0,      #every n-th video is private
+    "stall_every": 0,        #every n-th video hangs half way through its download on its first attempt
+    "size": 4000000,         #reported bytes per download
+    "noise": True,           #the usual [youtube]/[info] chatter around the markers
+    "replay": None,          #print this recorded log instead (download runs only)
+    "state": None,           #folder for per-video state (which videos were already rate limited / stalled once)
+}
+
+VALUE_FLAGS = {
+    "--ffmpeg-location", "--audio-format", "--audio-quality", "-f", "--print", "--progress-template", "-o",
+    "--download-archive", "--playlist-items", "-I", "--retries", "--fragment-retries", "--sleep-interval",
+    "--max-sleep-interval", "--load-info-json", "-N", "--concurrent-fragments", "-r", "--limit-rate",
+}
+
+VIDEO_ID = re.compile(r"(?:v=|youtu\.be/|shorts/)([0-9A-Za-z_-]{11})")
+
+
+def parse_args(argv):
+    flags = {}
+    prints = []
+    outputs = {}
+    urls = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in VALUE_FLAGS:
+            value = argv[i + 1]
+            i += 2
+            if arg == "--print":
+                prints.append(value)
+            elif arg == "-o":
+                kind, sep, template = value.partition(":")
+                if sep and kind in ("infojson", "default"):
+                    outputs[kind] = template
+                else:
+                    outputs["default"] = value
+            else:
+                flags[arg] = value
+        elif arg.startswith("-"):
+            flags[arg] = True
+            i += 1
+        else:
+            urls.append(arg)
+            i += 1
+    return flags, prints, outputs, urls
+
+
+def emit(config, line):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+    if config["line_delay"]:
+        time.sleep(config["line_delay"])
+
+
+def video(index):
+    video_id = f"bn{index:09d}"
+    return {"index": index, "id": video_id, "title": f"bench track {index}", "duration": 180 + index % 120}
+
+
+def videos_for(url, config):
+    if "list=" in url:
+        return [video(n) for n in range(1, config["entries"] + 1)], True
+
+    found = VIDEO_ID.search(url)
+    video_id = found.group(1) if found else "bn000000001"
+    index = int(video_id[2:]) if video_id.startswith("bn") and video_id[2:].isdigit() else 1
+    entry = video(index)
+    entry["id"] = video_id
+    return [entry], False
+
+
+#"1-3,7" -> {1, 2, 3, 7}
+#"1-3,7,9:" -> {1, 2, 3, 7, 9, ..., count}
+def parse_items(text, count):
+    items = set()
+    for part in text.split(","):
+        start, colon, end = part.partition(":") if ":" in part else part.partition("-")
+        items.update(range(int(start), (int(end) if end else count if colon else int(start)) + 1))
+    return items
+
+
+def fill(template, entry, ext):
+    return (
+        template.replace("%(title)s", entry["title"])
+        .replace("%(ext)s", ext)
+        .replace("%(id)s", entry["id"])
+        .replace("%(extractor_key)s", "Youtube")
+        .replace("%%", "%")
+    )
+
+
+def first_attempt(config, video_id, kind="throttled"):
+    if not config["state"]:
+        return True
+    marker = os.path.join(config["state"], video_id + "." + kind)
+    if os.path.exists(marker):
+        return False
+    open(marker, "w").close()
+    return True
+
+
+#(extension, re-encoded?) of the finished file
+def output_type(flags):
+    if "-x" not in flags:
+        return "webm", False
+    audio_format = flags.get("--audio-format", "best")
+    if audio_format == "best":
+        return "opus", False
+    return "mp3", True
+
+
+def download(entry, count, playlist, flags, outputs, config):
+    index, video_id = entry["index"], entry["id"]
+    position = f"{index}/{count}" if playlist else "NA/NA"
+
+    if config["noise"]:
+        emit(config, f"[youtube] Extracting URL: https://www.youtube.com/watch?v={video_id}")
+        emit(config, f"[youtube] {video_id}: Downloading webpage")
+
+    if config["private_every"] and index % config["private_every"] == 0:
+        emit(config, f"ERROR: [youtube] {video_id}: Private video. Sign in if you've been granted access to this video")
+        return False
+
+    if config["rate_limit_every"] and index % config["rate_limit_every"] == 0 and first_attempt(config, video_id):
+        emit(config, f"ERROR: [youtube] {video_id}: Unable to download webpage: HTTP Error 429: Too Many Requests")
+        return False
+
+    if "--load-info-json" not in flags and config["extract_latency"]:
+        time.sleep(config["extract_latency"])
+
+    if config["noise"]:
+        emit(config, f"[info] {video_id}: Downloading 1 format(s): 251")
+    emit(config, f"[entry] {position} Youtube {video_id} {entry['title']}")
+
+    if "--write-info-json" in flags and "infojson" in outputs:
+        path = fill(outputs["infojson"], entry, "") + ".info.json"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"id": video_id, "title": entry["title"], "duration": entry["duration"], "extractor_key": "Youtube",
+                       "webpage_url": f"https://www.youtube.com/watch?v={video_id}"}, f)
+
+    steps = max(1, config["progress_lines"])
+    size = config["size"]
+    stall = config["stall_every"] and index % config["stall_every"] == 0 and first_attempt(config, video_id, "stalled")
+    for step in range(1, steps + 1):
+        if stall and step > steps // 2:
+            while True:
+                time.sleep(60) #for the watchdog to find
+        if config["download_time"]:
+            time.sleep(config["download_time"] / steps)
+        done = size * step // steps
+        eta = (steps - step) * config["download_time"] / steps
+        emit(config, f"[progress] {position} {video_id} {done} {size} NA {size * 4} {eta:.0f}")
+
+    ext, encoded = output_type(flags)
+    if encoded and config["transcode_time"]:
+        time.sleep(config["transcode_time"])
+
+    path = fill(outputs.get("default", "%(title)s.%(ext)s"), entry, ext)
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * 1024)
+
+    emit(config, f"[transcoded] {position} Youtube {video_id}")
+    emit(config, f"[done] {position} Youtube {video_id} {os.path.abspath(path)}")
+    return True
+
+
+def main(argv):
+    config = dict(CONFIG)
+    config.update(json.loads(os.getenv("CRATEPLUG_FAKE") or "{}"))
+    flags, prints, outputs, urls = parse_args(argv)
+
+    if "--load-info-json" in flags:
+        with open(flags["--load-info-json"], encoding="utf-8") as f:
+            urls = [json.load(f)["webpage_url"]]
+
+    if not urls:
+        emit(config, "ERROR: You must provide at least one URL.")
+        return 2
+
+    entries, playlist = videos_for(urls[0], config)
+    playlist = playlist and "--no-playlist" not in flags
+
+    if "--flat-playlist" in flags:
+        for entry in entries:
+            emit(config, f"Youtube\t{entry['id']}\thttps://www.youtube.com/watch?v={entry['id']}\t{entry['duration']}\t{entry['title']}")
+        return 0
+
+    if config["replay"]:
+        with open(config["replay"], encoding="utf-8", errors="replace") as f:
+            for line in f:
+                emit(config, line.rstrip("\n"))
+        return 0
+
+    if not playlist:
+        entries = entries[:1]
+
+    if "--playlist-items" in flags or "-I" in flags:
+        wanted = parse_items(flags.get("--playlist-items") or flags["-I"], len(entries))
+        entries = [entry for entry in entries if entry["index"] in wanted]
+
+    archived = set()
+    if "--download-archive" in flags and os.path.exists(flags["--download-archive"]):
+        with open(flags["--download-archive"], encoding="utf-8") as f:
+            archived = {line.split()[-1] for line in f if line.strip()}
+
+    failed = False
+    for entry in entries:
+        if entry["id"] in archived:
+            emit(config, f"[download] {entry['id']}: has already been recorded in the archive")
+            continue
+        failed |= not download(entry, config["entries"] if playlist else 1, playlist, flags, outputs, config)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
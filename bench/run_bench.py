@@ -0,0 +1,308 @@
+import argparse
+import json
+import os
+import platform
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+#end-to-end benchmark - runs the real download paths (dlsingle, dlplaylist, dlconcurrent, dl_large_playlist)
+#against bench/fake_ytdlp.py and bench/fake_ffmpeg.py instead of the real executables. no network, linux is fine.
+#  python bench/run_bench.py                                   every scenario, default load
+#  python bench/run_bench.py --scenario large --entries 500 --rate-limit-every 40 --scale 0.01
+#  python bench/run_bench.py --baseline bench/results/old.json compare against an earlier run
+#reports entries/s, per-line parse cost, signal throughput (status + event callbacks per second - each one is a
+#qt signal in the gui) and peak rss per scenario, and saves everything as json (bench/results/ by default).
+#every scenario runs in its own python process with its own data folder, since the archive, metadata cache
+#and journal are process-wide singletons
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.join(ROOT, "bench")
+sys.path.insert(0, ROOT)
+
+DEFAULT_LOG = os.path.join(BENCH, "logs", "large_playlist.log")
+RESULTS = os.path.join(BENCH, "results")
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLcrateplugbench"
+SINGLE_MAX = 25
+
+
+def video_url(index):
+    return f"https://www.youtube.com/watch?v=bn{index:09d}"
+
+
+def run_single(config, output_dir, status_callback, event_callback):
+    from dlsingle import download_video
+    for index in range(1, min(config["entries"], SINGLE_MAX) + 1):
+        download_video(video_url(index), output_dir, status_callback, event_callback, config["format"])
+
+
+def run_playlist(config, output_dir, status_callback, event_callback):
+    from dlplaylist import download_playlist
+    download_playlist(PLAYLIST_URL, output_dir, status_callback, event_callback, config["format"])
+
+
+def run_concurrent(config, output_dir, status_callback, event_callback):
+    from dlconcurrent import download_playlist
+    download_playlist(PLAYLIST_URL, output_dir, status_callback, config["workers"], event_callback, config["format"])
+
+
+def run_large(config, output_dir, status_callback, event_callback):
+    from dl_large_playlist import download_playlist
+    download_playlist(PLAYLIST_URL, output_dir, status_callback, event_callback, "adaptive", config["format"])
+
+
+def run_large_conservative(config, output_dir, status_callback, event_callback):
+    from dl_large_playlist import download_playlist
+    download_playlist(PLAYLIST_URL, output_dir, status_callback, event_callback, "conservative", config["format"])
+
+
+#(runner, extra fake config)
+SCENARIOS = {
+    "single": (run_single, {}),
+    "playlist": (run_playlist, {}),
+    "concurrent": (run_concurrent, {}),
+    "large": (run_large, {}),
+    "large_conservative": (run_large_conservative, {}),
+    #the recorded log replayed through the playlist path - parse cost on real yt-dlp output
+    "replay": (run_playlist, {"replay": DEFAULT_LOG}),
+}
+
+
+class Recorder:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statuses = 0
+        self.events = {}
+        self.parse_ns = 0
+        self.lines = 0
+
+    def status(self, text):
+        with self.lock:
+            self.statuses += 1
+
+    def event(self, event):
+        with self.lock:
+            self.events[event.category] = self.events.get(event.category, 0) + 1
+
+    #wrap OutputParser.feed so every line any module parses is timed (cpu time of the parsing thread,
+    #so waiting on the pipe or other threads holding the gil does not count)
+    def patch_parser(self):
+        from classifier import OutputParser
+
+        feed = OutputParser.feed
+        recorder = self
+
+        def timed_feed(parser, line):
+            start = time.thread_time_ns()
+            event = feed(parser, line)
+            elapsed = time.thread_time_ns() - start
+            with recorder.lock:
+                recorder.parse_ns += elapsed
+                recorder.lines += 1
+            return event
+
+        OutputParser.feed = timed_feed
+
+
+#the pacers sleep for real (15s back-offs, 5-10s between downloads) - shrink that by scale
+def patch_pacers(scale):
+    import dl_large_playlist
+    from pacing import make_pacer
+
+    def scaled_sleep(seconds):
+        time.sleep(seconds * scale)
+
+    dl_large_playlist.make_pacer = lambda profile="adaptive", sleep=scaled_sleep: make_pacer(profile, sleep)
+
+
+def peak_rss_mb():
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+#child process: one scenario, prints its result as json on the last line
+def run_child(name, config, scale, output_dir):
+    recorder = Recorder()
+    recorder.patch_parser()
+    patch_pacers(scale)
+
+    runner = SCENARIOS[name][0]
+    start = time.perf_counter()
+    runner(config, output_dir, recorder.status, recorder.event)
+    elapsed = time.perf_counter() - start
+
+    done = recorder.events.get("done", 0)
+    signals = recorder.statuses + sum(recorder.events.values())
+    result = {
+        "seconds": round(elapsed, 3),
+        "entries_done": done,
+        "entries_per_sec": round(done / elapsed, 2) if elapsed else 0,
+        "lines": recorder.lines,
+        "parse_ns_per_line": round(recorder.parse_ns / recorder.lines) if recorder.lines else 0,
+        "signals": signals,
+        "signals_per_sec": round(signals / elapsed, 1) if elapsed else 0,
+        "events": recorder.events,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(json.dumps(result), flush=True)
+
+
+#executable wrappers named like the real binaries, so binaries.binary() can point at them
+def write_wrappers(folder):
+    paths = {}
+    for name, script in (("yt-dlp", "fake_ytdlp.py"), ("ffmpeg", "fake_ffmpeg.py")):
+        path = os.path.join(folder, name)
+        with open(path, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCH, script)}" "$@"\n')
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+        paths[name] = path
+    return paths
+
+
+def run_scenario(name, config, scale):
+    fake = dict(config, **SCENARIOS[name][1])
+    with tempfile.TemporaryDirectory(prefix=f"crateplug-bench-{name}-") as tmp:
+        folders = {}
+        for folder in ("bin", "data", "out", "state"):
+            folders[folder] = os.path.join(tmp, folder)
+            os.makedirs(folders[folder])
+        binaries = write_wrappers(folders["bin"])
+        fake["state"] = folders["state"]
+
+        env = dict(
+            os.environ,
+            CRATEPLUG_YTDLP=binaries["yt-dlp"],
+            CRATEPLUG_FFMPEG=binaries["ffmpeg"],
+            CRATEPLUG_FAKE=json.dumps(fake),
+            XDG_DATA_HOME=folders["data"],
+        )
+        command = [
+            sys.executable, os.path.abspath(__file__), "--child", name,
+            "--config", json.dumps(config), "--scale", str(scale), "--output-dir", folders["out"],
+        ]
+        result = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True)
+
+    if result.returncode != 0:
+        return {"error": (result.stderr or result.stdout).strip().splitlines()[-1:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def read_version():
+    try:
+        with open(os.path.join(ROOT, "version.txt"), encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def print_table(scenarios, baseline=None):
+    print(f"{'scenario':<20}{'entries/s':>11}{'ns/line':>10}{'signals/s':>11}{'rss MB':>9}{'seconds':>9}")
+    for name, result in scenarios.items():
+        if "error" in result:
+            print(f"{name:<20} failed: {' '.join(result['error'])}")
+            continue
+        print(
+            f"{name:<20}{result['entries_per_sec']:>11.2f}{result['parse_ns_per_line']:>10}"
+            f"{result['signals_per_sec']:>11.1f}{result['peak_rss_mb']:>9.1f}{result['seconds']:>9.2f}"
+        )
+        old = (baseline or {}).get(name)
+        if old and "error" not in old:
+            print(
+                f"{'  vs baseline':<20}{change(old['entries_per_sec'], result['entries_per_sec']):>11}"
+                f"{change(old['parse_ns_per_line'], result['parse_ns_per_line']):>10}"
+                f"{change(old['signals_per_sec'], result['signals_per_sec']):>11}"
+                f"{change(old['peak_rss_mb'], result['peak_rss_mb']):>9}{change(old['seconds'], result['seconds']):>9}"
+            )
+
+
+def change(old, new):
+    if not old:
+        return "-"
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="run only these (repeatable)")
+    args.add_argument("--entries", type=int, default=60, help="videos in the fake playlist")
+    args.add_argument("--progress-lines", type=int, default=10)
+    args.add_argument("--latency", type=float, default=0.02, help="fake extraction seconds per video")
+    args.add_argument("--download-time", type=float, default=0.05, help="fake download seconds per video")
+    args.add_argument("--transcode-time", type=float, default=0.03, help="fake encoding seconds per video")
+    args.add_argument("--line-delay", type=float, default=0.0)
+    args.add_argument("--rate-limit-every", type=int, default=0, help="every n-th video gets one 429")
+    args.add_argument("--private-every", type=int, default=0, help="every n-th video is private")
+    args.add_argument("--format", default="mp3")
+    args.add_argument("--workers", type=int, default=4, help="workers for the concurrent scenario")
+    args.add_argument("--scale", type=float, default=0.01, help="pacer sleep multiplier")
+    args.add_argument("--out", help="result file (default bench/results/<version>-<time>.json)")
+    args.add_argument("--baseline", help="earlier result file to compare against")
+    #internal - the per-scenario child process
+    args.add_argument("--child", help=argparse.SUPPRESS)
+    args.add_argument("--config", help=argparse.SUPPRESS)
+    args.add_argument("--output-dir", help=argparse.SUPPRESS)
+    args = args.parse_args()
+
+    if args.child:
+        run_child(args.child, json.loads(args.config), args.scale, args.output_dir)
+        return
+
+    config = {
+        "entries": args.entries,
+        "progress_lines": args.progress_lines,
+        "extract_latency": args.latency,
+        "download_time": args.download_time,
+        "transcode_time": args.transcode_time,
+        "line_delay": args.line_delay,
+        "rate_limit_every": args.rate_limit_every,
+        "private_every": args.private_every,
+        "format": args.format,
+        "workers": args.workers,
+    }
+
+    scenarios = {}
+    for name in args.scenario or SCENARIOS:
+        print(f"running {name}...", flush=True)
+        scenarios[name] = run_scenario(name, config, args.scale)
+
+    version = read_version()
+    report = {
+        "version": version,
+        "revision": git_revision(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": dict(config, scale=args.scale),
+        "scenarios": scenarios,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["scenarios"]
+    print_table(scenarios, baseline)
+
+    path = args.out
+    if not path:
+        os.makedirs(RESULTS, exist_ok=True)
+        tag = (version or "dev").replace(" ", "-")
+        path = os.path.join(RESULTS, f"{tag}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    main()
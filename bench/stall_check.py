@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+#checks that a playlist entry which hangs on every try doesn't take the rest of the playlist down with it -
+#the watchdog gives up on it after its retries, reports it failed and the run goes on without it.
+#  python bench/stall_check.py                       both playlist modes, 8 entries, every 3rd one hangs
+#  python bench/stall_check.py --entries 20 --stall-every 4
+#runs the real download paths against bench/fake_ytdlp.py (without a state folder, so a hung entry hangs again
+#every time) with the watchdog limits cut to a second. exits 1 if an entry that doesn't hang was not downloaded,
+#or a hanging one was not reported failed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from run_bench import PLAYLIST_URL, patch_pacers, write_wrappers
+
+MODES = ("playlist", "large_conservative")
+
+
+#child process: one mode, prints the indices that came back done / failed as json on the last line
+def run_child(mode, output_dir):
+    import supervisor
+
+    supervisor.STALL_LIMIT = 1
+    supervisor.CHECK_INTERVAL = 0.1
+    patch_pacers(0)
+
+    done, failed = set(), set()
+
+    def on_event(event):
+        if event.category == "done":
+            done.add(event.index)
+        elif event.category == "stalled":
+            failed.add(event.index)
+
+    if mode == "playlist":
+        from dlplaylist import download_playlist
+        download_playlist(PLAYLIST_URL, output_dir, lambda text: None, on_event)
+    else:
+        from dl_large_playlist import download_playlist
+        download_playlist(PLAYLIST_URL, output_dir, lambda text: None, on_event, "conservative")
+
+    print(json.dumps({"done": sorted(done), "stalled": sorted(failed)}), flush=True)
+
+
+def check(mode, entries, stall_every):
+    with tempfile.TemporaryDirectory(prefix=f"crateplug-stall-{mode}-") as tmp:
+        folders = {}
+        for folder in ("bin", "data", "out"):
+            folders[folder] = os.path.join(tmp, folder)
+            os.makedirs(folders[folder])
+        binaries = write_wrappers(folders["bin"])
+
+        env = dict(
+            os.environ,
+            CRATEPLUG_YTDLP=binaries["yt-dlp"],
+            CRATEPLUG_FFMPEG=binaries["ffmpeg"],
+            CRATEPLUG_FAKE=json.dumps({"entries": entries, "stall_every": stall_every, "noise": False}),
+            XDG_DATA_HOME=folders["data"],
+        )
+        command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--output-dir", folders["out"]]
+        result = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True, timeout=300)
+        if result.returncode != 0:
+            print(f"{mode}: failed to run - {(result.stderr or result.stdout).strip()}")
+            return False
+        got = json.loads(result.stdout.strip().splitlines()[-1])
+
+        files = 0
+        for _, dirs, names in os.walk(folders["out"]):
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            files += sum(not name.endswith(".json") for name in names)
+
+    hangs = set(range(stall_every, entries + 1, stall_every))
+    expected = sorted(set(range(1, entries + 1)) - hangs)
+    ok = got["done"] == expected and files == len(expected) and hangs <= set(got["stalled"])
+    print(f"{mode}: done {got['done']}, stalled {got['stalled']}, {files} files - {'ok' if ok else f'expected {expected} done'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=8)
+    parser.add_argument("--stall-every", type=int, default=3)
+    parser.add_argument("--mode", choices=MODES, action="append")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.output_dir)
+        return 0
+
+    results = [check(mode, args.entries, args.stall_every) for mode in args.mode or MODES]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
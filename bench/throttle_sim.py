@@ -0,0 +1,125 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+#runs the large-playlist pacers against a local fake server that throttles on a schedule.
+#  python bench/throttle_sim.py --items 200 --schedule "5:inf,10:2,10:inf" --scale 0.05
+#schedule = comma separated phases "seconds:allowed requests per second" (inf = never throttles);
+#the server answers 429 once a phase's per-second budget is used up. --scale shrinks the pacer
+#delays (15s back-off, 5-10s fixed sleeps...) so a run takes seconds instead of hours
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pacing import AdaptivePacer, FixedPacer, run_paced  # noqa: E402
+
+
+def parse_schedule(text):
+    phases = []
+    for part in text.split(","):
+        seconds, rate = part.split(":")
+        phases.append((float(seconds), float(rate)))
+    return phases
+
+
+class ThrottlingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, schedule, latency):
+        super().__init__(("127.0.0.1", 0), ThrottleHandler)
+        self.schedule = schedule
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.window = None
+        self.window_count = 0
+        self.throttled = 0
+        self.served = 0
+
+    #allowed requests per second right now (the last phase repeats forever)
+    def current_rate(self):
+        elapsed = time.monotonic() - self.started
+        for seconds, rate in self.schedule:
+            if elapsed < seconds:
+                return rate
+            elapsed -= seconds
+        return self.schedule[-1][1]
+
+    def allow(self):
+        with self.lock:
+            second = int(time.monotonic())
+            if second != self.window:
+                self.window, self.window_count = second, 0
+            self.window_count += 1
+
+            if self.window_count > self.current_rate():
+                self.throttled += 1
+                return False
+            self.served += 1
+            return True
+
+
+class ThrottleHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if self.server.allow():
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b"ok")
+        else:
+            self.send_response(429)
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def simulate(name, pacer, args):
+    server = ThrottlingServer(parse_schedule(args.schedule), args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/item/"
+
+    def download(entry):
+        try:
+            with urlopen(base + str(entry["index"]), timeout=10):
+                return "done"
+        except HTTPError as e:
+            return "rate_limited" if e.code == 429 else "error"
+
+    entries = [{"index": n} for n in range(1, args.items + 1)]
+    start = time.monotonic()
+    run_paced(entries, download, pacer)
+    wall = time.monotonic() - start
+    server.shutdown()
+
+    print(
+        f"{name:13} {args.items} items  served={server.served}  429s={server.throttled}  "
+        f"wall={wall:6.2f}s  slept={pacer.slept:6.2f}s  items/s={server.served / wall:6.1f}"
+    )
+    if not server.throttled:
+        print(f"{'':13} never throttled - back-off and recovery weren't exercised (more --items or --latency)")
+
+
+def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--items", type=int, default=200)
+    #starts throttled, so even a fast run hits a 429 straight away - then it has to recover, and gets cut back
+    #once more half way
+    args.add_argument("--schedule", default="3:2,3:inf,6:2,30:inf")
+    args.add_argument("--latency", type=float, default=0.01, help="server seconds per request")
+    args.add_argument("--scale", type=float, default=0.05, help="multiplier for every pacer delay")
+    args = args.parse_args()
+
+    s = args.scale
+    simulate("adaptive", AdaptivePacer(throttle_delay=15 * s, max_delay=300 * s, recovery_step=1 * s), args)
+    simulate("conservative", FixedPacer(5 * s, 10 * s), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import os
+import shutil
+import sys
+
+#where the yt-dlp / ffmpeg executables come from, on every platform:
+#  1. CRATEPLUG_YTDLP / CRATEPLUG_FFMPEG (full path) if set
+#  2. the copy bundled next to the app (yt-dlp.exe / ffmpeg.exe in the windows build)
+#  3. whatever is on PATH (linux servers, dev setups)
+
+ENV_OVERRIDES = {
+    "yt-dlp": "CRATEPLUG_YTDLP",
+    "ffmpeg": "CRATEPLUG_FFMPEG",
+}
+
+#keyword args for every subprocess.Popen/run - no console window popping up on windows
+POPEN_FLAGS = {"creationflags": 0x08000000} if sys.platform == "win32" else {}
+
+
+#file paths for packaged binaries
+def resource_path(relative):
+    if hasattr(sys, "_MEIPASS"):
+        return os.path.join(sys._MEIPASS, relative)
+    return os.path.join(os.path.abspath("."), relative)
+
+
+def binary(name):
+    override = os.getenv(ENV_OVERRIDES.get(name, ""))
+    if override:
+        return override
+
+    bundled = resource_path(name + ".exe" if sys.platform == "win32" else name)
+    if os.path.isfile(bundled):
+        return bundled
+
+    return shutil.which(name) or bundled
@@ -1,7 +1,9 @@
+const SERVER = "http://127.0.0.1:48721";
+
 chrome.action.onClicked.addListener(async (tab) => {
   if (!tab.url) return;
 
-  fetch("http://127.0.0.1:48721/download", {
+  fetch(`${SERVER}/download`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ url: tab.url })
@@ -9,3 +11,30 @@ chrome.action.onClicked.addListener(async (tab) => {
     // GUI not running — silently fail
   });
 });
+
+// right click on the toolbar icon -> queue every youtube tab in this window with one request
+chrome.runtime.onInstalled.addListener(() => {
+  chrome.contextMenus.create({
+    id: "send-all-tabs",
+    title: "send all tabs in window",
+    contexts: ["action"]
+  });
+});
+
+chrome.contextMenus.onClicked.addListener(async (info) => {
+  if (info.menuItemId !== "send-all-tabs") return;
+
+  const tabs = await chrome.tabs.query({ currentWindow: true });
+  const urls = tabs
+    .map((tab) => tab.url)
+    .filter((url) => url && (url.includes("youtube.com") || url.includes("youtu.be")));
+  if (urls.length === 0) return;
+
+  fetch(`${SERVER}/batch`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ urls })
+  }).catch(() => {
+    // GUI not running — silently fail
+  });
+});
@@ -0,0 +1,271 @@
+import os
+import re
+from collections import namedtuple
+
+#one shared table for reading yt-dlp output - used by every download mode (subprocess and in-process)
+#all the patterns are compiled into a single regex, so a line is scanned once no matter how many rules there are
+
+#category = short name from RULES (or "entry"/"progress"/"done"), video_id = id when the line has one,
+#message = what the gui shows (None for events that only move progress bars), data = Progress for "progress",
+#title = video title when the line carries one ("entry" events), extractor = yt-dlp extractor key ("done" events)
+Event = namedtuple("Event", "category video_id message index count path data title extractor", defaults=(None,) * 7)
+
+#bytes and seconds, None when yt-dlp doesn't know yet
+Progress = namedtuple("Progress", "downloaded total speed eta")
+
+
+#(category, substrings to look for in the lowercased line, status message) - first rule wins when several match
+RULES = [
+    ("archived", ["already been recorded in the archive"], "{prefix} skipped (already downloaded)"),
+    ("private", ["private video"], "{prefix} download failed: private video"),
+    ("age_restricted", ["age-restricted", "confirm your age"], "{prefix} download failed: age restricted"),
+    ("members_only", ["members-only", "join this channel"], "{prefix} download failed: members-only video"),
+    ("geo_blocked", ["not available in your country", "geo-restricted"], "{prefix} download failed: geo-blocked - try a new ip address :)"),
+    ("login_required", ["requires login", "cookies"], "{prefix} download failed: login required"),
+    ("live_stream", ["live stream", "will begin shortly"], "{prefix} download failed: live stream"),
+    ("unavailable", ["video unavailable", "has been removed"], "{prefix} download failed: video unavailable"),
+    ("rate_limited", ["429", "rate limit"], "{prefix} session rate limited - try a new ip address :)"),
+    ("network", ["timed out", "connection reset"], "{prefix} download failed: network error"),
+    ("stalled", ["download stalled"], "{prefix} download stalled - yt-dlp stopped"),
+    ("unsupported_url", ["unsupported url"], "invalid URL: unsupported or malformed link"),
+    ("no_formats", ["no video formats found"], "invalid URL: no downloadable video"),
+    ("not_found", ["does not exist"], "invalid URL: video or playlist does not exist"),
+    ("extract_failed", ["unable to extract"], "invalid URL: could not extract video data"),
+    ("empty_playlist", ["no entries found"], "invalid URL: empty or invalid playlist"),
+    ("error", ["error:"], "{prefix} download failed: unidentified error"),
+]
+
+#categories that mean the entry did not download
+FAILURES = {category for category, _, _ in RULES} - {"archived"}
+
+
+#every download mode passes these, so the parser gets index, id, bytes and path from a few fixed line shapes:
+#"[entry]" when a video starts, "[progress]" while it downloads, "[transcoded]" after ffmpeg,
+#"[done]" once the file is in place
+ENTRY_MARKER = "[entry]"
+PROGRESS_MARKER = "[progress]"
+TRANSCODED_MARKER = "[transcoded]"
+DONE_MARKER = "[done]"
+ENTRY_TEMPLATE = ENTRY_MARKER + " %(playlist_index)s/%(playlist_count)s %(extractor_key)s %(id)s %(title)s"
+PROGRESS_TEMPLATE = (
+    PROGRESS_MARKER + " %(info.playlist_index)s/%(info.playlist_count)s %(info.id)s "
+    "%(progress.downloaded_bytes)s %(progress.total_bytes)s %(progress.total_bytes_estimate)s "
+    "%(progress.speed)s %(progress.eta)s"
+)
+TRANSCODED_TEMPLATE = TRANSCODED_MARKER + " %(playlist_index)s/%(playlist_count)s %(extractor_key)s %(id)s"
+DONE_TEMPLATE = DONE_MARKER + " %(playlist_index)s/%(playlist_count)s %(extractor_key)s %(id)s %(filepath)s"
+PRINT_ARGS = [
+    "--print", "video:" + ENTRY_TEMPLATE,
+    "--print", "post_process:" + TRANSCODED_TEMPLATE,
+    "--print", "after_move:" + DONE_TEMPLATE,
+    #--print makes yt-dlp quiet, these bring the progress back one line per update
+    "--progress",
+    "--newline",
+    "--progress-template", "download:" + PROGRESS_TEMPLATE,
+]
+
+#"ERROR: [youtube] dQw4w9WgXcQ: Private video..." -> dQw4w9WgXcQ
+VIDEO_ID = re.compile(r"^(?:error|warning):\s*\[[^\]]+\]\s+([^\s:]+):", re.IGNORECASE)
+
+
+#the needles are folded into a trie before compiling, so the regex engine only follows the branch for the
+#character it is looking at - a flat "a|b|c|..." alternation would retry every needle at every position
+def trie_pattern(trie):
+    branches = [re.escape(ch) + trie_pattern(sub) for ch, sub in sorted(trie.items()) if ch]
+    if not branches:
+        return ""
+
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in trie:
+        pattern = "(?:" + pattern + ")?" #a shorter needle ends here
+    return pattern
+
+
+#returns (regex finding the first needle, regex finding every needle - overlapping ones too, {needle: rule number})
+def build_matcher(rules):
+    trie = {}
+    needles = {}
+    for n, (_, rule_needles, _) in enumerate(rules):
+        for needle in rule_needles:
+            needles.setdefault(needle, n)
+            node = trie
+            for ch in needle:
+                node = node.setdefault(ch, {})
+            node[""] = {}
+
+    #at any one position the trie reports the longest needle only - a shorter one it starts with may belong
+    #to a higher priority rule, so every needle carries the best rule of itself and its prefixes
+    priority = {}
+    for needle, n in needles.items():
+        node = trie
+        for length, ch in enumerate(needle, 1):
+            node = node[ch]
+            if "" in node:
+                n = min(n, needles[needle[:length]])
+        priority[needle] = n
+
+    pattern = trie_pattern(trie)
+    return re.compile(pattern), re.compile("(?=(" + pattern + "))"), priority
+
+
+MATCHER = build_matcher(RULES)
+
+
+#returns the number of the highest priority rule found in the line, or None.
+#most lines have no needle at all, which one plain search settles - only a line with a hit is scanned again
+#at every position (a lookahead doesn't consume, so a needle overlapping an earlier match is still seen)
+def match_rule(lower, matcher=MATCHER):
+    first, overlapping, priority = matcher
+    found = first.search(lower)
+    if found is None:
+        return None
+
+    best = None
+    for match in overlapping.finditer(lower, found.start()):
+        n = priority[match.group(1)]
+        if best is None or n < best:
+            best = n
+            if n == 0:
+                break
+    return best
+
+
+def number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None #"NA"
+
+
+#"mp3" / "opus" / "m4a"... for the downloaded message
+def file_type(path):
+    extension = os.path.splitext(path or "")[1][1:].lower()
+    return extension or "mp3"
+
+
+def format_prefix(index, count):
+    if index is None:
+        return ""
+    return f"[{index}/{count}]"
+
+
+#one parser per yt-dlp process - remembers the playlist position so failures get the right [i/n] prefix.
+#per-entry downloads (where yt-dlp only sees a single video) pass their position in up front
+class OutputParser:
+
+    def __init__(self, index=None, count=None, rules=RULES):
+        self.rules = rules
+        self.matcher = MATCHER if rules is RULES else build_matcher(rules)
+        self.index = index
+        self.count = count
+        #"[marker]" -> its parser - one lookup for every "[...]" line, most of which are yt-dlp's own chatter
+        self.markers = {
+            PROGRESS_MARKER: self.parse_progress,
+            ENTRY_MARKER: self.parse_entry,
+            DONE_MARKER: self.parse_done,
+            TRANSCODED_MARKER: self.parse_transcoded,
+        }
+
+    def prefix(self):
+        return format_prefix(self.index, self.count)
+
+    def feed(self, line):
+        line = line.strip()
+        if not line:
+            return None
+
+        #other "[extractor] ..." lines are yt-dlp's own progress chatter
+        if line[0] == "[":
+            parse = self.markers.get(line[:line.find("]") + 1])
+            return parse(line) if parse else None
+
+        return self.classify(line)
+
+    #"3/50" -> remembered as the current position (NA/NA for single videos keeps whatever was passed in)
+    def set_position(self, position):
+        index, _, count = position.partition("/")
+        if index.isdigit():
+            self.index = int(index)
+            self.count = int(count) if count.isdigit() else None
+
+    def parse_entry(self, line):
+        parts = line[len(ENTRY_MARKER):].strip().split(" ", 3)
+        if len(parts) < 3:
+            return None
+
+        self.set_position(parts[0])
+        return self.started(parts[2], parts[3] if len(parts) > 3 else None, parts[1])
+
+    def parse_progress(self, line):
+        parts = line[len(PROGRESS_MARKER):].split()
+        if len(parts) < 7:
+            return None
+
+        position, video_id, downloaded, total, estimate, speed, eta = parts[:7]
+        self.set_position(position)
+
+        return Event(
+            "progress",
+            video_id,
+            None,
+            self.index,
+            self.count,
+            None,
+            Progress(number(downloaded), number(total) or number(estimate), number(speed), number(eta)),
+        )
+
+    def parse_transcoded(self, line):
+        parts = line[len(TRANSCODED_MARKER):].split()
+        if len(parts) < 3:
+            return None
+
+        self.set_position(parts[0])
+        return self.transcoded(parts[2])
+
+    def parse_done(self, line):
+        parts = line[len(DONE_MARKER):].strip().split(" ", 3)
+        if len(parts) < 4:
+            return None
+
+        position, extractor, video_id, path = parts
+        self.set_position(position)
+
+        return self.downloaded(video_id, path, extractor)
+
+    def started(self, video_id, title=None, extractor=None):
+        return Event("entry", video_id, None, self.index, self.count, title=title, extractor=extractor)
+
+    def transcoded(self, video_id):
+        return Event("transcoded", video_id, None, self.index, self.count)
+
+    def progress(self, video_id, downloaded, total, speed, eta):
+        return Event("progress", video_id, None, self.index, self.count, None, Progress(downloaded, total, speed, eta))
+
+    def downloaded(self, video_id, path, extractor=None):
+        return Event(
+            "done", video_id, f"{self.prefix()} {file_type(path)} downloaded".strip(), self.index, self.count, path, extractor=extractor
+        )
+
+    def classify(self, line):
+        n = match_rule(line.lower(), self.matcher)
+        if n is None:
+            return None
+
+        found = VIDEO_ID.match(line)
+        return self.rule_event(n, found.group(1) if found else None)
+
+    def rule_event(self, n, video_id=None):
+        category, _, message = self.rules[n]
+        return Event(category, video_id, message.format(prefix=self.prefix()).strip(), self.index, self.count)
+
+    #for entries the engine skips itself before yt-dlp runs
+    def skipped(self, video_id):
+        return self.rule_event(0, video_id)
+
+
+#hand an event to the caller - status text for the label, the whole event for anything tracking progress
+def dispatch(event, status_callback, event_callback=None):
+    if event_callback:
+        event_callback(event)
+    if event.message:
+        status_callback(event.message)
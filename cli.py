@@ -0,0 +1,170 @@
+import argparse
+import os
+import sys
+
+#headless crateplug - same engine, queue and local api as the gui, no qt.
+#  python cli.py download URL [URL...] -o DIR [--mode playlist] [--format native]   run now, print progress, exit
+#      [--profile flac ...]                                                       more files per track, one download
+#  python cli.py serve -o DIR [--port 48721]                                      daemon: api server + queue worker
+#  python cli.py jobs [--limit 20]                                                what's in the queue
+#  python cli.py pause|resume|cancel JOB_ID [--port 48721]                        through the running app/daemon
+#everything heavier than argparse is imported inside the command that needs it, so startup stays instant
+
+
+def add_job_options(parser):
+    parser.add_argument("-o", "--output", default=os.getcwd(), help="download folder (default: current folder)")
+    parser.add_argument("--mode", choices=["single", "playlist", "large_playlist"], default="single")
+    parser.add_argument("--format", default="mp3", help="mp3, native, smart or a profile name (see formats.py)")
+    parser.add_argument("--profile", action="append", help="write this profile too, from the same download (repeatable)")
+    parser.add_argument("--analyze", action="store_true", help="tag bpm, key and loudness into every file and save a waveform overview next to it (needs numpy)")
+    parser.add_argument("--pacing", default="adaptive", help="large playlist pacing: adaptive or conservative")
+    parser.add_argument("--workers", type=int, default=1, help="parallel downloads in playlist mode")
+    parser.add_argument("--backend", choices=["api", "subprocess"], default="api", help="in-process yt_dlp or the yt-dlp executable")
+    parser.add_argument("--connections", type=int, help="connections shared by all downloads (default 16)")
+    parser.add_argument("--limit-rate", help="bandwidth shared by all downloads, e.g. 2M (bytes/s, default unlimited)")
+
+
+def make_runner(args, **kwargs):
+    from runner import Runner
+    from bandwidth import get_budget, parse_rate
+    from formats import load_profiles
+
+    output = os.path.abspath(args.output)
+    if not os.path.isdir(output) or not os.access(output, os.W_OK):
+        sys.exit(f"download folder not writable: {output}")
+
+    try:
+        rate = parse_rate(args.limit_rate) if args.limit_rate else None
+    except ValueError:
+        sys.exit(f"bad --limit-rate: {args.limit_rate}")
+    get_budget().configure(args.connections, rate)
+
+    unknown = [name for name in [args.format, *(args.profile or [])] if name not in load_profiles()]
+    if unknown:
+        sys.exit(f"unknown format/profile: {', '.join(unknown)}")
+
+    defaults = {
+        "output_dir": output,
+        "mode": args.mode,
+        "workers": args.workers,
+        "options": {"format": args.format, "pacing": args.pacing},
+    }
+    if args.profile:
+        defaults["options"]["profiles"] = [args.format, *args.profile]
+    if args.analyze:
+        defaults["options"]["analyze"] = True
+    return Runner(backend=args.backend, defaults=defaults, **kwargs)
+
+
+def print_status(text):
+    print(text, flush=True)
+
+
+def cmd_download(args):
+    from dlqueue import DONE
+
+    runner = make_runner(args, status_callback=print_status)
+    #claimed straight away - a gui or daemon on the same queue file can't take them first
+    ids = runner.submit(args.urls, claimed=True)
+    for url, job_id in zip(args.urls, ids):
+        if job_id is None:
+            print(f"invalid url: {url}", file=sys.stderr)
+
+    outcomes = runner.run_now([job_id for job_id in ids if job_id is not None])
+    urls = dict(zip(ids, args.urls))
+    for job_id, status in outcomes.items():
+        if status != DONE:
+            print(f"job {job_id} {status}: {urls[job_id]}", file=sys.stderr)
+    return 1 if None in ids or any(status != DONE for status in outcomes.values()) else 0
+
+
+def cmd_serve(args):
+    from server import EventHub, start_server
+
+    hub = EventHub()
+    runner = make_runner(args, hub=hub, status_callback=print_status if args.verbose else None)
+    server = start_server(runner.submit, runner.queue, hub, runner.progress, args.port, runner.control_job)
+    if server is None:
+        sys.exit(f"port {args.port} is in use (is the gui or another daemon running?)")
+
+    runner.start()
+    print(f"crateplug listening on 127.0.0.1:{args.port}, downloading to {runner.defaults['output_dir']}", flush=True)
+    try:
+        runner.thread.join()
+    except KeyboardInterrupt:
+        runner.stop()
+        server.shutdown()
+    return 0
+
+
+def cmd_jobs(args):
+    from dlqueue import JobQueue
+
+    for job in JobQueue().list(args.limit):
+        line = f"{job['id']:>5}  {job['status']:<9} {job['mode']:<15} {job['url']}"
+        if job["error"]:
+            line += f"  ({job['error']})"
+        print(line)
+    return 0
+
+
+#the running gui/daemon owns the running job, so the request goes through its api - with nothing listening
+#there's nothing running either, and the queue file is changed directly
+def cmd_control(args):
+    import urllib.error
+    import urllib.request
+
+    url = f"http://127.0.0.1:{args.port}/jobs/{args.job_id}/{args.action}"
+    try:
+        request = urllib.request.Request(url, data=b"{}", method="POST", headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+    except urllib.error.HTTPError as e:
+        sys.exit(f"job {args.job_id}: {json_error(e)}")
+    except urllib.error.URLError:
+        from dlqueue import JobQueue
+        if not getattr(JobQueue(), args.action)(args.job_id):
+            sys.exit(f"job {args.job_id}: can't {args.action} now")
+    print(f"job {args.job_id}: {args.action} ok")
+    return 0
+
+
+def json_error(e):
+    import json
+    try:
+        return json.loads(e.read())["error"]
+    except (ValueError, KeyError):
+        return f"http {e.code}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="crateplug", description="download youtube audio without the gui")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    download = commands.add_parser("download", help="download urls now and exit")
+    download.add_argument("urls", nargs="+")
+    add_job_options(download)
+    download.set_defaults(run=cmd_download)
+
+    serve = commands.add_parser("serve", help="run the local api and work through the queue")
+    add_job_options(serve)
+    serve.add_argument("--port", type=int, default=48721)
+    serve.add_argument("-v", "--verbose", action="store_true", help="print download status lines")
+    serve.set_defaults(run=cmd_serve)
+
+    jobs = commands.add_parser("jobs", help="list queued and finished jobs")
+    jobs.add_argument("--limit", type=int, default=20)
+    jobs.set_defaults(run=cmd_jobs)
+
+    for action in ("pause", "resume", "cancel"):
+        control = commands.add_parser(action, help=f"{action} a queued or running job")
+        control.add_argument("job_id", type=int)
+        control.add_argument("--port", type=int, default=48721)
+        control.set_defaults(run=cmd_control, action=action)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
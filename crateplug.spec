@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[('yt-dlp.exe', '.'), ('ffmpeg.exe', '.'), ('ffprobe.exe', '.')],
     datas=[('version.txt', '.'), ('icon.ico', '.'), ('logo.png', '.'), ('bg.jpg', '.')],
-    hiddenimports=[],
+    hiddenimports=['yt_dlp', 'numpy'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1,111 +1,152 @@
-import subprocess
 import os
-import sys
 
-#file paths for packaged binaries
-
-def resource_path(relative):
-    if hasattr(sys, "_MEIPASS"):
-        return os.path.join(sys._MEIPASS, relative)
-    return os.path.join(os.path.abspath("."), relative)
+from classifier import OutputParser, PRINT_ARGS, dispatch
+from archive import get_archive
+from listing import list_playlist, diff_playlist, diff_message, playlist_items_args
+from dlconcurrent import download_entry
+from pacing import DEFAULT_PROFILE, make_pacer, run_paced
+from journal import get_journal
+from metacache import get_metacache, split_cached
+from pipeline import Pipeline, FETCH_ARGS
+from formats import DEFAULT_FORMAT, get_profiles, extract_args, output_template
+from binaries import binary
+from supervisor import supervised_events
+from bandwidth import lease
+
+#same retry settings for both pacing profiles
+RETRY_ARGS = [
+    "--retries", "5",
+    "--fragment-retries", "5",
+    "--skip-unavailable-fragments",
+]
 
 
 #variables - utl and path
 
-def download_playlist(url, output_dir, status_callback):
-    
-    #creates output path and file title (video_title.mp3)
-    output_template = os.path.join(output_dir, "%(title)s.%(ext)s")
-
-    #command to download the audio:
-    archive_file = os.path.join(output_dir, "archive.txt")
-    command = [
-        resource_path("yt-dlp.exe"), #use yt-dlp
-        "--ffmpeg-location", resource_path("ffmpeg.exe"),  #point to ffmpeg.exe
-        "-x", #extract audio
-        "--audio-format", "mp3", #tells it to use mp3 format
-        "--audio-quality", "0", 
-        #avoid rate limiting
-        "--sleep-interval", "5",
-        "--max-sleep-interval", "10",    
-        "--retries", "5",
-        "--fragment-retries", "5",
-        "--skip-unavailable-fragments",
-        "--print", "after_move:[%(playlist_index)s/%(playlist_count)s]",
-        "--print", "after_move:%(filepath)s",
-        #download archive (avoid downloading already downloaded videos if retrying playlist download)
-        "--download-archive", archive_file,
-        "-o", output_template, #where and how to save the file
-        url #calls back to url variable previously defined
-    ]
-    process = subprocess.Popen(
-        command,
-        creationflags=0x08000000,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1
-    )
-
-    current_prefix = ""
-
-    for line in process.stdout:
-        line = line.strip()
-        lower = line.lower()
-
-        if line.startswith("[") and "]" in line:
-            current_prefix = line
-            continue
-
-        if line.endswith(".mp3"):
-            status_callback(f"{current_prefix} mp3 downloaded")
-            continue
-
-        # same failure mapping as dlplaylist.py - yessir
-
-        if "private video" in lower:
-            status_callback(f"{current_prefix} download failed: private video")
-
-        elif "age-restricted" in lower or "confirm your age" in lower:
-            status_callback(f"{current_prefix} download failed: age restricted")
-
-        elif "members-only" in lower or "join this channel" in lower:
-            status_callback(f"{current_prefix} download failed: members-only video")
-
-        elif "not available in your country" in lower or "geo-restricted" in lower:
-            status_callback(f"{current_prefix} download failed: geo-blocked - try a new ip address :)")
-
-        elif "requires login" in lower or "cookies" in lower:
-            status_callback(f"{current_prefix} download failed: login required")
-
-        elif "live stream" in lower or "will begin shortly" in lower:
-            status_callback(f"{current_prefix} download failed: live stream")
-
-        elif "video unavailable" in lower or "has been removed" in lower:
-            status_callback(f"{current_prefix} download failed: video unavailable")
-
-        elif "429" in lower or "rate limit" in lower:
-            status_callback(f"{current_prefix} session rate limited - try a new ip address :)")
-
-        elif "timed out" in lower or "connection reset" in lower:
-            status_callback(f"{current_prefix} download failed: network error")
-
-        elif "unsupported url" in lower:
-            status_callback("invalid URL: unsupported or malformed link")
-
-        elif "no video formats found" in lower:
-            status_callback("invalid URL: no downloadable video")
-
-        elif "does not exist" in lower:
-            status_callback("invalid URL: video or playlist does not exist")
-
-        elif "unable to extract" in lower:
-            status_callback("invalid URL: could not extract video data")
-
-        elif "no entries found" in lower:
-            status_callback("invalid URL: empty or invalid playlist")
-
-        elif "error:" in lower:
-            status_callback(f"{current_prefix} download failed: unidentified error")
-
-    process.wait()
\ No newline at end of file
+def download_playlist(url, output_dir, status_callback, event_callback=None, pacing=DEFAULT_PROFILE, audio_format=DEFAULT_FORMAT, share=None):
+
+    #output file(s) per track (see formats.py)
+    profiles = get_profiles(audio_format)
+
+    #the shared archive index covers every folder - an old archive.txt in this folder gets merged in first
+    archive = get_archive()
+    archive.import_archive_txt(os.path.join(output_dir, "archive.txt"))
+
+    #checkpoint journal - an interrupted run of this playlist+folder resumes from its cached listing
+    run = get_journal().open_run(url, output_dir)
+    entries = run.listing()
+    resuming = bool(entries)
+
+    #flat pre-pass - only the entries that aren't archived or already in the folder get downloaded
+    if not resuming:
+        status_callback("listing playlist...")
+        entries = list_playlist(url, status_callback)
+        if not entries:
+            return
+        run.save_listing(entries)
+
+    missing, present = diff_playlist(entries, output_dir, archive)
+    run.queue(missing)
+    todo = run.pending(missing)
+    status_callback(("resuming: " if resuming else "") + diff_message(todo, present))
+    if not todo:
+        run.close()
+        return
+
+    event_callback = run.follow(event_callback)
+
+    if pacing != "conservative":
+        download_adaptive(todo, len(entries), output_dir, status_callback, event_callback, pacing, profiles, share)
+    elif len(profiles) > 1:
+        #several output profiles: fetched into staging once, the pipeline writes every profile
+        with Pipeline(output_dir, status_callback, event_callback, profiles) as pipeline:
+            download_conservative(
+                todo, url, archive, pipeline.template(), status_callback, event_callback, len(entries), profiles, share, pipeline
+            )
+    else:
+        download_conservative(todo, url, archive, output_template(output_dir, profiles), status_callback, event_callback, len(entries), profiles, share)
+
+    #nothing left that could still work - next sync lists the playlist fresh
+    if not run.pending(todo):
+        run.close()
+
+
+#the original large-playlist command: one yt-dlp for the whole playlist with fixed 5-10s sleeps
+def download_conservative(todo, url, archive, output_template, status_callback, event_callback=None, count=None, audio_format=DEFAULT_FORMAT, share=None, pipeline=None):
+    #entries still in the metadata cache (a resumed run) skip extraction, with the same gaps in between
+    cache = get_metacache()
+    cached, todo = split_cached(cache, todo)
+    pacer = make_pacer("conservative")
+    for entry in cached:
+        pacer.wait()
+        dispatch(OutputParser(entry["index"], count).started(entry["id"], entry["title"]), status_callback, event_callback)
+        download_entry(
+            entry, entry["index"], count, output_template, status_callback, event_callback, RETRY_ARGS,
+            stage=pipeline and pipeline.stage(entry["index"], count), audio_format=audio_format, share=share,
+        )
+    if not todo:
+        return
+
+    #playlist positions given up on after hanging too often (see supervisor.py) - restarts go on without them
+    left_out = set()
+
+    def leave_out(index, video_id):
+        if index is None or not any(entry["index"] != index and entry["index"] not in left_out for entry in todo):
+            return False #nothing left to restart for
+        left_out.add(index)
+        return True
+
+    #fragment concurrency / rate limit from the bandwidth budget, for as long as the process runs
+    with lease(share) as limits:
+        #rebuilt for every (re)start, with the archive as it is by then
+        command = lambda: [
+            binary("yt-dlp"), #use yt-dlp
+            "--ffmpeg-location", binary("ffmpeg"),  #point to ffmpeg
+            *(FETCH_ARGS if pipeline else extract_args(audio_format)), #extract audio (see formats.py)
+            #avoid rate limiting
+            "--sleep-interval", "5",
+            "--max-sleep-interval", "10",    
+            *RETRY_ARGS,
+            *PRINT_ARGS,
+            *limits,
+            *cache.write_args(),
+            #download archive (avoid downloading already downloaded videos if retrying playlist download)
+            "--download-archive", archive.export_archive_txt(),
+            *playlist_items_args(todo, left_out),
+            "-o", output_template, #where and how to save the file
+            url #calls back to url variable previously defined
+        ]
+
+        parser = OutputParser()
+        seen = set()
+
+        #killed and started again if it hangs (see supervisor.py) - the retry skips what got archived meanwhile
+        for event in supervised_events(command, parser, leave_out=leave_out):
+            if event.category == "entry":
+                seen.add((event.extractor, event.video_id))
+            #the staged file goes to the encoders, they report it once every profile is written
+            if pipeline and pipeline.take(event):
+                continue
+            archive.record(event)
+            dispatch(event, status_callback, event_callback)
+
+    for extractor, video_id in seen:
+        cache.stored(extractor, video_id)
+
+
+#one yt-dlp per entry with the pacer deciding the gap in between - no sleeping while the server is happy,
+#backing off (and retrying the entry) when it starts answering with 429s
+#the pacer only spaces out the fetches - encoding happens on the pipeline's pool in the meantime
+def download_adaptive(missing, count, output_dir, status_callback, event_callback=None, pacing=DEFAULT_PROFILE, audio_format=DEFAULT_FORMAT, share=None):
+    pacer = make_pacer(pacing)
+
+    with Pipeline(output_dir, status_callback, event_callback, audio_format) as pipeline:
+
+        def download(entry):
+            dispatch(OutputParser(entry["index"], count).started(entry["id"], entry["title"]), status_callback, event_callback)
+            return download_entry(
+                entry, entry["index"], count, pipeline.template(), status_callback, event_callback, RETRY_ARGS,
+                stage=pipeline.stage(entry["index"], count), share=share,
+            )
+
+        run_paced(missing, download, pacer, status_callback)
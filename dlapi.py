@@ -0,0 +1,316 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+
+from classifier import OutputParser, FAILURES, dispatch
+from archive import get_archive, video_key_from_url
+from library import find_video
+from listing import diff_playlist, diff_message
+from pacing import DEFAULT_PROFILE, make_pacer, run_paced
+from journal import get_journal
+from metacache import get_metacache
+from formats import DEFAULT_FORMAT, get_profiles, postprocessor, output_template
+from pipeline import Pipeline, TRANSCODERS
+from binaries import binary
+from bandwidth import lease_params
+
+#in-process backend - drives yt_dlp.YoutubeDL directly instead of starting yt-dlp.exe for every job.
+#sessions are kept alive between jobs so http connections, cookies and extractor state stay warm.
+#if yt_dlp can't be imported the gui falls back to the subprocess modules (dlsingle/dlplaylist/...)
+
+SOCKET_TIMEOUT = 30
+
+def available():
+    try:
+        import yt_dlp  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+#same settings the subprocess modes pass on the command line
+def base_options():
+    return {
+        "format": "bestaudio/best", #what -x picks
+        "ffmpeg_location": binary("ffmpeg"),
+        "postprocessors": [postprocessor()],
+        "quiet": True,
+        "noprogress": True,
+        #extracted metadata goes to the shared cache (see metacache.py)
+        "writeinfojson": True,
+        "allow_playlist_files": False,
+        #no watchdog in-process (a thread can't be killed) - a dead connection errors out instead of hanging
+        "socket_timeout": SOCKET_TIMEOUT,
+    }
+
+
+SINGLE_OPTIONS = {**base_options(), "noplaylist": True}
+PLAYLIST_OPTIONS = base_options()
+LARGE_PLAYLIST_OPTIONS = {
+    **base_options(),
+    "retries": 5,
+    "fragment_retries": 5,
+    "skip_unavailable_fragments": True,
+}
+
+
+#same options with another output format (see formats.py) - pooled separately, each set is its own YoutubeDL.
+#several profiles: no extraction at all, the session only fetches and the pipeline encodes
+def with_format(name, options, audio_format):
+    profiles = get_profiles(audio_format)
+    if len(profiles) > 1:
+        return f"{name}:staged", {**options, "postprocessors": []}
+    extract = postprocessor(profiles[0])
+    if extract == postprocessor():
+        return name, options
+    return f"{name}:{extract['preferredcodec']}:{extract['preferredquality']}", {**options, "postprocessors": [extract]}
+
+
+#several output profiles: fetched into staging once, the pipeline writes every profile (see pipeline.py)
+def staging(output_dir, status_callback, event_callback, audio_format, transcoders=TRANSCODERS):
+    if len(get_profiles(audio_format)) > 1:
+        return Pipeline(output_dir, status_callback, event_callback, audio_format, transcoders)
+    return nullcontext()
+
+
+#yt-dlp logs everything through this - errors/warnings go through the same failure mapping as the stdout modes
+class SessionLogger:
+
+    def __init__(self, session):
+        self.session = session
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        self.session.report(msg)
+
+    def error(self, msg):
+        self.session.report(msg)
+
+
+class Session:
+
+    def __init__(self, options):
+        import yt_dlp
+
+        self.status_callback = None
+        self.event_callback = None
+        self.parser = OutputParser()
+        self.filepath = None
+        self.outcome = None
+        self.pipeline = None
+
+        self.ydl = yt_dlp.YoutubeDL({
+            **options,
+            "logger": SessionLogger(self),
+            "progress_hooks": [self.progress_hook],
+            "postprocessor_hooks": [self.postprocessor_hook],
+        })
+
+    #point the long-lived instance at this job's folder and callbacks (or at the pipeline's staging folder)
+    def start(self, output_dir, status_callback, event_callback=None, audio_format=DEFAULT_FORMAT, pipeline=None):
+        self.ydl.params["outtmpl"]["default"] = pipeline.template() if pipeline else output_template(output_dir, audio_format)
+        self.ydl.params["outtmpl"]["infojson"] = get_metacache().template()
+        self.status_callback = status_callback
+        self.event_callback = event_callback
+        self.pipeline = pipeline
+        self.parser = OutputParser()
+        self.filepath = None
+
+    def emit(self, event):
+        if event and event.category in FAILURES and self.outcome != "rate_limited":
+            self.outcome = event.category
+        if event and self.status_callback:
+            dispatch(event, self.status_callback, self.event_callback)
+
+    def report(self, msg):
+        self.emit(self.parser.classify(msg))
+
+    def progress_hook(self, d):
+        if d["status"] == "downloading":
+            self.emit(self.parser.progress(
+                d["info_dict"].get("id"),
+                d.get("downloaded_bytes"),
+                d.get("total_bytes") or d.get("total_bytes_estimate"),
+                d.get("speed"),
+                d.get("eta"),
+            ))
+
+    #ExtractAudio = --print post_process, MoveFiles is the last step = --print after_move
+    def postprocessor_hook(self, d):
+        if d["status"] == "finished" and d["postprocessor"] == "ExtractAudio":
+            self.emit(self.parser.transcoded(d["info_dict"].get("id")))
+
+        if d["status"] == "finished" and d["postprocessor"] == "MoveFiles":
+            info = d["info_dict"]
+            self.filepath = info.get("filepath")
+            event = self.parser.downloaded(info.get("id"), self.filepath, info.get("extractor_key"))
+            if self.pipeline and self.pipeline.take(event):
+                return #staged - the pipeline reports it once every profile is written
+            get_archive().record(event)
+            self.emit(event)
+
+    #fragments / rate limit from the bandwidth budget (see bandwidth.py) - the downloader reads them per download,
+    #so a long-lived session picks up the current split every entry
+    def apply_limits(self, params):
+        self.ydl.params.update(params)
+
+    #download one already-listed entry - "done" if a file came out, else the failure category (or None)
+    def download_entry(self, entry, index, count, share=None):
+        import yt_dlp
+
+        self.parser = OutputParser(index, count)
+        self.filepath = None
+        self.outcome = None
+        self.emit(self.parser.started(entry.get("id"), entry.get("title"), entry.get("ie_key")))
+
+        #extracted recently (a retry, another mode)? start from the cached info json instead
+        cache = get_metacache()
+        found = cache.lookup(entry.get("ie_key"), entry.get("id"))
+        with lease_params(share) as params:
+            self.apply_limits(params)
+            try:
+                if found:
+                    self.ydl.download_with_info_file(found) #falls back to the webpage url if the formats went stale
+                else:
+                    self.ydl.process_ie_result(entry, download=True)
+            except yt_dlp.utils.DownloadError:
+                pass #already reported through the logger
+
+        if found and self.filepath is None:
+            cache.discard(entry.get("ie_key"), entry.get("id"))
+        else:
+            cache.stored(entry.get("ie_key"), entry.get("id"))
+        return "done" if self.filepath is not None else self.outcome
+
+
+#idle sessions per option set, handed out one per thread (YoutubeDL is not thread safe)
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+@contextmanager
+def session(name, options):
+    with _sessions_lock:
+        idle = _sessions.setdefault(name, [])
+        current = idle.pop() if idle else None
+
+    if current is None:
+        current = Session(options)
+
+    try:
+        yield current
+    finally:
+        with _sessions_lock:
+            _sessions[name].append(current)
+
+
+def download_video(url, output_dir, status_callback, event_callback=None, audio_format=DEFAULT_FORMAT, share=None):
+    import yt_dlp
+
+    known = video_key_from_url(url)
+    if known and (get_archive().contains(*known) or find_video(output_dir, *known)):
+        dispatch(OutputParser().skipped(known[1]), status_callback, event_callback)
+        return
+
+    cache = get_metacache()
+    found = cache.lookup(*known) if known else None
+
+    with staging(output_dir, status_callback, event_callback, audio_format, 1) as pipeline, \
+            session(*with_format("single", SINGLE_OPTIONS, audio_format)) as s:
+        s.start(output_dir, status_callback, event_callback, audio_format, pipeline)
+        info = None
+        with lease_params(share) as params:
+            s.apply_limits(params)
+            try:
+                if found:
+                    s.ydl.download_with_info_file(found)
+                else:
+                    info = s.ydl.extract_info(url, download=True)
+            except yt_dlp.utils.DownloadError:
+                pass
+
+        if found and s.filepath is None:
+            cache.discard(*known)
+        elif info:
+            cache.stored(info.get("extractor_key"), info.get("id"))
+
+
+#list the playlist without resolving entries, then download entry by entry
+def list_entries(s, url):
+    import yt_dlp
+
+    try:
+        info = s.ydl.extract_info(url, download=False, process=False)
+    except yt_dlp.utils.DownloadError:
+        return []
+
+    if info.get("_type") not in ("playlist", "multi_video"):
+        info.setdefault("ie_key", info.get("extractor_key"))
+        info["index"] = 1
+        return [info]
+
+    entries = []
+    for index, entry in enumerate(info.get("entries") or [], start=1):
+        if entry:
+            entry.setdefault("ie_key", info.get("extractor_key"))
+            entry["index"] = index
+            entries.append(entry)
+    return entries
+
+
+def download_playlist(url, output_dir, status_callback, workers=1, large=False, event_callback=None, pacing=DEFAULT_PROFILE, audio_format=DEFAULT_FORMAT, share=None):
+
+    archive = get_archive()
+    archive.import_archive_txt(os.path.join(output_dir, "archive.txt"))
+    name, options = with_format(
+        "large_playlist" if large else "playlist", LARGE_PLAYLIST_OPTIONS if large else PLAYLIST_OPTIONS, audio_format
+    )
+
+    #large playlists resume from the checkpoint journal (see journal.py) - cached entries go back in as url results
+    run = get_journal().open_run(url, output_dir) if large else None
+    entries = run.listing() if run else None
+    resuming = bool(entries)
+    if resuming:
+        entries = [dict(entry, _type="url") for entry in entries]
+    else:
+        with session(name, options) as s:
+            s.start(output_dir, status_callback, event_callback)
+            entries = list_entries(s, url)
+        if not entries:
+            return
+        if run:
+            run.save_listing(entries)
+
+    count = len(entries)
+    missing, present = diff_playlist(entries, output_dir, archive)
+    if run:
+        run.queue(missing)
+        missing = run.pending(missing)
+        event_callback = run.follow(event_callback)
+    status_callback(("resuming: " if resuming else "") + diff_message(missing, present))
+
+    with staging(output_dir, status_callback, event_callback, audio_format) as pipeline:
+
+        def run_entry(index, entry):
+            with session(name, options) as s:
+                s.start(output_dir, status_callback, event_callback, audio_format, pipeline)
+                return s.download_entry(entry, index, count, share)
+
+        #large playlists go one at a time through the pacer (see pacing.py)
+        if large:
+            if missing:
+                run_paced(missing, lambda entry: run_entry(entry["index"], entry), make_pacer(pacing), status_callback)
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                futures = [pool.submit(run_entry, entry["index"], entry) for entry in missing]
+                for future in as_completed(futures):
+                    future.result()
+
+    if large and not run.pending(missing):
+        run.close()
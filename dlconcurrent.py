@@ -0,0 +1,108 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from classifier import OutputParser, PRINT_ARGS, FAILURES, dispatch
+from archive import get_archive
+from listing import list_playlist, diff_playlist, diff_message
+from metacache import get_metacache, source_args
+from pipeline import Pipeline, FETCH_ARGS
+from formats import DEFAULT_FORMAT, extract_args
+from binaries import binary
+from supervisor import supervised_events
+from bandwidth import lease
+
+DEFAULT_WORKERS = 4
+MAX_WORKERS = 8
+
+
+#downloads one playlist entry with its own yt-dlp process.
+#returns "done" if a file came out, otherwise the last failure category seen (or None).
+#inline yt-dlp extracts the audio itself (formats.extract_args) - with stage set it only fetches the best audio stream,
+#the file goes to stage(event) instead of being reported (pipeline.py converts it), and the result is "fetched"
+def download_entry(entry, index, count, output_template, status_callback, event_callback=None, extra_args=(), stage=None, audio_format=DEFAULT_FORMAT, share=None):
+    #a retry of something extracted recently starts from the cached info json, no new extraction
+    cache = get_metacache()
+    extractor = entry.get("ie_key")
+    source = source_args(cache, extractor, entry["id"], entry["url"])
+
+    #fragment concurrency / rate limit from the bandwidth budget, for as long as the process runs
+    with lease(share) as limits:
+        command = [
+            binary("yt-dlp"),
+            "--no-playlist",
+            "--ffmpeg-location", binary("ffmpeg"),
+            *(FETCH_ARGS if stage else extract_args(audio_format)),
+            *PRINT_ARGS,
+            *extra_args,
+            *limits,
+            *cache.write_args(),
+            "-o", output_template,
+            *source,
+        ]
+
+        parser = OutputParser(index, count)
+        outcome = None
+
+        #killed and started again if it hangs (see supervisor.py)
+        for event in supervised_events(command, parser):
+            if event.category == "entry" and event.extractor:
+                extractor = event.extractor
+            if stage and event.category in ("done", "transcoded"):
+                #nothing was transcoded yet and the file is still in staging - the pipeline reports both
+                if event.category == "done":
+                    stage(event)
+                    outcome = "fetched"
+                continue
+            if event.category == "done":
+                get_archive().record(event)
+            if event.category == "done" or event.category in FAILURES and outcome not in ("done", "rate_limited"):
+                outcome = event.category
+            dispatch(event, status_callback, event_callback)
+
+    if outcome not in ("done", "fetched") and source[0] == "--load-info-json":
+        cache.discard(extractor, entry["id"])
+    else:
+        cache.stored(extractor, entry["id"])
+    return outcome
+
+
+#list first, then hand every entry to a pool of workers
+def download_playlist(url, output_dir, status_callback, workers=DEFAULT_WORKERS, event_callback=None, audio_format=DEFAULT_FORMAT, share=None):
+
+    workers = max(1, min(int(workers), MAX_WORKERS))
+
+    archive = get_archive()
+    archive.import_archive_txt(os.path.join(output_dir, "archive.txt"))
+
+    status_callback("listing playlist...")
+    entries = list_playlist(url, status_callback)
+    if not entries:
+        return
+
+    count = len(entries)
+    missing, present = diff_playlist(entries, output_dir, archive)
+    status_callback(diff_message(missing, present))
+
+    #the workers only fetch, the pipeline's encoder pool turns the fetched streams into mp3s meanwhile
+    pipeline = Pipeline(output_dir, status_callback, event_callback, audio_format)
+
+    def run_entry(index, entry):
+        #the listing already has the title - report the start before yt-dlp spends time extracting
+        dispatch(OutputParser(index, count).started(entry["id"], entry["title"]), status_callback, event_callback)
+        return download_entry(
+            entry, index, count, pipeline.template(), status_callback, event_callback, stage=pipeline.stage(index, count),
+            share=share,
+        )
+
+    failed = 0
+
+    with pipeline:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_entry, entry["index"], entry) for entry in missing]
+
+            for future in as_completed(futures):
+                if future.result() != "fetched":
+                    failed += 1
+
+    failed += pipeline.failed
+    status_callback(f"done: {pipeline.downloaded} downloaded, {failed} failed, {len(present)} already present")
@@ -1,100 +1,93 @@
-import subprocess
 import os
-import sys
 
-#file paths for packaged binaries
-
-def resource_path(relative):
-    if hasattr(sys, "_MEIPASS"):
-        return os.path.join(sys._MEIPASS, relative)
-    return os.path.join(os.path.abspath("."), relative)
-
-def download_playlist(url, output_dir, status_callback):
-
-    output_template = os.path.join(output_dir, "%(title)s.%(ext)s")
-    archive_file = os.path.join(output_dir, "archive.txt")
-
-    command = [
-        resource_path("yt-dlp.exe"), #use yt-dlp
-        "--ffmpeg-location", resource_path("ffmpeg.exe"),  #point to ffmpeg.exe
-        "-x",
-        "--audio-format", "mp3",
-        "--audio-quality", "0",
-        "--print", "after_move:[%(playlist_index)s/%(playlist_count)s]",
-        "--print", "after_move:%(filepath)s",
-        "--download-archive", archive_file,
-        "-o", output_template,
-        url,
-    ]
-
-    process = subprocess.Popen(
-        command,
-        creationflags=0x08000000,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1
-    )
-
-    current_prefix = ""
-
-    for line in process.stdout:
-        line = line.strip()
-        lower = line.lower()
-
-        # SUCCESS PREFIX
-        if line.startswith("[") and "]" in line:
-            current_prefix = line
-            continue
-
-        # SUCCESS FILE
-        if line.endswith(".mp3"):
-            status_callback(f"{current_prefix} video downloaded")
-            continue
-
-        # FAILURES 
-
-        if "private video" in lower:
-            status_callback(f"{current_prefix} download failed: private video")
-
-        elif "age-restricted" in lower or "confirm your age" in lower:
-            status_callback(f"{current_prefix} download failed: age restricted")
-
-        elif "members-only" in lower or "join this channel" in lower:
-            status_callback(f"{current_prefix} download failed: members-only video")
-
-        elif "not available in your country" in lower or "geo-restricted" in lower:
-            status_callback(f"{current_prefix} download failed: geo-blocked - try a new ip address :)")
-
-        elif "requires login" in lower or "cookies" in lower:
-            status_callback(f"{current_prefix} download failed: login required")
-
-        elif "video unavailable" in lower or "has been removed" in lower:
-            status_callback(f"{current_prefix} download failed: video unavailable")
-
-        elif "429" in lower or "rate limit" in lower:
-            status_callback(f"{current_prefix} session rate limited: try a new ip address :)")
-
-        elif "timed out" in lower or "connection reset" in lower:
-            status_callback(f"{current_prefix} download failed: network error")
-
-        elif "unsupported url" in lower:
-            status_callback("invalid URL: unsupported or malformed link")
-
-        elif "no video formats found" in lower:
-            status_callback("invalid URL: no downloadable video")
-
-        elif "does not exist" in lower:
-            status_callback("invalid URL: video or playlist does not exist")
-
-        elif "unable to extract" in lower:
-            status_callback("invalid URL: could not extract video data")
-
-        elif "no entries found" in lower:
-            status_callback("invalid URL: empty or invalid playlist")
-
-        elif "error:" in lower:
-            status_callback(f"{current_prefix} download failed: unidentified error")
-
-
-    process.wait()
+from classifier import OutputParser, PRINT_ARGS, dispatch
+from archive import get_archive
+from listing import list_playlist, diff_playlist, diff_message, playlist_items_args
+from metacache import get_metacache, split_cached
+from dlconcurrent import download_entry
+from pipeline import Pipeline, FETCH_ARGS
+from formats import DEFAULT_FORMAT, get_profiles, extract_args, output_template
+from binaries import binary
+from supervisor import supervised_events
+from bandwidth import lease
+
+def download_playlist(url, output_dir, status_callback, event_callback=None, audio_format=DEFAULT_FORMAT, share=None):
+
+    profiles = get_profiles(audio_format)
+    #the shared archive index covers every folder - an old archive.txt in this folder gets merged in first
+    archive = get_archive()
+    archive.import_archive_txt(os.path.join(output_dir, "archive.txt"))
+
+    #flat pre-pass - only the entries that aren't archived or already in the folder get downloaded
+    status_callback("listing playlist...")
+    entries = list_playlist(url, status_callback)
+    if not entries:
+        return
+
+    missing, present = diff_playlist(entries, output_dir, archive)
+    status_callback(diff_message(missing, present))
+    if not missing:
+        return
+
+    #several output profiles: everything is fetched into staging once, the pipeline writes every profile
+    if len(profiles) > 1:
+        with Pipeline(output_dir, status_callback, event_callback, profiles) as pipeline:
+            download_missing(url, missing, len(entries), archive, pipeline.template(), status_callback, event_callback, profiles, share, pipeline)
+    else:
+        download_missing(url, missing, len(entries), archive, output_template(output_dir, profiles), status_callback, event_callback, profiles, share)
+
+
+def download_missing(url, missing, count, archive, output_template, status_callback, event_callback, audio_format, share, pipeline=None):
+    #entries extracted in the last few hours (a retry) download from the metadata cache one by one,
+    #the rest go through one yt-dlp for the playlist that fills the cache as it extracts
+    cache = get_metacache()
+    cached, missing = split_cached(cache, missing)
+    for entry in cached:
+        dispatch(OutputParser(entry["index"], count).started(entry["id"], entry["title"]), status_callback, event_callback)
+        download_entry(
+            entry, entry["index"], count, output_template, status_callback, event_callback,
+            stage=pipeline and pipeline.stage(entry["index"], count), audio_format=audio_format, share=share,
+        )
+    if not missing:
+        return
+
+    #playlist positions given up on after hanging too often (see supervisor.py) - restarts go on without them
+    left_out = set()
+
+    def leave_out(index, video_id):
+        if index is None or not any(entry["index"] != index and entry["index"] not in left_out for entry in missing):
+            return False #nothing left to restart for
+        left_out.add(index)
+        return True
+
+    #fragment concurrency / rate limit from the bandwidth budget, for as long as the process runs
+    with lease(share) as limits:
+        #rebuilt for every (re)start, with the archive as it is by then
+        command = lambda: [
+            binary("yt-dlp"), #use yt-dlp
+            "--ffmpeg-location", binary("ffmpeg"),  #point to ffmpeg
+            *(FETCH_ARGS if pipeline else extract_args(audio_format)),
+            *PRINT_ARGS,
+            *limits,
+            *cache.write_args(),
+            "--download-archive", archive.export_archive_txt(),
+            *playlist_items_args(missing, left_out),
+            "-o", output_template,
+            url,
+        ]
+
+        parser = OutputParser()
+        seen = set()
+
+        #killed and started again if it hangs (see supervisor.py) - the retry skips what got archived meanwhile
+        for event in supervised_events(command, parser, leave_out=leave_out):
+            if event.category == "entry":
+                seen.add((event.extractor, event.video_id))
+            #the staged file goes to the encoders, they report it once every profile is written
+            if pipeline and pipeline.take(event):
+                continue
+            archive.record(event)
+            dispatch(event, status_callback, event_callback)
+
+    for extractor, video_id in seen:
+        cache.stored(extractor, video_id)
@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from appdata import data_path
+from bandwidth import PRIORITIES, job_priority
+
+#persistent job queue - every url that comes in (button or browser extension) is written to disk
+#before anything else happens, so nothing is lost if a job is running or the app closes/crashes.
+#pending jobs run highest priority first (single tracks before playlists before large playlists, see
+#bandwidth.PRIORITIES), oldest first within a priority
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+PAUSED = "paused" #held until resumed - paused while running, or before it started
+CANCELLED = "cancelled"
+
+#where a running job goes when it's stopped at an entry boundary (see runner.JobControl)
+INTERRUPTED = {"preempt": PENDING, "pause": PAUSED, "cancel": CANCELLED}
+
+STILL_ACTIVE = 259 #windows exit code of a process that hasn't exited
+
+
+#is the process that claimed a job still there - the gui, a daemon and cli runs can share the queue file
+def pid_alive(pid):
+    if sys.platform == "win32":
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid) #PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        ok = kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return bool(ok) and code.value == STILL_ACTIVE
+
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        return True #someone else's process, but it's there
+    except OSError:
+        return False
+    return True
+
+
+class JobQueue:
+
+    def __init__(self, path=None):
+        self.path = path or data_path("queue.db")
+        self.lock = threading.Lock() #one connection shared by the gui thread and the server thread
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                output_dir TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                workers INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+        #per-job settings (pacing profile etc) as json - added after the first release, so older queues get the column here
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        if "options" not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN options TEXT NOT NULL DEFAULT '{}'")
+        #same for the priority (bandwidth.PRIORITIES weight) - older rows get their mode's default
+        if "priority" not in columns:
+            self.db.execute(f"ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT {PRIORITIES['normal']}")
+            for mode in ("single", "large_playlist"):
+                self.db.execute(
+                    "UPDATE jobs SET priority = ? WHERE mode = ?", (PRIORITIES[job_priority({"mode": mode})], mode)
+                )
+        #pid of the process running the job - recover() leaves jobs of live processes alone
+        if "owner" not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_next ON jobs (status, priority DESC, id)")
+
+    #claimed jobs go in as running - the cli's own, which a gui or daemon sharing the queue file would
+    #otherwise take_next() before the cli got to them
+    def add(self, url, output_dir, mode, workers=1, options=None, claimed=False):
+        priority = PRIORITIES[job_priority({"mode": mode, "options": options})]
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO jobs (url, output_dir, mode, workers, options, priority, status, owner, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url, output_dir, mode, workers, json.dumps(options or {}), priority,
+                    RUNNING if claimed else PENDING, os.getpid() if claimed else None, time.time(),
+                )
+            )
+            return cursor.lastrowid
+
+    def row_to_job(self, row):
+        job = dict(row)
+        job["options"] = json.loads(job.get("options") or "{}")
+        return job
+
+    #jobs that were running when the app died go back in line (yt-dlp picks up its .part files again) - not the
+    #ones a process that's still running has (a cli download while the gui starts). a pid of ours is from an
+    #earlier process that had the same one
+    def recover(self):
+        with self.lock:
+            rows = self.db.execute("SELECT id, owner FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            for row in rows:
+                if row["owner"] and row["owner"] != os.getpid() and pid_alive(row["owner"]):
+                    continue
+                self.db.execute("UPDATE jobs SET status = ? WHERE id = ? AND status = ?", (PENDING, row["id"], RUNNING))
+
+    #highest priority pending job (oldest first), marked as running in the same step
+    def take_next(self):
+        with self.lock:
+            while True:
+                row = self.db.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY priority DESC, id LIMIT 1", (PENDING,)
+                ).fetchone()
+                if row is None:
+                    return None
+                job = self.claim(row)
+                if job:
+                    return job
+
+    #pending -> running only if nobody else got there first (the gui and a daemon can share the queue file)
+    def claim(self, row):
+        cursor = self.db.execute(
+            "UPDATE jobs SET status = ?, owner = ? WHERE id = ? AND status = ?", (RUNNING, os.getpid(), row["id"], PENDING)
+        )
+        if cursor.rowcount != 1:
+            return None
+        job = self.row_to_job(row)
+        job["status"] = RUNNING
+        return job
+
+    def finish(self, job_id, error=None):
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (FAILED if error else DONE, error, time.time(), job_id)
+            )
+
+    #a running job stopped by runner.JobControl - preempted ones go back in line (at their old place), paused ones
+    #wait for resume(), cancelled ones are finished
+    def interrupt(self, job_id, action):
+        status = INTERRUPTED[action]
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (status, time.time() if status == CANCELLED else None, job_id, RUNNING)
+            )
+
+    #the same for jobs that aren't running - True if the job was in a state the action applies to
+    def pause(self, job_id):
+        return self.move(job_id, (PENDING,), PAUSED)
+
+    def resume(self, job_id):
+        return self.move(job_id, (PAUSED,), PENDING)
+
+    def cancel(self, job_id):
+        return self.move(job_id, (PENDING, PAUSED), CANCELLED)
+
+    def move(self, job_id, current, status):
+        with self.lock:
+            cursor = self.db.execute(
+                f"UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN ({', '.join('?' * len(current))})",
+                (status, time.time() if status == CANCELLED else None, job_id, *current)
+            )
+            return cursor.rowcount == 1
+
+    #priority of the next job take_next() would hand out (None if nothing is pending) - decides preemption
+    def next_priority(self):
+        with self.lock:
+            return self.db.execute("SELECT MAX(priority) FROM jobs WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def pending_count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self.row_to_job(row) if row else None
+
+    def list(self, limit=100):
+        with self.lock:
+            rows = self.db.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            return [self.row_to_job(row) for row in rows]
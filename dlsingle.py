@@ -1,102 +1,67 @@
-import subprocess
-import os
-import sys
-
-#file paths for packaged binaries
-
-def resource_path(relative):
-    if hasattr(sys, "_MEIPASS"):
-        return os.path.join(sys._MEIPASS, relative)
-    return os.path.join(os.path.abspath("."), relative)
+from contextlib import nullcontext
+
+from classifier import OutputParser, PRINT_ARGS, dispatch
+from archive import get_archive, video_key_from_url
+from library import find_video
+from metacache import get_metacache, source_args
+from formats import DEFAULT_FORMAT, get_profiles, extract_args, output_template
+from pipeline import Pipeline, FETCH_ARGS
+from binaries import binary
+from supervisor import supervised_events
+from bandwidth import lease
 
 #receive variables from server.py:
-def download_video(url, output_dir,status_callback):
-
-    output_template = os.path.join(output_dir, "%(title)s.%(ext)s")
-
-    #command to download the audio:
-    command = [
-        resource_path("yt-dlp.exe"), #use yt-dlp
-        "--no-playlist", #download only the video not the whole playlist
-        "--ffmpeg-location", resource_path("ffmpeg.exe"),  #point to ffmpeg.exe
-        "-x", #extract audio
-        "--audio-format", "mp3", #tells it to use mp3 format
-        "--audio-quality", "0", 
-        "--print", "after_move:filepath", 
-        "-o", output_template, #where and how to save the file
-        url, #calls back to url variable previously defined
-    ]
-
-    process = subprocess.Popen(
-        command,
-        creationflags=0x08000000,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1
-    )
-
-    current_prefix = ""
-
-    for line in process.stdout:
-        line = line.strip()
-        lower = line.lower()
-
-        # SUCCESS PREFIX
-        if line.startswith("[") and "]" in line:
-            current_prefix = line
-            continue
-
-        # SUCCESS FILE
-        if line.endswith(".mp3"):
-            status_callback(f"{current_prefix} mp3 downloaded")
-            continue
-
-        # FAILURES (from merged stderr)
-        if "already been recorded in the archive" in lower:
-            status_callback(f"{current_prefix} skipped (already downloaded)")
-
-        elif "private video" in lower:
-            status_callback(f"{current_prefix} download failed: private video")
-
-        elif "age-restricted" in lower or "confirm your age" in lower:
-            status_callback(f"{current_prefix} download failed: age restricted")
-
-        elif "members-only" in lower or "join this channel" in lower:
-            status_callback(f"{current_prefix} download failed: members-only video")
-
-        elif "not available in your country" in lower or "geo-restricted" in lower:
-            status_callback(f"{current_prefix} download failed: geo-blocked - try a new ip address :)")
-
-        elif "requires login" in lower or "cookies" in lower:
-            status_callback(f"{current_prefix} download failed: login required")
-
-        elif "video unavailable" in lower or "has been removed" in lower:
-            status_callback(f"{current_prefix} download failed: video unavailable")
-
-        elif "429" in lower or "rate limit" in lower:
-            status_callback(f"{current_prefix} session rate limited: try a new ip address")
-
-        elif "timed out" in lower or "connection reset" in lower:
-            status_callback(f"{current_prefix} download failed: network error")
-
-        elif "unsupported url" in lower:
-            status_callback("invalid URL: unsupported or malformed link")
-
-        elif "no video formats found" in lower:
-            status_callback("invalid URL: no downloadable video")
-
-        elif "does not exist" in lower:
-            status_callback("invalid URL: video or playlist does not exist")
-
-        elif "unable to extract" in lower:
-            status_callback("invalid URL: could not extract video data")
-
-        elif "no entries found" in lower:
-            status_callback("invalid URL: empty or invalid playlist")
-
-        elif "error:" in lower:
-            status_callback(f"{current_prefix} download failed: unidentified error")
-
-
-    process.wait()
+def download_video(url, output_dir, status_callback, event_callback=None, audio_format=DEFAULT_FORMAT, share=None):
+
+    #already downloaded (any folder, any mode)? then don't even start yt-dlp
+    archive = get_archive()
+    known = video_key_from_url(url)
+    if known and archive.contains(*known):
+        dispatch(OutputParser().skipped(known[1]), status_callback, event_callback)
+        return
+    #already in this folder (by id, or by the title of a cached extraction)? same answer, still no yt-dlp
+    if known and find_video(output_dir, *known):
+        dispatch(OutputParser().skipped(known[1]), status_callback, event_callback)
+        return
+
+    #several output profiles: fetched into staging once, one ffmpeg writes every profile (see pipeline.py)
+    profiles = get_profiles(audio_format)
+    staged = Pipeline(output_dir, status_callback, event_callback, profiles, transcoders=1) if len(profiles) > 1 else nullcontext()
+
+    #extracted in the last few hours (any mode)? then download from the cached metadata
+    cache = get_metacache()
+    source = source_args(cache, *known, url) if known else [url]
+
+    #fragment concurrency / rate limit from the bandwidth budget, for as long as the process runs
+    with staged as pipeline, lease(share) as limits:
+        #command to download the audio:
+        command = [
+            binary("yt-dlp"), #use yt-dlp
+            "--no-playlist", #download only the video not the whole playlist
+            "--ffmpeg-location", binary("ffmpeg"),  #point to ffmpeg
+            *(FETCH_ARGS if pipeline else extract_args(profiles)), #extract audio - mp3, or the source codec (see formats.py)
+            *PRINT_ARGS, #one "[done] ..." line per finished file (see classifier.py)
+            *limits, #fragments / rate limit (see bandwidth.py)
+            *cache.write_args(), #keep what gets extracted for the next retry
+            "-o", pipeline.template() if pipeline else output_template(output_dir, profiles), #where and how to save the file
+            *source, #the url (or its cached info json)
+        ]
+
+        parser = OutputParser()
+        seen = set()
+        done = False
+
+        #killed and started again if it hangs (see supervisor.py)
+        for event in supervised_events(command, parser):
+            if event.category == "entry":
+                seen.add((event.extractor, event.video_id))
+            done = done or event.category == "done"
+            if pipeline and pipeline.take(event):
+                continue
+            archive.record(event)
+            dispatch(event, status_callback, event_callback)
+
+    if source[0] == "--load-info-json" and not done:
+        cache.discard(*known)
+    for extractor, video_id in seen:
+        cache.stored(extractor, video_id)
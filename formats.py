@@ -0,0 +1,195 @@
+import json
+import os
+import re
+
+from appdata import data_path
+
+#output formats per job:
+#  mp3    - everything re-encoded to mp3 (V0), the old behaviour
+#  native - keep the source codec, stream copy into its own container (opus -> .opus, aac -> .m4a, vorbis -> .ogg)
+#  smart  - keep mp3/aac sources as they are, re-encode the rest to mp3
+#no encode = a track is done when the download is, and opus/aac don't lose another generation
+#
+#output profiles - a format (one of the above or a codec from CODECS) plus bitrate, folder and file name:
+#  {"format": "mp3", "bitrate": "320k", "folder": "controller", "template": "%(artist)s - %(title)s"}
+#bitrate is "320k", "V2" (vbr quality) or left out (mp3 V0, the encoder's default otherwise - flac/wav ignore it),
+#folder is relative to the job's folder, template is a yt-dlp output template without the extension.
+#a job can write several profiles: the source is fetched once and every profile is encoded from it (pipeline.py),
+#so each extra output costs cpu time, never another download.
+#the format names work as profiles on their own, PROFILES has a few more, and profiles.json in the app data
+#folder can add its own ({"name": {...}, ...})
+
+FORMATS = ["mp3", "native", "smart"]
+DEFAULT_FORMAT = "mp3"
+DEFAULT_TEMPLATE = "%(title)s"
+
+#codec -> (extension, ffmpeg encoder, muxer) for profiles that name a codec
+CODECS = {
+    "mp3": ("mp3", "libmp3lame", "mp3"),
+    "aac": ("m4a", "aac", "ipod"),
+    "opus": ("opus", "libopus", "opus"),
+    "vorbis": ("ogg", "libvorbis", "ogg"),
+    "flac": ("flac", "flac", "flac"),
+    "wav": ("wav", "pcm_s16le", "wav"),
+}
+LOSSLESS = ("flac", "wav")
+
+PROFILES = {
+    "mp3": {"format": "mp3"},
+    "native": {"format": "native"},
+    "smart": {"format": "smart"},
+    "mp3-320": {"format": "mp3", "bitrate": "320k"},
+    "opus": {"format": "opus"},
+    "flac": {"format": "flac", "folder": "flac"},
+}
+
+#template fields for files the pipeline names, and what can't go in a file name (yt-dlp's own sanitizing is
+#fancier - titles come from yt-dlp's file names anyway)
+FIELD = re.compile(r"%\((\w+)\)s")
+UNSAFE = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+#yt-dlp --audio-format rules: "source>target" pairs tried in order, a bare target applies to whatever is left.
+#"best" keeps the source codec (remux only)
+AUDIO_FORMAT = {
+    "mp3": "mp3",
+    "native": "best",
+    "smart": "mp3>mp3/aac>m4a/mp3",
+}
+
+#source codec of a staged (not yet converted) file - youtube audio is opus in webm or aac in m4a
+SOURCE_CODECS = {
+    ".webm": "opus",
+    ".opus": "opus",
+    ".ogg": "vorbis",
+    ".m4a": "aac",
+    ".mp4": "aac",
+    ".aac": "aac",
+    ".mp3": "mp3",
+}
+
+#codec -> (extension, ffmpeg muxer) when kept as is
+CONTAINERS = {
+    "opus": ("opus", "opus"),
+    "vorbis": ("ogg", "ogg"),
+    "aac": ("m4a", "ipod"),
+    "mp3": ("mp3", "mp3"),
+}
+
+
+def valid(profile):
+    return isinstance(profile, dict) and (profile.get("format") in FORMATS or profile.get("format") in CODECS)
+
+
+#builtin profiles + profiles.json - read when a job needs it, so an edited file applies to the next job
+def load_profiles():
+    profiles = {name: dict(profile, name=name) for name, profile in PROFILES.items()}
+    try:
+        with open(data_path("profiles.json"), "r", encoding="utf-8") as f:
+            custom = json.load(f)
+    except (OSError, ValueError):
+        custom = {}
+    if isinstance(custom, dict):
+        for name, profile in custom.items():
+            if valid(profile):
+                profiles[name] = dict(profile, name=name)
+    return profiles
+
+
+#what the download functions take as audio_format: a format/profile name, a profile dict or a list of them ->
+#list of profile dicts, never empty (unknown names are dropped, nothing usable = the default)
+def get_profiles(spec=DEFAULT_FORMAT):
+    known = None
+    profiles = []
+    for item in spec if isinstance(spec, (list, tuple)) else [spec]:
+        if isinstance(item, str):
+            if item in PROFILES:
+                item = dict(PROFILES[item], name=item)
+            else:
+                known = known or load_profiles()
+                item = known.get(item)
+        if valid(item):
+            item = dict(item, name=item.get("name") or item["format"])
+            if item not in profiles:
+                profiles.append(item)
+    return profiles or [dict(PROFILES[DEFAULT_FORMAT], name=DEFAULT_FORMAT)]
+
+
+def audio_format(name):
+    if name in CODECS:
+        return name
+    return AUDIO_FORMAT.get(name, AUDIO_FORMAT[DEFAULT_FORMAT])
+
+
+#bitrate -> yt-dlp's --audio-quality ("0" best vbr, "320K", ...)
+def audio_quality(profile):
+    bitrate = str(profile.get("bitrate") or "")
+    if bitrate[:1].upper() == "V":
+        return bitrate[1:]
+    return bitrate.upper() or "0"
+
+
+#bitrate -> ffmpeg args for this encoder
+def quality_args(profile, codec):
+    bitrate = str(profile.get("bitrate") or "")
+    if codec in LOSSLESS:
+        return []
+    if bitrate[:1].upper() == "V":
+        return ["-q:a", bitrate[1:]]
+    if bitrate:
+        return ["-b:a", bitrate]
+    return ["-q:a", "0"] if codec == "mp3" else []
+
+
+#the -x part of a yt-dlp command line (first profile - several profiles go through the pipeline instead)
+def extract_args(spec=DEFAULT_FORMAT):
+    profile = get_profiles(spec)[0]
+    return ["-x", "--audio-format", audio_format(profile["format"]), "--audio-quality", audio_quality(profile)]
+
+
+#the same for the in-process backend
+def postprocessor(spec=DEFAULT_FORMAT):
+    profile = get_profiles(spec)[0]
+    return {
+        "key": "FFmpegExtractAudio",
+        "preferredcodec": audio_format(profile["format"]),
+        "preferredquality": audio_quality(profile),
+    }
+
+
+#yt-dlp -o for the first profile: its folder under the job's folder, its file name template
+def output_template(output_dir, spec=DEFAULT_FORMAT):
+    profile = get_profiles(spec)[0]
+    folder = os.path.join(output_dir, profile.get("folder") or "")
+    return os.path.join(folder.replace("%", "%%"), (profile.get("template") or DEFAULT_TEMPLATE) + ".%(ext)s")
+
+
+#the same file name for a file the pipeline writes - title is what yt-dlp named the staged file, the other
+#fields come from the extraction's info json
+def output_path(output_dir, profile, title, info, extension):
+    template = profile.get("template") or DEFAULT_TEMPLATE
+    fields = dict(info, title=title)
+    name = FIELD.sub(lambda m: UNSAFE.sub("_", str(fields.get(m.group(1)) or "NA")), template).replace("%%", "%")
+    return os.path.join(output_dir, profile.get("folder") or "", name + "." + extension)
+
+
+#is a source in this codec kept without re-encoding? (an mp3 source never gets encoded twice, a named codec
+#is only copied when no bitrate asks for something else)
+def keeps(profile, codec):
+    name = profile["format"]
+    if name == "native":
+        return codec in CONTAINERS
+    if name == "smart":
+        return codec in ("mp3", "aac")
+    return codec == name and not profile.get("bitrate")
+
+
+#(extension, ffmpeg codec args, muxer) for turning a staged file into one profile's output file
+def convert_plan(spec, source):
+    profile = get_profiles(spec)[0]
+    codec = SOURCE_CODECS.get(os.path.splitext(source)[1].lower())
+    if keeps(profile, codec):
+        extension, muxer = CONTAINERS[codec]
+        return extension, ["-c:a", "copy"], muxer
+    target = profile["format"] if profile["format"] in CODECS else "mp3"
+    extension, encoder, muxer = CODECS[target]
+    return extension, ["-c:a", encoder, *quality_args(profile, target)], muxer
@@ -1,30 +1,35 @@
 #import necessary libraries
 import sys
 import os
+import threading
 
-from ctypes import windll, wintypes
-
+#first, so the import phase is timed too (see startup.py)
+from startup import TIMER, enabled as startup_profile_enabled, scaled_asset_path
 
 #pyside6 stuff
 from PySide6.QtWidgets import (
-    QApplication, QWidget, QLabel, QLineEdit, QPushButton, QStyle, QToolButton, QButtonGroup, QMessageBox,
-    QCheckBox, QFileDialog, QVBoxLayout, QHBoxLayout, QProgressBar, QTabWidget, QTextEdit, QMainWindow
+    QApplication, QWidget, QLabel, QLineEdit, QPushButton, QStyle, QToolButton, QButtonGroup, QMessageBox, QMenu,
+    QCheckBox, QFileDialog, QVBoxLayout, QHBoxLayout, QProgressBar, QTabWidget, QTextEdit, QMainWindow, QSpinBox, QComboBox
 )
 from PySide6.QtGui import QPixmap, QColor, QFont, QIcon
-from PySide6.QtCore import Qt, QThread, Signal, QSettings, QSize, Slot
+from PySide6.QtCore import Qt, QThread, Signal, QSettings, QSize, Slot, QTimer
 
-#other py scripts
-from dlsingle import download_video
-from dlplaylist import download_playlist
-from dl_large_playlist import download_playlist as download_large_playlist
+#other py scripts - the downloaders themselves are imported by runner.run_job when a job starts
+from runner import run_job, pick_backend, apply_overrides, JobControl, JobInterrupted
+from dlconcurrent import DEFAULT_WORKERS, MAX_WORKERS
+from dlqueue import JobQueue
+from progress import ProgressTracker, REFRESH_HZ, format_speed, format_eta
+from results import ResultLog
+from results_view import ResultsWindow
+from pacing import PROFILES as PACING_PROFILES, DEFAULT_PROFILE as DEFAULT_PACING
+from formats import DEFAULT_FORMAT, load_profiles
+from bandwidth import get_budget, parse_rate
+from library import get_library
 
-#libraries for the server which listens for input from the browser extension
-import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
-import json
+#the server which listens for input from the browser extension (and scripts)
+from server import EventHub, start_server
 
-#update check lib
-import urllib.request
+TIMER.mark("imports")
 
 
 #ico path:
@@ -32,9 +37,20 @@ def resource_path(relative_path):
     base = getattr(sys, "_MEIPASS", os.path.dirname(__file__))
     return os.path.join(base, relative_path)
 
-#prevent previous server instances from blocking connection
-class ReusableHTTPServer(HTTPServer):
-    allow_reuse_address = True
+
+#logo scaled once and cached as a small png - the 560 KB original is only decoded when the cache is missing
+def load_logo(width):
+    source = resource_path("logo.png")
+    cached = scaled_asset_path(source, width)
+    if cached and os.path.exists(cached):
+        pixmap = QPixmap(cached)
+        if not pixmap.isNull():
+            return pixmap
+
+    pixmap = QPixmap(source).scaledToWidth(width, Qt.SmoothTransformation)
+    if cached:
+        pixmap.save(cached, "PNG")
+    return pixmap
 
 #COLOR SCHEME
 YOUTUBE_BG = "#ecd6b8"
@@ -47,76 +63,45 @@ WINDOW_CONTROL_HOVER = "#341b0e"
 CLOSE_HOVER = "#c42b1c"
 DLBUTT = "#341b0e"
 
-#THE SERVER - this function allows the browser extension to make requests outside of the browser (to the crateplug standalone)
-class ExtensionRequestHandler(BaseHTTPRequestHandler):
-    gui_instance = None
-
-    def _set_cors_headers(self): #defining CORS
-        self.send_header("Access-Control-Allow-Origin", "*") #allow any website/extension to make requests to this server
-        self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS") #server accepts post and options requests
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-
-    #pre flight check
-    def do_OPTIONS(self): 
-        self.send_response(200) #response of 200 = good to go
-        self._set_cors_headers()
-        self.end_headers()
-
-    #the real deal
-    def do_POST(self):
-        if self.path != "/download": #check for download path
-            self.send_response(404) #error if not dl path
-            self.end_headers()
-            return
-
-        content_length = int(self.headers.get("Content-Length", 0)) #this tells python exactly how much data to read
-        body = self.rfile.read(content_length)
-
-        try:
-            data = json.loads(body) #convert to python dictionary
-            url = data.get("url") #extract url
-
-            if url and ExtensionRequestHandler.gui_instance: #if there's a url and the GUI is open
-                ExtensionRequestHandler.gui_instance.external_url_received.emit(url) #send the url to the GUI input
-
-            self.send_response(200) #tells browser the url was received succesfully
-            self._set_cors_headers() 
-            self.end_headers()
-
-        except Exception: #response for if it doesn't work
-            self.send_response(400)
-            self._set_cors_headers()
-            self.end_headers()
-
-
 #this is the download worker class
 #runs downloads in the background with a separate worker thread - avoid freezing GUI
 class DownloadWorker(QThread):
     
     finished = Signal()
     error = Signal(str)
-    status = Signal(str)
+    interrupted = Signal(str) #paused / preempted / cancelled at an entry boundary (see runner.JobControl)
 
 #runs when the workers is created and receives the input to the GUI
-    def __init__(self, url, output_dir, mode):
+#status and events go straight into thread-safe collectors (no signal per line) - the gui polls them on a timer
+    def __init__(self, url, output_dir, mode, status_callback, event_callback, workers=1, backend="subprocess", options=None, job_id=None, control=None):
         super().__init__() #initialize the Qthread base class to separate downloads and processing of (GUI) code
         self.url = url 
         self.output_dir = output_dir
         self.mode = mode
-
-    #this is what runs in a background thread - pretty self explanatory
+        self.status_callback = status_callback
+        self.event_callback = event_callback
+        self.workers = workers
+        self.options = options or {}
+        self.backend = backend
+        self.job_id = job_id
+        self.control = control
+
+    #this is what runs in a background thread - pretty self explanatory (runner.py has the mode -> downloader mapping)
     def run(self):
         try:
-            if self.mode == "large_playlist":
-                download_large_playlist(self.url, self.output_dir, self.status.emit)
-
-            elif self.mode == "playlist":
-                download_playlist(self.url, self.output_dir, self.status.emit)
-
-            else:
-                download_video(self.url, self.output_dir, self.status.emit)
-
+            run_job(
+                {
+                    "id": self.job_id, "url": self.url, "output_dir": self.output_dir, "mode": self.mode,
+                    "workers": self.workers, "options": self.options,
+                },
+                self.status_callback,
+                self.event_callback,
+                self.backend,
+                self.control,
+            )
             self.finished.emit() #signals for succesful DL
+        except JobInterrupted as e:
+            self.interrupted.emit(e.action)
         except Exception as e:
             self.error.emit(str(e))
 
@@ -124,7 +109,9 @@ class DownloadWorker(QThread):
 
 # MAIN GUI
 class DownloaderGUI(QMainWindow): #main widget
-    external_url_received = Signal(str)
+    external_urls_received = Signal(object, object, object)
+    job_control_received = Signal(object, object, object)
+    update_available = Signal(str, str)
     def __init__(self): #runs when window is created
         super().__init__() #initialize qwidget
         self.setFixedSize(400, 450) #MAIN WINDOW SIZE
@@ -134,23 +121,51 @@ class DownloaderGUI(QMainWindow): #main widget
         self.setWindowFlags(Qt.Window | Qt.FramelessWindowHint)
         self.setAttribute(Qt.WA_StyledBackground, True)
         self.is_downloading = False
+        self.current_job = None
+        self.control = None #JobControl of the running job
+        self.paused_job = None #last job paused from the buttons - what the resume button resumes
+        self.job_error = None
+        self.tracker = ProgressTracker()
+        self.shown_version = -1
+        self.results = ResultLog() #per-entry outcomes for the results window
+        self.results_window = None
 
-    # brwser EXTwension listening server: this jawn right here below:
+        #in-process yt_dlp when it's bundled, yt-dlp.exe otherwise (or if the setting says so)
+        self.backend = pick_backend(self.settings.value("backend", "api"))
 
-        ExtensionRequestHandler.gui_instance = self #this injects the GUI instance into the HTTP request handler (this is why the gui_instance variable  is defined before)
+        #on-disk job queue - anything left over from last session (or a crash) runs again
+        self.queue = JobQueue()
+        self.queue.recover()
 
-        def start_server():
-            server = ReusableHTTPServer(("127.0.0.1", 48721), ExtensionRequestHandler) #create reusable HTTP server on port 48721
-            server.serve_forever()
+        TIMER.mark("state") #settings, job queue
 
-        threading.Thread(target=start_server, daemon=True).start()
+        #style first - set before the widgets exist, qt doesn't have to re-polish every one of them
+        self.apply_style()
+        TIMER.mark("style")
 
 #initialize UI
         self.setup_ui()
         self.load_settings()
-        self.external_url_received.connect(self.handle_external_url) #ensures external urls are always run on the GUI thread
-        self.apply_style()
-        self.check_for_updates()
+        #ensures external urls are always run on the GUI thread - blocking so the server can answer with the job ids
+        self.external_urls_received.connect(self.handle_external_urls, Qt.BlockingQueuedConnection)
+        self.job_control_received.connect(self.handle_job_control, Qt.BlockingQueuedConnection)
+        self.update_available.connect(self.show_update_popup)
+        TIMER.mark("ui build")
+
+    # brwser EXTwension listening server: this jawn right here below:
+        #threaded api on port 48721 - submits come back to the gui thread, job status is read straight from the queue
+        self.hub = EventHub()
+        self.server = start_server(self.submit_external, self.queue, self.hub, self.job_progress, control=self.control_external)
+        TIMER.mark("server bind")
+
+        QTimer.singleShot(0, self.run_next_job)
+        QTimer.singleShot(0, self.check_for_updates) #once the window is up - never blocks startup
+        QTimer.singleShot(0, lambda: self.watch_library(self.path_input.text()))
+
+        #repaint progress at a fixed rate instead of once per yt-dlp line
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000 // REFRESH_HZ)
+        self.refresh_timer.timeout.connect(self.refresh_progress)
 
         #update checkerrrrr - insane that this takes so much code.. fuck makin gui
     def get_local_version(self):
@@ -162,6 +177,8 @@ class DownloaderGUI(QMainWindow): #main widget
 
 
     def get_remote_version(self):
+        import urllib.request #update check lib - only needed on the background thread
+
         try:
             url = "https://raw.githubusercontent.com/becksosa/crateplug/refs/heads/main/version.txt"
             with urllib.request.urlopen(url, timeout=5) as response:
@@ -170,15 +187,19 @@ class DownloaderGUI(QMainWindow): #main widget
             return None
 
 
+    #the request runs on a background thread (up to 5s offline) - the popup comes back through a signal
     def check_for_updates(self):
-        local_version = self.get_local_version()
-        remote_version = self.get_remote_version()
+        def check():
+            local_version = self.get_local_version()
+            remote_version = self.get_remote_version()
 
-        if not remote_version:
-            return
+            if not remote_version:
+                return
 
-        if local_version != remote_version:
-            self.show_update_popup(local_version, remote_version)
+            if local_version != remote_version:
+                self.update_available.emit(local_version, remote_version)
+
+        threading.Thread(target=check, daemon=True).start()
 
 
     def show_update_popup(self, local, remote):
@@ -214,6 +235,28 @@ class DownloaderGUI(QMainWindow): #main widget
             os.path.join(os.path.expanduser("~"), "Downloads")
         )
         self.path_input.setText(saved_path)
+        self.workers_input.setValue(self.parsed_setting("workers", int, DEFAULT_WORKERS))
+        self.pacing_input.setCurrentText(self.settings.value("pacing", DEFAULT_PACING))
+        self.format_input.setCurrentText(self.settings.value("format", DEFAULT_FORMAT))
+        extra = self.settings.value("extra_profiles", "")
+        for action in self.profiles_menu.actions():
+            action.setChecked(action.text() in extra.split(","))
+        self.update_profiles_button()
+        self.analyze_checkbox.setChecked(self.settings.value("analyze", False, type=bool))
+        #connection/bandwidth budget shared by all downloads (bandwidth.py) - no widgets, only set in the saved settings
+        get_budget().configure(self.parsed_setting("max_connections", int), self.parsed_setting("max_rate", parse_rate))
+
+    #a saved value through parse - default (and a note on the console) if it's missing or unreadable, a hand-edited
+    #settings file shouldn't keep the app from starting
+    def parsed_setting(self, key, parse, default=None):
+        value = self.settings.value(key)
+        if value is None or value == "":
+            return default
+        try:
+            return parse(value)
+        except (TypeError, ValueError):
+            print(f"ignoring bad setting {key}={value!r}")
+            return default
 
 
     # enable window dragging
@@ -230,12 +273,45 @@ class DownloaderGUI(QMainWindow): #main widget
             )
             self.drag_pos = event.globalPosition().toPoint()
  
-#browser extension url
-    def handle_external_url(self, url):
-        if self.is_downloading:
-            return
-        self.url_input.setText(url)
-        self.start_download()
+#browser extension / api urls - always queued, even while something else is downloading
+    def handle_external_urls(self, urls, options, ids):
+        ids.extend(self.enqueue(url, options) for url in urls)
+
+    #called on a server thread - returns a job id (or None) per url once the gui thread queued them
+    def submit_external(self, urls, options):
+        ids = []
+        self.external_urls_received.emit(urls, options, ids)
+        return ids
+
+    #api pause/resume/cancel - also handled on the gui thread, it owns the running job
+    def handle_job_control(self, job_id, action, result):
+        result.append(self.control_job(job_id, action))
+
+    def control_external(self, job_id, action):
+        result = []
+        self.job_control_received.emit(job_id, action, result)
+        return result[0]
+
+    #server thread: live progress for a job, None unless it's the one running
+    def job_progress(self, job_id):
+        job = self.current_job
+        if job is None or job["id"] != job_id:
+            return None
+        return self.tracker.snapshot()
+
+    #checked extra profiles, minus the one already picked as the format
+    def extra_profiles(self):
+        primary = self.format_input.currentText()
+        return [action.text() for action in self.profiles_menu.actions() if action.isChecked() and action.text() != primary]
+
+    def save_extra_profiles(self):
+        self.settings.setValue("extra_profiles", ",".join(action.text() for action in self.profiles_menu.actions() if action.isChecked()))
+        self.update_profiles_button()
+
+    def update_profiles_button(self):
+        extra = self.extra_profiles()
+        self.profiles_btn.setText(f"+{len(extra)}" if extra else "+")
+        self.profiles_btn.setToolTip("also write: " + ", ".join(extra) if extra else "write more formats from the same download")
 
     #check 4 valid url - this runs before anything even gets sent to yt-dlp so we dont start trying to download bullshit requests if we know it wont work preemptively
     def is_valid_youtube_url(self, url):
@@ -262,6 +338,47 @@ class DownloaderGUI(QMainWindow): #main widget
         self.output_box.clear()    
         self.output_box.setText(text)
 
+#every structured event from the download thread(s) - both collectors are thread safe
+    def on_event(self, event):
+        self.tracker.update(event)
+        self.results.update(event)
+
+    def show_results(self):
+        if self.results_window is None:
+            self.results_window = ResultsWindow(self.results)
+        self.results_window.show()
+        self.results_window.raise_()
+
+#pull the latest coalesced progress from the tracker - only repaints when something changed
+    def refresh_progress(self):
+        if self.results_window:
+            self.results_window.refresh()
+
+        snap = self.tracker.snapshot()
+        if snap["version"] == self.shown_version:
+            return
+        self.shown_version = snap["version"]
+        if self.current_job:
+            self.hub.publish("progress", {"job": self.current_job["id"], **snap})
+
+        if snap["track"] is not None:
+            self.progress.setRange(0, 1000)
+            self.progress.setValue(int(snap["track"] * 1000))
+
+        if snap["playlist"] is not None:
+            self.playlist_progress.setVisible(True)
+            self.playlist_progress.setValue(int(snap["playlist"] * 1000))
+
+        text = snap["status"]
+        if snap["speed"]:
+            extra = format_speed(snap["speed"])
+            if snap["eta"] is not None:
+                extra += f" - eta {format_eta(snap['eta'])}"
+            text = f"{text}\n{extra}" if text else extra
+
+        if text != self.output_box.text():
+            self.append_output(text)
+
 #vertical layout, stack top to bottom
     def setup_ui(self):
         central = QWidget(self)
@@ -319,13 +436,7 @@ class DownloaderGUI(QMainWindow): #main widget
         logo = QLabel()
         logo.setAlignment(Qt.AlignCenter)
         logo.setContentsMargins(0, 18, 0, 0)
-        pixmap = QPixmap(resource_path("logo.png"))
-        logo.setPixmap(
-            pixmap.scaledToWidth(
-            300,  #  increase width here
-            Qt.SmoothTransformation
-        )
-)
+        logo.setPixmap(load_logo(300)) #  increase width here
         container_layout.addWidget(logo) #adds logo to layout
 
         # CONTENT WRAPPER (everything except controls)
@@ -383,10 +494,64 @@ class DownloaderGUI(QMainWindow): #main widget
             lambda checked: checked and self.playlist_checkbox.setChecked(False)
         )
 
+        #how many playlist entries download at once (1 = old one-process-per-playlist behaviour)
+        self.workers_input = QSpinBox()
+        self.workers_input.setRange(1, MAX_WORKERS)
+        self.workers_input.setPrefix("x")
+        self.workers_input.setToolTip("parallel downloads in playlist mode")
+        self.workers_input.setFont(small_font)
+        self.workers_input.valueChanged.connect(lambda value: self.settings.setValue("workers", value))
+
         checkbox_layout.addWidget(self.playlist_checkbox)
         checkbox_layout.addWidget(self.large_playlist_checkbox)
 
+        #output format - mp3 re-encodes everything, native keeps the source codec, smart only encodes what isn't mp3/aac
+        #(plus the other builtin profiles and whatever is in profiles.json, see formats.py)
+        profile_names = list(load_profiles())
+        self.format_input = QComboBox()
+        self.format_input.addItems(profile_names)
+        self.format_input.setToolTip("mp3: always re-encode / native: keep opus, aac... as is / smart: mp3 unless already mp3 or aac")
+        self.format_input.setFont(small_font)
+        self.format_input.currentTextChanged.connect(lambda value: self.settings.setValue("format", value))
+        checkbox_layout.addWidget(self.format_input)
+
+        #extra profiles written from the same download (e.g. a flac copy next to the mp3)
+        self.profiles_menu = QMenu(self)
+        for name in profile_names:
+            action = self.profiles_menu.addAction(name)
+            action.setCheckable(True)
+            action.toggled.connect(self.save_extra_profiles)
+        self.profiles_btn = QToolButton()
+        self.profiles_btn.setMenu(self.profiles_menu)
+        self.profiles_btn.setPopupMode(QToolButton.InstantPopup)
+        self.profiles_btn.setFont(small_font)
+        self.profiles_btn.setCursor(Qt.PointingHandCursor)
+        self.format_input.currentTextChanged.connect(self.update_profiles_button)
+        checkbox_layout.addWidget(self.profiles_btn)
+
+        #bpm/key/loudness tags and a waveform overview for every downloaded file (analysis.py)
+        self.analyze_checkbox = QCheckBox("Analyze")
+        self.analyze_checkbox.setToolTip("tag bpm, key and loudness into every file, waveforms in the results view")
+        self.analyze_checkbox.setCursor(Qt.PointingHandCursor)
+        self.analyze_checkbox.setFont(small_font)
+        self.analyze_checkbox.toggled.connect(lambda checked: self.settings.setValue("analyze", checked))
+        checkbox_layout.addWidget(self.analyze_checkbox)
+
         checkbox_layout.addStretch()  # pushes the jawns above to da left - only 1 check now but i left it like this in case we add another
+        checkbox_layout.addWidget(self.workers_input)
+
+        #large playlist pacing - adaptive backs off only when rate limited, conservative = old fixed 5-10s sleeps
+        self.pacing_input = QComboBox()
+        self.pacing_input.addItems(PACING_PROFILES)
+        self.pacing_input.setToolTip("pacing between large playlist downloads")
+        self.pacing_input.setFont(small_font)
+        self.pacing_input.setVisible(False)
+        self.pacing_input.currentTextChanged.connect(lambda value: self.settings.setValue("pacing", value))
+        checkbox_layout.addWidget(self.pacing_input)
+
+        #the workers box is for playlist mode, the pacing box for large playlist mode
+        self.large_playlist_checkbox.toggled.connect(self.pacing_input.setVisible)
+        self.large_playlist_checkbox.toggled.connect(lambda checked: self.workers_input.setVisible(not checked))
 
         content_layout.addLayout(checkbox_layout)
 
@@ -397,19 +562,48 @@ class DownloaderGUI(QMainWindow): #main widget
         self.download_btn.setCursor(Qt.PointingHandCursor)
         content_layout.addWidget(self.download_btn)
 
+        #top bar = current track(s), bottom bar = position in the playlist
         self.progress = QProgressBar()
         self.progress.setFixedWidth(260)
         self.progress.setFixedHeight(10)
         self.progress.setTextVisible(False)
         self.progress.setVisible(False)
 
+        self.playlist_progress = QProgressBar()
+        self.playlist_progress.setFixedWidth(260)
+        self.playlist_progress.setFixedHeight(4)
+        self.playlist_progress.setTextVisible(False)
+        self.playlist_progress.setRange(0, 1000)
+        self.playlist_progress.setVisible(False)
+
+        bars = QVBoxLayout()
+        bars.setContentsMargins(0, 0, 0, 0)
+        bars.setSpacing(2)
+        bars.addWidget(self.progress)
+        bars.addWidget(self.playlist_progress)
+
+        #pause/resume + cancel for the running (or last paused) job
+        self.pause_btn = QToolButton()
+        self.pause_btn.setFixedSize(16, 16)
+        self.pause_btn.setCursor(Qt.PointingHandCursor)
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.cancel_btn = QToolButton()
+        self.cancel_btn.setIcon(style.standardIcon(QStyle.SP_MediaStop))
+        self.cancel_btn.setToolTip("cancel")
+        self.cancel_btn.setFixedSize(16, 16)
+        self.cancel_btn.setCursor(Qt.PointingHandCursor)
+        self.cancel_btn.clicked.connect(self.cancel_job)
+
         progress_wrap = QWidget()
         progress_layout = QHBoxLayout(progress_wrap)
         progress_layout.setContentsMargins(0, 0, 0, 0)  
         progress_layout.addStretch()
-        progress_wrap.setFixedHeight(14)  
-        progress_layout.addWidget(self.progress)
+        progress_wrap.setFixedHeight(16)  
+        progress_layout.addLayout(bars)
+        progress_layout.addWidget(self.pause_btn)
+        progress_layout.addWidget(self.cancel_btn)
         progress_layout.addStretch()
+        self.update_job_buttons()
 
         content_layout.addWidget(progress_wrap)
 
@@ -444,8 +638,16 @@ class DownloaderGUI(QMainWindow): #main widget
         docs_link.setOpenExternalLinks(True)
         docs_link.setCursor(Qt.PointingHandCursor)
 
+        results_link = QLabel(
+            '<a style="color:#D9D9C3;" href="#results">'
+            'Results</a>'
+        )
+        results_link.linkActivated.connect(self.show_results)
+        results_link.setCursor(Qt.PointingHandCursor)
+
         footer_layout.addWidget(discord_link)
         footer_layout.addWidget(docs_link)
+        footer_layout.addWidget(results_link)
 
         footer_layout.addStretch()
 
@@ -462,41 +664,44 @@ class DownloaderGUI(QMainWindow): #main widget
         if folder:
             self.path_input.setText(folder)
             self.settings.setValue("download_folder", folder)
+            self.watch_library(folder)
+
+    #index the folder in the background (library.py) so the first duplicate check doesn't wait for a big crate scan
+    def watch_library(self, folder):
+        if os.path.isdir(folder):
+            threading.Thread(target=lambda: get_library().watch(folder), daemon=True).start()
 
 #trigget download when button clicked
     #get url and output dir
     def start_download(self):
-        if self.is_downloading:
-            return
-        
         url = self.url_input.text().strip()
+        if self.enqueue(url):
+            self.url_input.clear()
+
+    #validate and put a url in the queue with the current folder/mode - returns the job id (None if it wasn't queued)
+    #api submits can override mode/format/pacing/workers, the folder always comes from the app
+    def enqueue(self, url, overrides=None):
+        url = url.strip()
         output_dir = self.path_input.text().strip()
+        overrides = overrides or {}
 
 
         if not url or not output_dir:
-            return
+            return None
 
         valid, error = self.is_valid_download_path(output_dir)
         if not valid:
             self.output_box.clear()
             self.append_output(f"invalid download path: {error}")
-            return
+            return None
 
 
 
         if not self.is_valid_youtube_url(url):
             self.output_box.clear()
             self.append_output("invalid url")
-            return
-            self.output_box.clear()
-
-        # UI state
-        self.is_downloading = True
-        self.download_btn.setEnabled(False)
-        self.progress.setVisible(True)
-        self.progress.setRange(0, 0)  # indeterminate mode
+            return None
 
-        # Start worker - for separate dl
         if self.large_playlist_checkbox.isChecked():
             mode = "large_playlist"
         elif self.playlist_checkbox.isChecked():
@@ -504,26 +709,149 @@ class DownloaderGUI(QMainWindow): #main widget
         else:
             mode = "single"
 
+        options = {"pacing": self.pacing_input.currentText(), "format": self.format_input.currentText()}
+        extra = self.extra_profiles()
+        if extra:
+            options["profiles"] = [options["format"], *extra]
+        if self.analyze_checkbox.isChecked():
+            options["analyze"] = True
+        mode, workers, options = apply_overrides(mode, self.workers_input.value(), options, overrides)
+
+        job_id = self.queue.add(url, output_dir, mode, workers, options)
+        self.hub.publish("job", {"id": job_id, "status": "pending", "url": url, "mode": mode})
+
+        if self.is_downloading:
+            if self.preempt():
+                self.append_output("making way - current download pauses after this track")
+            else:
+                self.append_output(f"queued ({self.queue.pending_count()} waiting)")
+        else:
+            self.run_next_job()
+        return job_id
+
+    #a single track waiting behind a playlist - the playlist pauses at its next entry and goes back in line behind it
+    def preempt(self):
+        if self.current_job is None or self.control is None:
+            return False
+        priority = self.queue.next_priority()
+        if priority is None or priority <= self.current_job["priority"]:
+            return False
+        self.control.request("preempt")
+        return True
+
+    #pause / resume / cancel - the running job through its control, anything else right in the queue (same as runner.Runner)
+    def control_job(self, job_id, action):
+        if self.current_job and self.current_job["id"] == job_id and self.control:
+            if action == "resume" and self.control.requested != "pause":
+                return False
+            self.control.request(action)
+            if action != "resume":
+                self.append_output("cancelling..." if action == "cancel" else "pausing after this track")
+            return True
+
+        changed = getattr(self.queue, action)(job_id)
+        if changed:
+            self.hub.publish("job", self.queue.get(job_id))
+            if job_id == self.paused_job and action != "pause":
+                self.paused_job = None
+            self.update_job_buttons()
+            if action == "resume":
+                self.run_next_job()
+        return changed
+
+    def toggle_pause(self):
+        if self.current_job:
+            self.control_job(self.current_job["id"], "pause")
+        elif self.paused_job:
+            self.control_job(self.paused_job, "resume")
+
+    def cancel_job(self):
+        job_id = self.current_job["id"] if self.current_job else self.paused_job
+        if job_id:
+            self.control_job(job_id, "cancel")
+
+    def update_job_buttons(self):
+        paused = self.current_job is None and self.paused_job is not None
+        self.pause_btn.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay if paused else QStyle.SP_MediaPause))
+        self.pause_btn.setToolTip("resume" if paused else "pause after this track")
+        for button in (self.pause_btn, self.cancel_btn):
+            button.setVisible(self.current_job is not None or paused)
+
+    #start the oldest queued job if nothing is running
+    def run_next_job(self):
+        if self.is_downloading:
+            return
+
+        job = self.queue.take_next()
+        if job is None:
+            return
+
+        self.current_job = job
+        self.control = JobControl()
+        self.job_error = None
+        self.hub.publish("job", {"id": job["id"], "status": job["status"], "url": job["url"], "mode": job["mode"]})
+        self.update_job_buttons()
+
+        # UI state
+        self.is_downloading = True
+        self.progress.setVisible(True)
+        self.progress.setRange(0, 0)  # indeterminate until the first progress line comes in
+        self.playlist_progress.setValue(0)
+        self.tracker.reset()
+        self.results.begin_job(job["id"], bool((job.get("options") or {}).get("analyze")))
+        self.shown_version = -1
+        self.refresh_timer.start()
+
+        # Start worker - for separate dl
         self.worker = DownloadWorker(
-            url,
-            output_dir,
-            mode,
+            job["url"],
+            job["output_dir"],
+            job["mode"],
+            self.tracker.set_status,
+            self.on_event,
+            job["workers"],
+            self.backend,
+            job["options"],
+            job["id"],
+            self.control,
         )
 
         self.worker.finished.connect(self.download_finished)
         self.worker.error.connect(self.download_error)
-        self.worker.status.connect(self.append_output)
+        self.worker.interrupted.connect(self.download_interrupted)
         self.worker.start()
 #signal for finished
     def download_finished(self):
+        if self.current_job:
+            self.queue.finish(self.current_job["id"], self.job_error)
+            self.hub.publish("job", self.queue.get(self.current_job["id"]))
+            self.current_job = None
+
+        self.control = None
+        self.update_job_buttons()
         self.is_downloading = False
+        self.refresh_timer.stop()
+        self.refresh_progress() #last status of the job
         self.progress.setRange(0, 1)
         self.progress.setVisible(False)
-        self.download_btn.setEnabled(True)
+        self.playlist_progress.setVisible(False)
+        self.run_next_job() #keep going until the queue is empty
+#signal for a job stopped at an entry boundary - preempted jobs are back in the queue and run again after
+#what's more urgent, paused ones wait for the resume button / api, cancelled ones are done
+    def download_interrupted(self, action):
+        if self.current_job:
+            self.queue.interrupt(self.current_job["id"], action)
+            self.hub.publish("job", self.queue.get(self.current_job["id"]))
+            if action == "pause":
+                self.paused_job = self.current_job["id"]
+            self.current_job = None
+        self.tracker.set_status({"preempt": "paused for a more urgent download", "pause": "paused", "cancel": "cancelled"}[action])
+        self.download_finished()
+
 # signal for error
     def download_error(self, message):
-        print("Error:", message)
-        self.is_downloading = False
+        self.job_error = message
+        self.tracker.set_status(f"download failed: {message}")
         self.download_finished()
 
     def apply_style(self):
@@ -587,6 +915,14 @@ QCheckBox {{
     color: #000000;
 }}
 
+QSpinBox, QComboBox {{
+    background-color: {YOUTUBE_SURFACE};
+    border: 1px solid {BORDER_COLOR};
+    color: #000000;
+    padding: 2px;
+    border-radius: 2px;
+}}
+
 QProgressBar {{
     background-color: {YOUTUBE_SURFACE};
     border-radius: 6px;
@@ -609,16 +945,30 @@ QProgressBar::chunk {{
 
 
 if __name__ == "__main__":
+    #the analysis workers (analysis.py) are this exe started again - in the frozen build they stop here
+    from multiprocessing import freeze_support
+    freeze_support()
     APP_ID = "com.crateplug.downloader"
-    windll.shell32.SetCurrentProcessExplicitAppUserModelID(APP_ID)
+    if sys.platform == "win32": #own taskbar icon on windows
+        from ctypes import windll
+        windll.shell32.SetCurrentProcessExplicitAppUserModelID(APP_ID)
     app = QApplication(sys.argv) #start gui engine
     app.setApplicationName("crateplug")
     app.setApplicationDisplayName("crateplug")
     app.setWindowIcon(QIcon(resource_path("icon.ico")))
 
     app.setFont(QFont("IBM Plex Sans", 10))
+    TIMER.mark("qt init")
 
     window = DownloaderGUI() #create window
     window.setWindowIcon(QIcon(resource_path("icon.ico")))
     window.show() #show dat mf
+
+    #first event loop tick = the window can take input
+    def interactive():
+        TIMER.mark("shown")
+        if startup_profile_enabled():
+            TIMER.dump()
+    QTimer.singleShot(0, interactive)
+
     sys.exit(app.exec()) #close that mf cleanly when its done
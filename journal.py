@@ -0,0 +1,174 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from appdata import data_path
+from classifier import FAILURES
+
+#per-entry checkpoint journal for large playlists. every run (playlist url + output folder) keeps its flat
+#listing and one row per entry: queued -> fetched -> transcoded -> done, or failed with a reason.
+#if the app closes, crashes or the pc sleeps, the next run of the same playlist+folder picks up the cached
+#listing and only the unfinished entries - yt-dlp reuses the .part / not yet converted files it left behind
+
+QUEUED = "queued"
+FETCHED = "fetched"
+TRANSCODED = "transcoded"
+DONE = "done"
+FAILED = "failed"
+
+#failures worth another try on resume - the rest (private, removed, members-only...) won't change
+TRANSIENT = {"network", "rate_limited", "stalled", "error"}
+
+#what the listing keeps per entry (enough for both backends to download it without listing again)
+ENTRY_FIELDS = ("index", "ie_key", "id", "url", "title", "duration")
+
+
+def run_key(url, output_dir):
+    return hashlib.sha1(f"{url}\0{output_dir}".encode("utf-8")).hexdigest()
+
+
+class Journal:
+
+    def __init__(self, path=None):
+        self.path = path or data_path("journal.db")
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                output_dir TEXT NOT NULL,
+                listing TEXT,
+                created REAL NOT NULL
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                run_key TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                video_id TEXT,
+                state TEXT NOT NULL,
+                reason TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (run_key, idx)
+            )
+        """)
+
+    def open_run(self, url, output_dir):
+        key = run_key(url, output_dir)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR IGNORE INTO runs (run_key, url, output_dir, created) VALUES (?, ?, ?, ?)",
+                (key, url, output_dir, time.time())
+            )
+        return Run(self, key)
+
+
+class Run:
+
+    def __init__(self, journal, key):
+        self.journal = journal
+        self.db = journal.db
+        self.lock = journal.lock
+        self.key = key
+        with self.lock:
+            rows = self.db.execute("SELECT idx, state, reason FROM entries WHERE run_key = ?", (key,)).fetchall()
+        self.states = {idx: (state, reason) for idx, state, reason in rows} #in memory so events don't hit the db twice
+
+    #cached flat listing from an interrupted run, or None
+    def listing(self):
+        with self.lock:
+            row = self.db.execute("SELECT listing FROM runs WHERE run_key = ?", (self.key,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def save_listing(self, entries):
+        listing = [{field: entry.get(field) for field in ENTRY_FIELDS} for entry in entries]
+        with self.lock:
+            self.db.execute("UPDATE runs SET listing = ? WHERE run_key = ?", (json.dumps(listing), self.key))
+
+    #add entries that aren't journaled yet as queued
+    def queue(self, entries):
+        now = time.time()
+        rows = [(self.key, e["index"], e.get("id"), QUEUED, now) for e in entries if e["index"] not in self.states]
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR IGNORE INTO entries (run_key, idx, video_id, state, updated) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self.db.execute("COMMIT")
+        for row in rows:
+            self.states[row[1]] = (QUEUED, None)
+
+    #entries that still need work (anything not done, plus failures that may work this time)
+    def pending(self, entries):
+        todo = []
+        for entry in entries:
+            state, reason = self.states.get(entry["index"], (QUEUED, None))
+            if state == DONE or state == FAILED and reason not in TRANSIENT:
+                continue
+            todo.append(entry)
+        return todo
+
+    def counts(self):
+        counts = {}
+        for state, _ in self.states.values():
+            counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    def mark(self, index, state, reason=None):
+        if self.states.get(index) == (state, reason):
+            return
+        with self.lock:
+            self.db.execute(
+                "UPDATE entries SET state = ?, reason = ?, updated = ? WHERE run_key = ? AND idx = ?",
+                (state, reason, time.time(), self.key, index)
+            )
+        self.states[index] = (state, reason)
+
+    #follow the event stream of the download
+    def record(self, event):
+        index = event.index
+        if index is None or index not in self.states:
+            return
+
+        state = self.states[index][0]
+        if event.category == "progress":
+            p = event.data
+            if state == QUEUED and p.total and p.downloaded and p.downloaded >= p.total:
+                self.mark(index, FETCHED)
+        elif event.category == "transcoded":
+            self.mark(index, TRANSCODED)
+        elif event.category == "done":
+            self.mark(index, DONE)
+        elif event.category in FAILURES and state != DONE:
+            self.mark(index, FAILED, event.category)
+
+    #wrap an event callback so the journal sees every event first
+    def follow(self, event_callback=None):
+        def on_event(event):
+            self.record(event)
+            if event_callback:
+                event_callback(event)
+        return on_event
+
+    #everything finished - forget the run so the next sync of this playlist lists it fresh
+    def close(self):
+        with self.lock:
+            self.db.execute("DELETE FROM entries WHERE run_key = ?", (self.key,))
+            self.db.execute("DELETE FROM runs WHERE run_key = ?", (self.key,))
+        self.states = {}
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_journal():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Journal()
+        return _shared
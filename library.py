@@ -0,0 +1,302 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from appdata import data_path
+
+#index of the audio files in every download folder - video id, normalized title and duration -> file.
+#all modes ask it before extracting anything, so a re-posted url or a track that's already in the crate
+#(downloaded by hand, renamed, from another tool) is skipped without a directory scan per request.
+#a match by title alone needs the duration on both sides - scanned files don't have one, so those are only
+#reported as possible duplicates (see listing.diff_playlist), never skipped
+#kept current two ways:
+#  - finished downloads are added as they land (with their video id, which the filename doesn't carry)
+#  - a background scan every SCAN_INTERVAL, stat based: a directory whose mtime didn't move isn't listed
+#    again, and only new/changed/removed files in the ones that did get touched in the db
+#a folder seen for the first time is scanned right away, so the first lookup is already complete
+
+SCAN_INTERVAL = 60
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".opus", ".ogg", ".flac", ".wav")
+DURATION_SLACK = 3 #seconds - same title but a clearly different length (extended mix, radio edit) isn't a duplicate
+FRESH_MTIME = 2 #a directory modified this recently may change again within the same mtime tick - rescan it next time
+
+
+#"Song: Title (Remix)" and yt-dlp's sanitized "Song： Title (Remix).mp3" both -> "songtitleremix"
+def normalize_title(title):
+    return re.sub(r"[\W_]+", "", title.casefold())
+
+
+def folder_key(folder):
+    return os.path.normcase(os.path.abspath(folder))
+
+
+def is_audio(name):
+    return os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+
+
+def title_key(path):
+    return normalize_title(os.path.splitext(os.path.basename(path))[0])
+
+
+class LibraryIndex:
+
+    def __init__(self, path=None):
+        self.path = path or data_path("library.db")
+        self.lock = threading.Lock()
+        self.scan_lock = threading.Lock() #one scan at a time, lookups don't wait for it
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                folder TEXT NOT NULL,
+                dir TEXT NOT NULL,
+                title_key TEXT NOT NULL,
+                video_id TEXT,
+                duration REAL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_title ON files (folder, title_key)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_video ON files (folder, video_id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_dir ON files (dir)")
+        #every directory under a watched folder with the mtime it had when it was last listed
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                folder TEXT NOT NULL,
+                parent TEXT,
+                mtime REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)")
+
+        self.watched = set()
+        self.thread = None
+
+    #keep this folder indexed - scanned now if it never was, then by the background thread
+    def watch(self, folder):
+        folder = folder_key(folder)
+        with self.lock:
+            new = folder not in self.watched
+            self.watched.add(folder)
+            scanned = self.db.execute("SELECT 1 FROM dirs WHERE path = ?", (folder,)).fetchone()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.scan_loop, daemon=True)
+                self.thread.start()
+        if new and not scanned:
+            self.refresh(folder)
+
+    def scan_loop(self):
+        while True:
+            time.sleep(SCAN_INTERVAL)
+            with self.lock:
+                folders = list(self.watched)
+            for folder in folders:
+                try:
+                    self.refresh(folder)
+                except (OSError, sqlite3.Error):
+                    pass #folder gone or unreadable - try again next round
+
+    #walk the folder, listing only directories whose mtime moved since last time. returns files added/updated/removed
+    def refresh(self, folder):
+        folder = folder_key(folder)
+        changed = 0
+        with self.scan_lock:
+            seen = set()
+            stack = [(folder, None)]
+            while stack:
+                directory, parent = stack.pop()
+                try:
+                    mtime = os.stat(directory).st_mtime
+                except OSError:
+                    continue
+                seen.add(directory)
+
+                with self.lock:
+                    row = self.db.execute("SELECT mtime FROM dirs WHERE path = ?", (directory,)).fetchone()
+                    if row and row[0] == mtime:
+                        subdirs = [path for (path,) in self.db.execute("SELECT path FROM dirs WHERE parent = ?", (directory,))]
+                        stack.extend((path, directory) for path in subdirs)
+                        continue
+
+                subdirs, count = self.list_directory(folder, directory, parent, mtime)
+                changed += count
+                stack.extend((path, directory) for path in subdirs)
+
+            #directories that went away since the last scan
+            with self.lock:
+                gone = [path for (path,) in self.db.execute("SELECT path FROM dirs WHERE folder = ?", (folder,)) if path not in seen]
+                if gone:
+                    self.db.execute("BEGIN")
+                    for path in gone:
+                        changed += self.db.execute("DELETE FROM files WHERE dir = ?", (path,)).rowcount
+                        self.db.execute("DELETE FROM dirs WHERE path = ?", (path,))
+                    self.db.execute("COMMIT")
+        return changed
+
+    #list one changed directory and bring its rows up to date - returns (subdirectories, files changed)
+    def list_directory(self, folder, directory, parent, mtime):
+        files = {}
+        subdirs = []
+        try:
+            with os.scandir(directory) as it:
+                for item in it:
+                    try:
+                        if item.is_dir(follow_symlinks=False):
+                            subdirs.append(os.path.normcase(item.path))
+                        elif is_audio(item.name) and item.is_file():
+                            stat = item.stat()
+                            files[os.path.normcase(item.path)] = (stat.st_size, stat.st_mtime)
+                    except OSError:
+                        continue
+        except OSError:
+            return [], 0
+
+        changed = 0
+        with self.lock:
+            known = {path: (size, file_mtime) for path, size, file_mtime in self.db.execute(
+                "SELECT path, size, mtime FROM files WHERE dir = ?", (directory,)
+            )}
+            self.db.execute("BEGIN")
+            for path in known.keys() - files.keys():
+                self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+                changed += 1
+            for path, (size, file_mtime) in files.items():
+                if path not in known:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO files (path, folder, dir, title_key, size, mtime) VALUES (?, ?, ?, ?, ?, ?)",
+                        (path, folder, directory, title_key(path), size, file_mtime)
+                    )
+                    changed += 1
+                elif known[path] != (size, file_mtime):
+                    #rewritten in place (re-tagged, re-encoded) - same track, keep its id and duration
+                    self.db.execute("UPDATE files SET size = ?, mtime = ? WHERE path = ?", (size, file_mtime, path))
+                    changed += 1
+            recent = time.time() - mtime < FRESH_MTIME
+            self.db.execute(
+                "INSERT OR REPLACE INTO dirs (path, folder, parent, mtime) VALUES (?, ?, ?, ?)",
+                (directory, folder, parent, -1 if recent else mtime)
+            )
+            self.db.execute("COMMIT")
+        return subdirs, changed
+
+    #a finished download (a "done" event) - indexed right away, with the id and duration the file name doesn't have
+    def record(self, event, folder):
+        if event.category != "done" or not event.path:
+            return
+        path = os.path.normcase(os.path.abspath(event.path))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+
+        folder = folder_key(folder)
+        if not path.startswith(folder + os.sep):
+            return
+        info = cached_info(event.extractor, event.video_id)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO files (path, folder, dir, title_key, video_id, duration, size, mtime) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, folder, os.path.dirname(path), title_key(path), event.video_id, info.get("duration"), stat.st_size, stat.st_mtime)
+            )
+
+    #path of the file for this video in the folder - by id, else by title with a matching duration
+    def find(self, folder, video_id=None, title=None, duration=None):
+        folder = folder_key(folder)
+        rows = []
+        with self.lock:
+            if video_id:
+                rows = self.db.execute("SELECT path FROM files WHERE folder = ? AND video_id = ?", (folder, video_id)).fetchall()
+            if not rows and title:
+                rows = [
+                    (path,) for path, known in self.db.execute(
+                        "SELECT path, duration FROM files WHERE folder = ? AND title_key = ?", (folder, normalize_title(title))
+                    )
+                    if same_length(known, duration)
+                ]
+        #the index can be up to one scan behind a file deleted by hand
+        for (path,) in rows:
+            if os.path.exists(path):
+                return path
+        return None
+
+    #the playlist diff - which listed entries are already in the folder, one query for the whole listing.
+    #True by id or by title + duration, None for a title match where a length is unknown (files found by the
+    #folder scan have none) - could be the same track, could be another "Intro", so it isn't skipped
+    def present(self, folder, entries):
+        folder = folder_key(folder)
+        with self.lock:
+            rows = self.db.execute("SELECT video_id, title_key, duration FROM files WHERE folder = ?", (folder,)).fetchall()
+
+        ids = {video_id for video_id, _, _ in rows if video_id}
+        titles = {}
+        for _, key, duration in rows:
+            titles.setdefault(key, []).append(duration)
+
+        found = []
+        for entry in entries:
+            if entry.get("id") in ids:
+                found.append(True)
+                continue
+            durations = titles.get(normalize_title(entry["title"])) if entry.get("title") else None
+            if not durations:
+                found.append(False)
+            elif any(same_length(known, entry.get("duration")) for known in durations):
+                found.append(True)
+            else:
+                unknown = entry.get("duration") is None or None in durations
+                found.append(None if unknown else False)
+        return found
+
+    def stats(self, folder=None):
+        with self.lock:
+            if folder:
+                count = self.db.execute("SELECT COUNT(*) FROM files WHERE folder = ?", (folder_key(folder),)).fetchone()[0]
+            else:
+                count = self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return {"files": count, "folders": len(self.watched)}
+
+
+#a title match only counts with both lengths known and close
+def same_length(known, duration):
+    return known is not None and duration is not None and abs(known - duration) <= DURATION_SLACK
+
+
+#title/duration from the metadata cache's info json, {} if it isn't cached
+def cached_info(extractor, video_id):
+    from metacache import get_metacache
+
+    path = get_metacache().peek(extractor, video_id)
+    if not path:
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+#single-video urls: by id, else by the title/duration of a cached extraction (no network either way)
+def find_video(folder, extractor, video_id):
+    library = get_library()
+    library.watch(folder)
+    info = cached_info(extractor, video_id)
+    return library.find(folder, video_id, info.get("title"), info.get("duration"))
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+#one index per process, shared by every mode and worker thread
+def get_library():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = LibraryIndex()
+        return _shared
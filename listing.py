@@ -0,0 +1,119 @@
+from classifier import OutputParser
+from binaries import binary
+from supervisor import Supervised, STALL_RETRIES
+from library import get_library
+
+#cheap pre-pass for the playlist modes: list the playlist with a flat extraction (ids, titles, durations -
+#no per-video pages), compare it with the archive index and the files already in the output folder,
+#and only send what's missing to the downloader
+
+FLAT_TEMPLATE = "%(ie_key)s\t%(id)s\t%(url)s\t%(duration)s\t%(title)s"
+
+#long item lists go to yt-dlp as -I ranges, past this the command line gets too long for windows
+MAX_ITEMS_ARG = 8000
+
+
+def list_playlist(url, status_callback):
+    command = [
+        binary("yt-dlp"),
+        "--flat-playlist",
+        "--print", FLAT_TEMPLATE,
+        url,
+    ]
+
+    #a listing that hangs is killed and started over - a partial one would make the diff look like
+    #most of the playlist is gone
+    for attempt in range(STALL_RETRIES + 1):
+        process = Supervised(command, encoding="utf-8", errors="replace")
+        parser = OutputParser()
+        entries = []
+        for line in process.lines():
+            line = line.strip()
+            parts = line.split("\t", 4)
+
+            if len(parts) == 5:
+                ie_key, video_id, entry_url, duration, title = parts
+                entries.append({
+                    "index": len(entries) + 1,
+                    "ie_key": ie_key,
+                    "id": video_id,
+                    #flat entries normally carry the watch url, fall back to the id if they dont
+                    "url": entry_url if entry_url != "NA" else video_id,
+                    "duration": float(duration) if duration not in ("NA", "None") else None,
+                    "title": title,
+                })
+                continue
+
+            event = parser.classify(line)
+            if event:
+                status_callback(event.message)
+
+        if not process.stalled:
+            return entries
+        status_callback(f"playlist listing stalled ({process.stalled}), starting over")
+
+    return []
+
+
+#split listed entries into (missing, present) - present = in the archive index, or in the folder's library index
+#by id or by title and length (see library.py). a same-title file of unknown length is downloaded anyway and
+#the entry marked as a possible duplicate
+def diff_playlist(entries, output_dir, archive):
+    library = get_library()
+    library.watch(output_dir)
+    in_folder = library.present(output_dir, entries)
+    missing = []
+    present = []
+
+    for entry, found in zip(entries, in_folder):
+        if found or archive.contains(entry.get("ie_key") or "", entry.get("id")):
+            present.append(entry)
+        else:
+            if found is None:
+                entry["possible_duplicate"] = True
+            missing.append(entry)
+
+    return missing, present
+
+
+def diff_message(missing, present):
+    message = f"{len(missing)} new / {len(present)} already present"
+    possible = sum(1 for entry in missing if entry.get("possible_duplicate"))
+    if possible:
+        message += f" ({possible} new with the same title as a file already there)"
+    return message
+
+
+#[1, 2, 3, 7, 9, 10] -> "1-3,7,9-10" for yt-dlp's --playlist-items
+def item_ranges(indices):
+    ranges = []
+    for index in sorted(indices):
+        if ranges and index == ranges[-1][1] + 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+#--playlist-items argument for the missing entries bar the indices in skip (ones a hung yt-dlp was given up on),
+#or None when it would be too long to pass - then it's the whole playlist (the archive skips what's done),
+#with only the skipped ones cut out: "1-6,8-19,21:"
+def playlist_items_arg(missing, skip=()):
+    items = item_ranges(entry["index"] for entry in missing if entry["index"] not in skip)
+    if len(items) <= MAX_ITEMS_ARG:
+        return items
+    if not skip:
+        return None
+
+    ranges, start = [], 1
+    for index in sorted(skip):
+        if index > start:
+            ranges.append(str(start) if index == start + 1 else f"{start}-{index - 1}")
+        start = index + 1
+    return ",".join(ranges + [f"{start}:"])
+
+
+#the same as a command line option, [] when there's nothing to pass
+def playlist_items_args(missing, skip=()):
+    items = playlist_items_arg(missing, skip)
+    return ["--playlist-items", items] if items else []
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+
+from appdata import data_path
+
+#on-disk metadata cache - the info json yt-dlp wrote the last time a video was extracted, keyed by
+#extractor + id. a retry (any mode, any folder) downloads straight from it with --load-info-json instead of
+#fetching the watch page and player js again, which is the part that gets an ip rate limited.
+#files live in <data dir>/metacache/<extractor>/<id>.info.json: mtime = when it was extracted, atime = last use.
+#format urls in it expire (youtube signs them for 6h) - past TTL an entry is dropped, and if one still
+#went stale yt-dlp falls back to the webpage url by itself
+
+TTL = 5 * 3600
+MAX_BYTES = 256 * 1024 * 1024
+
+SUFFIX = ".info.json"
+
+
+class MetadataCache:
+
+    def __init__(self, path=None, ttl=TTL, max_bytes=MAX_BYTES):
+        self.path = path or data_path("metacache")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+        #"<extractor> <id>" -> [file, size, mtime, atime], one directory scan per process
+        self.files = {}
+        self.bytes = 0
+        os.makedirs(self.path, exist_ok=True)
+        with os.scandir(self.path) as extractors:
+            for folder in extractors:
+                if not folder.is_dir():
+                    continue
+                with os.scandir(folder.path) as it:
+                    for item in it:
+                        if item.name.endswith(SUFFIX):
+                            stat = item.stat()
+                            key = f"{folder.name.lower()} {item.name[:-len(SUFFIX)]}"
+                            self.files[key] = [item.path, stat.st_size, stat.st_mtime, stat.st_atime]
+                            self.bytes += stat.st_size
+
+    def __len__(self):
+        return len(self.files)
+
+    #output template for yt-dlp's infojson files (yt-dlp adds the .info.json itself)
+    def template(self):
+        return os.path.join(self.path.replace("%", "%%"), "%(extractor_key)s", "%(id)s")
+
+    #extra args that make a subprocess write what it extracted into the cache
+    def write_args(self):
+        return ["--write-info-json", "--no-write-playlist-metafiles", "-o", "infojson:" + self.template()]
+
+    #fresh cached info for this video? (doesn't count as a hit or miss)
+    def contains(self, extractor, video_id):
+        with self.lock:
+            found = self.files.get(f"{(extractor or '').lower()} {video_id}")
+            return bool(found) and time.time() - found[2] < self.ttl
+
+    #path of the cached info json whatever its age, for reading title/duration - not a hit, not a use
+    def peek(self, extractor, video_id):
+        with self.lock:
+            found = self.files.get(f"{(extractor or '').lower()} {video_id}")
+        return found[0] if found and os.path.exists(found[0]) else None
+
+    #path of the cached info json, or None - counts the hit/miss and bumps the entry to most recently used
+    def lookup(self, extractor, video_id):
+        key = f"{(extractor or '').lower()} {video_id}"
+        now = time.time()
+        with self.lock:
+            found = self.files.get(key)
+            if found and now - found[2] >= self.ttl:
+                self.drop(key)
+                self.expired += 1
+                found = None
+            elif found and not os.path.exists(found[0]):
+                self.drop(key)
+                found = None
+
+            if found is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            found[3] = now
+        try:
+            os.utime(found[0], (now, found[2])) #atime survives restarts, noatime mounts or not
+        except OSError:
+            pass
+        return found[0]
+
+    #register the file a finished yt-dlp run wrote for this video, then trim back under the size cap
+    def stored(self, extractor, video_id):
+        if not extractor or not video_id:
+            return
+        file = os.path.join(self.path, extractor, video_id + SUFFIX)
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return
+
+        key = f"{extractor.lower()} {video_id}"
+        with self.lock:
+            old = self.files.get(key)
+            if old:
+                self.bytes -= old[1]
+            self.files[key] = [file, stat.st_size, stat.st_mtime, time.time()]
+            self.bytes += stat.st_size
+            self.trim()
+
+    #a cached info json that didn't get the file out (stale formats, changed video) - extract fresh next time
+    def discard(self, extractor, video_id):
+        key = f"{(extractor or '').lower()} {video_id}"
+        with self.lock:
+            if key in self.files:
+                self.drop(key)
+
+    #drop least recently used entries until the cache fits (lock held)
+    def trim(self):
+        if self.bytes <= self.max_bytes:
+            return
+        for key in sorted(self.files, key=lambda k: self.files[k][3]):
+            if self.bytes <= self.max_bytes:
+                break
+            self.drop(key)
+            self.evicted += 1
+
+    def drop(self, key):
+        file, size, _, _ = self.files.pop(key)
+        self.bytes -= size
+        try:
+            os.remove(file)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.files),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+
+#where a per-video yt-dlp run gets its video from: the cached info json if there's a fresh one, else the url
+def source_args(cache, extractor, video_id, url):
+    found = cache.lookup(extractor, video_id)
+    return ["--load-info-json", found] if found else [url]
+
+
+#split entries into (cached, uncached) so playlist modes can skip extraction for the cached ones
+def split_cached(cache, entries):
+    cached = []
+    uncached = []
+    for entry in entries:
+        if cache.contains(entry.get("ie_key"), entry.get("id")):
+            cached.append(entry)
+        else:
+            uncached.append(entry)
+    return cached, uncached
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+#one cache per process, shared by every mode and both backends
+def get_metacache():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = MetadataCache()
+        return _shared
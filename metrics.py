@@ -0,0 +1,326 @@
+import json
+import os
+import threading
+import time
+
+from appdata import data_path
+from classifier import FAILURES
+
+#structured timings for every job and every entry in it - what a slow run actually spent its time on:
+#  extract   entry started -> first downloaded byte (for single-process playlist runs yt-dlp's [entry] line
+#            comes after the page was extracted, so there it's only format selection + connect)
+#  download  first -> last progress line, plus bytes and average speed
+#  transcode last progress line -> transcoded / done
+#  retries   the entry started again after a failure (rate-limit retries, re-dispatch)
+#  sleep     pacer gaps between entries, error = failure category
+#  analyze   decode + analysis + tags per file, for jobs that ask for it (see analysis.py)
+#every finished entry and job is one json line in metrics.jsonl (rolled over at LOG_BYTES), and everything
+#feeds the process-wide counters/histograms that GET /metrics serves in prometheus text format
+
+LOG_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+
+SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SPEED_BUCKETS = (64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2)
+
+HISTOGRAMS = {
+    "extract_seconds": ("entry started to first downloaded byte", SECONDS_BUCKETS),
+    "download_seconds": ("first to last downloaded byte per entry", SECONDS_BUCKETS),
+    "transcode_seconds": ("last downloaded byte to finished file per entry", SECONDS_BUCKETS),
+    "speed_bytes": ("average download speed per entry in bytes per second", SPEED_BUCKETS),
+    "job_seconds": ("wall time per job", SECONDS_BUCKETS),
+    "analyze_seconds": ("decode, analysis and tagging per file (cache hits not counted)", SECONDS_BUCKETS),
+}
+
+COUNTERS = {
+    "entries_total": "finished entries by outcome (done or failure category)",
+    "bytes_total": "downloaded bytes",
+    "retries_total": "entries started again after a failure",
+    "sleep_seconds_total": "seconds the pacers slept between entries",
+    "jobs_total": "finished jobs by status",
+    "analyzed_total": "files through the analysis stage by outcome (analyzed, cached or failed)",
+}
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for n, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[n] += 1
+                break
+
+    #(upper bound, cumulative count) pairs, +Inf last
+    def cumulative(self):
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((bound, total))
+        pairs.append(("+Inf", self.count))
+        return pairs
+
+
+class Metrics:
+
+    def __init__(self, path=None):
+        self.path = path or data_path("metrics.jsonl")
+        self.lock = threading.Lock()
+        self.log_lock = threading.Lock()
+        self.counters = {} #(name, ((label, value), ...)) -> value
+        self.histograms = {name: Histogram(buckets) for name, (_, buckets) in HISTOGRAMS.items()}
+        self.current = None #JobMetrics of the running job - jobs run one at a time, the pacers report sleeps here
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value):
+        if value is None:
+            return
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def start_job(self, job):
+        self.current = JobMetrics(self, job)
+        return self.current
+
+    #one json line, rolling metrics.jsonl -> .1 -> .2 ... once it's full
+    def log(self, record):
+        line = json.dumps(record) + "\n"
+        with self.log_lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > LOG_BYTES:
+                    self.roll()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass #metrics never break a download
+
+    def roll(self):
+        for n in range(LOG_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        os.replace(self.path, self.path + ".1")
+
+    def snapshot(self):
+        with self.lock:
+            counters = {}
+            for (name, labels), value in self.counters.items():
+                counters[name + format_labels(labels)] = value
+            histograms = {
+                name: {"count": h.count, "sum": h.sum, "buckets": h.cumulative()} for name, h in self.histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms, "metacache": cache_stats(), "budget": budget_stats()}
+
+    #prometheus text exposition format
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, help_text in COUNTERS.items():
+                lines.append(f"# HELP crateplug_{name} {help_text}")
+                lines.append(f"# TYPE crateplug_{name} counter")
+                series = [(labels, value) for (key, labels), value in sorted(self.counters.items()) if key == name]
+                for labels, value in series or [((), 0)]:
+                    lines.append(f"crateplug_{name}{format_labels(labels)} {number(value)}")
+
+            for name, (help_text, _) in HISTOGRAMS.items():
+                histogram = self.histograms[name]
+                lines.append(f"# HELP crateplug_{name} {help_text}")
+                lines.append(f"# TYPE crateplug_{name} histogram")
+                for bound, count in histogram.cumulative():
+                    lines.append(f"crateplug_{name}_bucket{format_labels([('le', bound)])} {count}")
+                lines.append(f"crateplug_{name}_sum {number(histogram.sum)}")
+                lines.append(f"crateplug_{name}_count {histogram.count}")
+
+        for prefix, stats in (("metacache", cache_stats()), ("budget", budget_stats())):
+            for name, value in stats.items():
+                if value is None:
+                    continue
+                lines.append(f"# TYPE crateplug_{prefix}_{name} gauge")
+                lines.append(f"crateplug_{prefix}_{name} {number(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{label}="{value}"' for label, value in labels) + "}"
+
+
+def number(value):
+    return f"{value:.6g}" if isinstance(value, float) else str(value)
+
+
+def cache_stats():
+    from metacache import get_metacache
+    return get_metacache().stats()
+
+
+def budget_stats():
+    from bandwidth import get_budget
+    return get_budget().stats()
+
+
+def seconds(start, end):
+    if start is None or end is None:
+        return None
+    return round(max(0.0, end - start), 3)
+
+
+#metrics for one job - fed every event of the job (runner.run_job wraps the event callback), entries are
+#written out as they finish. a failed entry stays open until the job ends, in case it gets retried
+class JobMetrics:
+
+    def __init__(self, metrics, job):
+        self.metrics = metrics
+        self.job_id = job.get("id")
+        self.mode = job.get("mode")
+        self.url = job.get("url")
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.entries = {} #video id -> per-entry state
+        self.outcomes = {}
+        self.bytes = 0
+        self.retries = 0
+        self.slept = 0.0
+
+    def entry(self, event, now):
+        key = event.video_id or f"#{event.index}"
+        state = self.entries.get(key)
+        if state is None:
+            state = self.entries[key] = {
+                "id": event.video_id, "index": event.index, "started": now, "first_byte": None, "last_byte": None,
+                "transcoded": None, "bytes": 0, "retries": 0, "error": None,
+            }
+        elif state["error"] and event.category in ("entry", "progress"):
+            #failed earlier and started again - a retry, time it from here
+            state.update(started=now, first_byte=None, last_byte=None, transcoded=None, bytes=0, error=None)
+            state["retries"] += 1
+            self.retries += 1
+            self.metrics.inc("retries_total")
+        return key, state
+
+    def update(self, event):
+        now = time.monotonic()
+        category = event.category
+        if category not in FAILURES and category not in ("entry", "progress", "transcoded", "done", "archived"):
+            return
+
+        if category == "archived":
+            self.metrics.inc("entries_total", outcome="archived")
+            return
+
+        with self.lock:
+            key, state = self.entry(event, now)
+
+            if category == "progress":
+                state["first_byte"] = state["first_byte"] or now
+                state["last_byte"] = now
+                if event.data.downloaded:
+                    state["bytes"] = max(state["bytes"], int(event.data.downloaded))
+
+            elif category == "transcoded":
+                state["transcoded"] = now
+
+            elif category == "done":
+                self.close(key, "done", now)
+
+            elif category in FAILURES:
+                state["error"] = category
+
+    #entry finished (lock held) - one log line, counters, histograms
+    def close(self, key, outcome, now):
+        state = self.entries.pop(key)
+        download = seconds(state["first_byte"], state["last_byte"])
+        record = {
+            "type": "entry",
+            "time": time.time(),
+            "job": self.job_id,
+            "id": state["id"],
+            "index": state["index"],
+            "outcome": outcome,
+            "extract_seconds": seconds(state["started"], state["first_byte"]),
+            "download_seconds": download,
+            "transcode_seconds": seconds(state["last_byte"], state["transcoded"] or now) if outcome == "done" else None,
+            "bytes": state["bytes"],
+            "speed": round(state["bytes"] / download) if download else None,
+            "retries": state["retries"],
+            "error": state["error"],
+        }
+        self.metrics.log(record)
+
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.bytes += state["bytes"]
+        self.metrics.inc("entries_total", outcome=outcome)
+        self.metrics.inc("bytes_total", state["bytes"])
+        if outcome == "done":
+            self.metrics.observe("extract_seconds", record["extract_seconds"])
+            self.metrics.observe("download_seconds", download)
+            self.metrics.observe("transcode_seconds", record["transcode_seconds"])
+            self.metrics.observe("speed_bytes", record["speed"])
+
+    def add_sleep(self, seconds):
+        with self.lock:
+            self.slept += seconds
+        self.metrics.inc("sleep_seconds_total", seconds)
+
+    #job over - entries still open are failures (or never finished), then the job line.
+    #status is for jobs stopped half way (preempted, paused, cancelled - see runner.JobControl)
+    def finish(self, error=None, status=None):
+        now = time.monotonic()
+        with self.lock:
+            for key in list(self.entries):
+                self.close(key, self.entries[key]["error"] or "incomplete", now)
+
+            elapsed = now - self.started
+            status = status or ("failed" if error else "done")
+            self.metrics.log({
+                "type": "job",
+                "time": time.time(),
+                "job": self.job_id,
+                "mode": self.mode,
+                "url": self.url,
+                "status": status,
+                "error": error,
+                "seconds": round(elapsed, 3),
+                "entries": sum(self.outcomes.values()),
+                "outcomes": self.outcomes,
+                "bytes": self.bytes,
+                "retries": self.retries,
+                "sleep_seconds": round(self.slept, 3),
+            })
+
+        self.metrics.inc("jobs_total", status=status)
+        self.metrics.observe("job_seconds", elapsed)
+        if self.metrics.current is self:
+            self.metrics.current = None
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+#one registry per process, shared by the gui/runner and the api server
+def get_metrics():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Metrics()
+        return _shared
+
+
+#pacer gaps go to whatever job is running (nothing to do outside a job, e.g. bench/throttle_sim.py)
+def record_sleep(seconds):
+    if seconds > 0 and _shared is not None and _shared.current is not None:
+        _shared.current.add_sleep(seconds)
@@ -0,0 +1,102 @@
+import random
+import threading
+import time
+
+from metrics import record_sleep
+
+#pacing between entries for large playlists.
+#"adaptive" (default) - AIMD on the gap between entries: no gap while the server is happy, the gap
+#  doubles (at least THROTTLE_DELAY) on a 429 / rate-limit line and shrinks back step by step on success
+#"conservative" - the old behaviour, a random 5-10s sleep before every entry
+
+PROFILES = ("adaptive", "conservative")
+DEFAULT_PROFILE = "adaptive"
+
+#how many times an entry that got rate limited is tried again (after backing off)
+MAX_THROTTLE_RETRIES = 3
+
+
+class AdaptivePacer:
+
+    def __init__(self, min_delay=0.0, max_delay=300.0, throttle_delay=15.0, factor=2.0, recovery_step=1.0, sleep=time.sleep):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.throttle_delay = throttle_delay
+        self.factor = factor
+        self.recovery_step = recovery_step
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.delay = min_delay
+        self.throttles = 0
+        self.slept = 0.0
+
+    def wait(self):
+        with self.lock:
+            delay = self.delay
+        if delay > 0:
+            delay *= random.uniform(0.8, 1.2) #a bit of jitter so requests don't look clockwork
+            self.slept += delay
+            self.sleep(delay)
+
+    #multiplicative back-off
+    def on_throttle(self):
+        with self.lock:
+            self.throttles += 1
+            self.delay = min(self.max_delay, max(self.delay * self.factor, self.throttle_delay))
+
+    #additive recovery
+    def on_success(self):
+        with self.lock:
+            self.delay = max(self.min_delay, self.delay - self.recovery_step)
+
+
+class FixedPacer:
+
+    def __init__(self, low=5.0, high=10.0, sleep=time.sleep):
+        self.low = low
+        self.high = high
+        self.sleep = sleep
+        self.throttles = 0
+        self.slept = 0.0
+        self.first = True
+
+    def wait(self):
+        #yt-dlp's --sleep-interval doesn't sleep before the very first download either
+        if self.first:
+            self.first = False
+            return
+        delay = random.uniform(self.low, self.high)
+        self.slept += delay
+        self.sleep(delay)
+
+    def on_throttle(self):
+        self.throttles += 1
+
+    def on_success(self):
+        pass
+
+
+def make_pacer(profile=DEFAULT_PROFILE, sleep=time.sleep):
+    if profile == "conservative":
+        return FixedPacer(sleep=sleep)
+    return AdaptivePacer(sleep=sleep)
+
+
+#run entries one by one through the pacer - download(entry) returns the outcome category
+#("done" / "fetched", "rate_limited", another failure, or None). rate-limited entries are retried after backing off
+def run_paced(entries, download, pacer, status_callback=None):
+    for entry in entries:
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            slept = pacer.slept
+            pacer.wait()
+            record_sleep(pacer.slept - slept)
+            outcome = download(entry)
+
+            if outcome != "rate_limited":
+                if outcome in ("done", "fetched"):
+                    pacer.on_success()
+                break
+
+            pacer.on_throttle()
+            if status_callback and attempt < MAX_THROTTLE_RETRIES:
+                status_callback(f"rate limited - backing off {pacer.delay:.0f}s and retrying")
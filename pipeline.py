@@ -0,0 +1,174 @@
+import subprocess
+import os
+import queue
+import shutil
+import threading
+
+from classifier import OutputParser, dispatch, file_type
+from archive import get_archive
+from appdata import data_path
+from formats import DEFAULT_FORMAT, get_profiles, convert_plan, output_path
+from library import cached_info
+from binaries import binary, POPEN_FLAGS
+from supervisor import POSTPROCESS_LIMIT
+
+#two-stage download for the per-entry modes: network workers only fetch the best audio stream into a
+#staging folder, a separate pool of ffmpeg workers (one per cpu core) encodes (or remuxes) it into the output folder.
+#the queue in between is bounded, so fetchers wait when the encoders fall behind instead of filling the disk.
+#the staging folder is keyed by video id - an interrupted fetch resumes from its .part file next run.
+#a job with several output profiles (see formats.py) always goes through here: one fetch, then one ffmpeg run
+#that decodes the source once and writes every profile's file
+
+TRANSCODERS = os.cpu_count() or 2
+
+#fetched files waiting per transcoder before the fetchers block
+QUEUE_PER_TRANSCODER = 2
+
+#staged fetch: only the best audio stream, no -x
+FETCH_ARGS = ["-f", "bestaudio/best"]
+
+
+#what yt-dlp's -x --audio-format ... --audio-quality ... runs - encode or stream copy (see formats.py),
+#once per (target, codec args, muxer) output
+def transcode_command(source, outputs):
+    command = [
+        binary("ffmpeg"),
+        "-y",
+        "-loglevel", "error",
+        "-i", source,
+    ]
+    for target, codec_args, muxer in outputs:
+        command += ["-vn", *codec_args, "-f", muxer, target]
+    return command
+
+
+class Pipeline:
+
+    def __init__(self, output_dir, status_callback, event_callback=None, audio_format=DEFAULT_FORMAT, transcoders=TRANSCODERS):
+        self.output_dir = output_dir
+        self.profiles = get_profiles(audio_format)
+        self.status_callback = status_callback
+        self.event_callback = event_callback
+        self.staging = data_path("staging")
+        self.queue = queue.Queue(maxsize=max(1, transcoders) * QUEUE_PER_TRANSCODER)
+        self.lock = threading.Lock()
+        self.downloaded = 0
+        self.failed = 0 #encodes that failed - fetch failures are the caller's outcome
+        self.threads = [threading.Thread(target=self.transcode_loop, daemon=True) for _ in range(max(1, transcoders))]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    #network stage: the download writes here and hands the finished file to stage() instead of -x
+    def template(self):
+        return os.path.join(self.staging.replace("%", "%%"), "%(id)s", "%(title)s.%(ext)s")
+
+    def stage(self, index, count):
+        return lambda event: self.queue.put((event, index, count)) #blocks while the encoders are busy
+
+    #the same for a whole-playlist yt-dlp - True if the event is the pipeline's to report (the staged file's
+    #"done" goes to the encoders, there is no "transcoded" yet)
+    def take(self, event):
+        if event.category == "done":
+            self.queue.put((event, event.index, event.count))
+            return True
+        return event.category == "transcoded"
+
+    def transcode_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                self.transcode(*item)
+            except Exception as e:
+                #anything at all - a dead encoder thread would leave the fetchers blocked on a full queue
+                #and close() waiting forever. the entry counts as failed and the loop carries on
+                with self.lock:
+                    self.failed += 1
+                self.status_callback(f"transcode failed: {e}")
+                self.report_failure(*item)
+
+    #the entry's failure event (the status line went out already) - so whoever counts entries sees it end
+    def report_failure(self, event, index, count):
+        if self.event_callback:
+            line = f"ERROR: [{event.extractor}] {event.video_id}: transcode failed"
+            self.event_callback(OutputParser(index, count).classify(line))
+
+    #(target, codec args, muxer) per profile - two profiles that would write the same file get their name added
+    def outputs(self, event):
+        source = event.path
+        title = os.path.splitext(os.path.basename(source))[0]
+        info = None
+        outputs = []
+        for profile in self.profiles:
+            extension, codec_args, muxer = convert_plan(profile, source)
+            if profile.get("template") and info is None:
+                info = cached_info(event.extractor, event.video_id)
+            target = output_path(self.output_dir, profile, title, info or {}, extension)
+            if any(target == other for other, _, _ in outputs):
+                target = os.path.splitext(target)[0] + f" ({profile['name']})." + extension
+            outputs.append((target, codec_args, muxer))
+        return outputs
+
+    def transcode(self, event, index, count):
+        parser = OutputParser(index, count)
+        source = event.path
+        outputs = self.outputs(event)
+        for target, _, _ in outputs:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+        temps = [(target + ".part", codec_args, muxer) for target, codec_args, muxer in outputs]
+
+        #an ffmpeg that hangs (corrupt input, stuck filesystem) is killed and tried once more
+        for attempt in range(2):
+            try:
+                result = subprocess.run(
+                    transcode_command(source, temps),
+                    **POPEN_FLAGS,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    encoding="utf-8",
+                    errors="replace",
+                    timeout=POSTPROCESS_LIMIT,
+                )
+                ok = result.returncode == 0
+                break
+            except subprocess.TimeoutExpired:
+                ok = False
+
+        if not ok:
+            for temp, _, _ in temps:
+                if os.path.exists(temp):
+                    os.remove(temp)
+            with self.lock:
+                self.failed += 1
+            dispatch(parser.classify(f"ERROR: [{event.extractor}] {event.video_id}: ffmpeg failed"), self.status_callback, self.event_callback)
+            return
+
+        for (target, _, _), (temp, _, _) in zip(outputs, temps):
+            os.replace(temp, target)
+        shutil.rmtree(os.path.dirname(source), ignore_errors=True)
+
+        #same events (and the same final path - the first profile's) the inline -x run reports
+        dispatch(parser.transcoded(event.video_id), self.status_callback, self.event_callback)
+        done = parser.downloaded(event.video_id, outputs[0][0], event.extractor)
+        if len(outputs) > 1:
+            kinds = " + ".join(file_type(target) for target, _, _ in outputs)
+            done = done._replace(message=f"{parser.prefix()} {kinds} downloaded".strip())
+        get_archive().record(done)
+        with self.lock:
+            self.downloaded += 1
+        dispatch(done, self.status_callback, self.event_callback)
+
+    #wait for everything queued to be encoded
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
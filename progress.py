@@ -0,0 +1,92 @@
+import threading
+
+from classifier import FAILURES
+
+#collects progress events from the download thread(s) and hands the gui one coalesced snapshot at a fixed rate.
+#the worker only takes a lock and overwrites numbers here - no qt signal per line - and the gui timer
+#reads a snapshot REFRESH_HZ times a second, so fast fragment downloads can't flood the event loop
+
+REFRESH_HZ = 10
+
+#events that close an entry for the playlist bar
+FINISHED = FAILURES | {"done", "archived"}
+
+
+class ProgressTracker:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.status = ""
+            self.active = {} #video id -> Progress of every entry downloading right now (several with workers > 1)
+            self.index = 0
+            self.count = None
+            self.finished = 0
+            self.version = 0 #bumped on every change so the gui can skip identical repaints
+            self.events = 0
+
+    def set_status(self, text):
+        with self.lock:
+            self.status = text
+            self.version += 1
+
+    def update(self, event):
+        with self.lock:
+            self.events += 1
+
+            if event.count:
+                self.count = event.count
+
+            if event.category == "entry":
+                self.index = max(self.index, event.index or 0)
+
+            elif event.category == "progress":
+                self.active[event.video_id] = event.data
+                self.index = max(self.index, event.index or 0)
+
+            elif event.category in FINISHED:
+                self.active.pop(event.video_id, None)
+                if event.index is not None:
+                    self.finished += 1
+
+            else:
+                return
+
+            self.version += 1
+
+    #everything the gui needs for one repaint - fractions are 0..1 or None when unknown
+    def snapshot(self):
+        with self.lock:
+            downloaded = sum(p.downloaded or 0 for p in self.active.values())
+            total = sum(p.total or 0 for p in self.active.values())
+            speed = sum(p.speed or 0 for p in self.active.values())
+            etas = [p.eta for p in self.active.values() if p.eta is not None]
+
+            playlist = None
+            if self.count:
+                #single-process playlist modes don't report skipped entries, so the position counts too
+                playlist = min(1.0, max(self.finished, self.index - len(self.active)) / self.count)
+
+            return {
+                "version": self.version,
+                "status": self.status,
+                "track": min(1.0, downloaded / total) if total else None,
+                "playlist": playlist,
+                "speed": speed or None,
+                "eta": max(etas) if etas else None,
+            }
+
+
+def format_speed(speed):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if speed < 1024 or unit == "GiB":
+            return f"{speed:.1f} {unit}/s"
+        speed /= 1024
+
+
+def format_eta(eta):
+    minutes, seconds = divmod(int(eta), 60)
+    return f"{minutes}:{seconds:02d}"
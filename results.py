@@ -0,0 +1,92 @@
+import csv
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from classifier import FAILURES
+
+#per-entry outcome log for the results panel - a fixed-size ring buffer, so an overnight job with
+#thousands of entries keeps the newest CAPACITY records and memory stays flat.
+#fed from the download thread(s) through the same event callback as the progress tracker
+
+CAPACITY = 20000
+
+COLUMNS = ["job", "index", "title", "status", "error", "duration"]
+
+
+class ResultLog:
+
+    def __init__(self, capacity=CAPACITY):
+        self.lock = threading.Lock()
+        self.records = deque(maxlen=capacity)
+        self.appended = 0 #total ever added - with len(records) this tells the view what rolled off the front
+        self.started = {} #video id -> (start time, title) for entries still running
+        self.job = None
+        self.analyzed = False #the job runs the analysis stage - its files get waveform overviews
+
+    def begin_job(self, job_id, analyzed=False):
+        with self.lock:
+            self.job = job_id
+            self.analyzed = analyzed
+            self.started.clear()
+
+    def update(self, event):
+        if event.category == "entry":
+            with self.lock:
+                #per-entry modes report the start twice (listing + yt-dlp) - keep the first
+                start, title = self.started.get(event.video_id, (time.time(), None))
+                self.started[event.video_id] = (start, title or event.title)
+            return
+
+        if event.category == "done":
+            status, error = "downloaded", ""
+        elif event.category == "archived":
+            status, error = "skipped", ""
+        elif event.category in FAILURES:
+            status, error = "failed", event.category
+        else:
+            return
+
+        now = time.time()
+        with self.lock:
+            start, title = self.started.pop(event.video_id, (None, None))
+            if event.path:
+                title = os.path.splitext(os.path.basename(event.path))[0]
+
+            self.records.append({
+                "job": self.job,
+                "index": event.index,
+                "title": title or event.video_id or "",
+                "status": status,
+                "error": error,
+                "duration": round(now - start, 1) if start else None,
+                "video_id": event.video_id,
+                "path": event.path,
+                "analyzed": self.analyzed,
+                "time": now,
+            })
+            self.appended += 1
+
+    #copy of the buffer plus the running total, taken under the lock
+    def snapshot(self):
+        with self.lock:
+            return list(self.records), self.appended
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def export_csv(self, path):
+        records, _ = self.snapshot()
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS + ["video_id", "path", "analyzed", "time"])
+            writer.writeheader()
+            writer.writerows(records)
+
+    def export_jsonl(self, path):
+        records, _ = self.snapshot()
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
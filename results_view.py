@@ -0,0 +1,291 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from PySide6.QtWidgets import (
+    QWidget, QTableView, QHeaderView, QPushButton, QVBoxLayout, QHBoxLayout, QFileDialog, QAbstractItemView,
+    QStyledItemDelegate,
+)
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, QLineF, QObject, Signal
+from PySide6.QtGui import QColor, QPen
+
+from results import COLUMNS
+from waveform import load
+
+#table model over the ResultLog ring buffer. QTableView only asks for the rows on screen, so repaint cost
+#doesn't grow with the job - and sync() only inserts/removes the rows that changed since the last tick.
+#the last column is the track's waveform overview (waveform.py), for jobs that ran the analysis - the sidecar
+#is read on a loader thread the first time its row is painted (so only for rows on screen), and the row is
+#painted again once it's in
+
+HEADERS = COLUMNS + ["waveform"]
+WAVEFORM = len(COLUMNS)
+WAVEFORM_WIDTH = 160
+PATH_ROLE = Qt.UserRole
+
+CACHED = 256 #overviews kept in memory (3kb each + the lines drawn from them)
+RETRY = 2.0 #seconds before a track without an overview is looked at again - analysis finishes after the download
+GIVE_UP = 600 #seconds after which a track that still has none isn't looked for anymore (analysis failed)
+MISSING = 1024 #tracks without an overview remembered, oldest dropped first
+
+
+class ResultsModel(QAbstractTableModel):
+
+    def __init__(self, log):
+        super().__init__()
+        self.log = log
+        self.rows = []
+        self.appended = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        record = self.rows[index.row()]
+        if role == PATH_ROLE:
+            return record["path"] if record.get("analyzed") else None #no overview coming otherwise
+
+        if role == Qt.DisplayRole:
+            if index.column() == WAVEFORM:
+                return None #drawn by WaveformDelegate
+            value = record[COLUMNS[index.column()]]
+            return "" if value is None else str(value)
+
+        if role == Qt.ToolTipRole:
+            return record["path"] or record["video_id"]
+
+        return None
+
+    #an overview came in - repaint the rows of that track among first..last (the ones on screen)
+    def waveform_loaded(self, path, first, last):
+        for row in range(max(0, first), min(last, len(self.rows) - 1) + 1):
+            if self.rows[row]["path"] == path:
+                index = self.index(row, WAVEFORM)
+                self.dataChanged.emit(index, index)
+
+    #called from the gui refresh timer
+    def sync(self):
+        records, appended = self.log.snapshot()
+        added = appended - self.appended
+        if added == 0 and len(records) == len(self.rows):
+            return
+
+        #rows that fell off the front of the ring buffer since the last sync
+        removed = len(self.rows) + added - len(records)
+
+        if added < 0 or (self.rows and removed >= len(self.rows)):
+            self.beginResetModel()
+            self.rows = records
+            self.appended = appended
+            self.endResetModel()
+            return
+
+        if removed > 0:
+            self.beginRemoveRows(QModelIndex(), 0, removed - 1)
+            self.rows = self.rows[removed:]
+            self.endRemoveRows()
+
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(records) - 1)
+        self.rows = records
+        self.appended = appended
+        self.endInsertRows()
+
+
+#reads sidecars off the gui thread - overview() never touches the disk, it returns what's loaded and queues
+#the rest; loaded(path) fires (queued to the gui thread) when one comes in
+class WaveformLoader(QObject):
+
+    loaded = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.lock = threading.Lock()
+        self.cache = OrderedDict() #track path -> (overview, {(width, height): (peak lines, rms lines)})
+        self.missing = OrderedDict() #track path -> (first looked for, last looked for), oldest first
+        self.pending = set()
+        self.requests = queue.Queue()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def overview(self, path):
+        now = time.monotonic()
+        with self.lock:
+            if path in self.cache:
+                self.cache.move_to_end(path)
+                return self.cache[path]
+            if path in self.pending:
+                return None
+            first, last = self.missing.get(path, (now, None))
+            if last is not None and (now - last < RETRY or now - first > GIVE_UP):
+                return None
+            self.pending.add(path)
+        self.requests.put(path)
+        return None
+
+    #tracks still expected to get an overview (analysis running behind the downloads)
+    def waiting(self):
+        now = time.monotonic()
+        with self.lock:
+            return bool(self.pending) or any(now - first <= GIVE_UP for first, _ in self.missing.values())
+
+    def clear(self):
+        with self.lock:
+            self.missing.clear()
+
+    def run(self):
+        while True:
+            path = self.requests.get()
+            loaded = load(path)
+            now = time.monotonic()
+            with self.lock:
+                self.pending.discard(path)
+                if loaded is None:
+                    first, _ = self.missing.pop(path, (now, None))
+                    self.missing[path] = (first, now)
+                    if len(self.missing) > MISSING:
+                        self.missing.popitem(last=False)
+                    continue
+                self.missing.pop(path, None)
+                self.cache[path] = (loaded, {})
+                if len(self.cache) > CACHED:
+                    self.cache.popitem(last=False)
+            self.loaded.emit(path)
+
+
+#paints the overview of the row's track: peaks light, rms darker, both mirrored around the middle
+class WaveformDelegate(QStyledItemDelegate):
+
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.peak_pen = QPen(QColor(90, 160, 230))
+        self.rms_pen = QPen(QColor(30, 90, 160))
+
+    #one vertical line per pixel column, over the buckets that fall into it
+    def lines(self, overview, width, height):
+        buckets = len(overview["low"])
+        middle = height / 2
+        peaks, rms = [], []
+        for x in range(width):
+            first = x * buckets // width
+            last = max(first + 1, (x + 1) * buckets // width)
+            top = max(overview["high"][first:last]) / 127 * middle
+            bottom = min(overview["low"][first:last]) / 127 * middle
+            level = max(overview["rms"][first:last]) / 255 * middle
+            peaks.append(QLineF(x + 0.5, middle - top, x + 0.5, middle - bottom))
+            rms.append(QLineF(x + 0.5, middle - level, x + 0.5, middle + level))
+        return peaks, rms
+
+    def paint(self, painter, option, index):
+        super().paint(painter, option, index) #background and selection
+        path = index.data(PATH_ROLE)
+        found = self.loader.overview(path) if path else None
+        rect = option.rect.adjusted(2, 2, -2, -2)
+        if found is None or rect.width() <= 0 or rect.height() <= 0:
+            return
+
+        overview, drawn = found
+        size = (rect.width(), rect.height())
+        if size not in drawn:
+            drawn.clear() #only the current column width is worth keeping
+            drawn[size] = self.lines(overview, *size)
+        peaks, rms = drawn[size]
+
+        painter.save()
+        painter.translate(rect.topLeft())
+        painter.setPen(self.peak_pen)
+        painter.drawLines(peaks)
+        painter.setPen(self.rms_pen)
+        painter.drawLines(rms)
+        painter.restore()
+
+
+class ResultsWindow(QWidget):
+
+    def __init__(self, log, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setWindowTitle("crateplug - results")
+        self.resize(640 + WAVEFORM_WIDTH, 420)
+        self.log = log
+        self.looked = 0.0
+
+        self.model = ResultsModel(log)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setWordWrap(False)
+        #fixed row height = no per-row size hints, the view stays lazy
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(20)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(COLUMNS.index("title"), QHeaderView.Stretch)
+        self.loader = WaveformLoader(self)
+        self.loader.loaded.connect(self.waveform_loaded)
+        self.delegate = WaveformDelegate(self.loader, self.table)
+        self.table.setItemDelegateForColumn(WAVEFORM, self.delegate)
+        self.table.setColumnWidth(WAVEFORM, WAVEFORM_WIDTH)
+
+        csv_btn = QPushButton("Export CSV")
+        csv_btn.clicked.connect(lambda: self.export("CSV (*.csv)", self.log.export_csv))
+        jsonl_btn = QPushButton("Export JSONL")
+        jsonl_btn.clicked.connect(lambda: self.export("JSON Lines (*.jsonl)", self.log.export_jsonl))
+        clear_btn = QPushButton("Clear")
+        clear_btn.clicked.connect(self.clear)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(csv_btn)
+        buttons.addWidget(jsonl_btn)
+        buttons.addStretch()
+        buttons.addWidget(clear_btn)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+
+    def refresh(self):
+        if not self.isVisible():
+            return
+
+        at_bottom = self.table.verticalScrollBar().value() == self.table.verticalScrollBar().maximum()
+        self.model.sync()
+        if at_bottom:
+            self.table.scrollToBottom() #follow new rows unless the user scrolled up
+
+        #overviews still on their way (the analysis runs behind the downloads) - repaint so they get looked for
+        now = time.monotonic()
+        if now - self.looked >= RETRY:
+            self.looked = now
+            if self.loader.waiting():
+                self.table.viewport().update()
+
+    def waveform_loaded(self, path):
+        first = self.table.rowAt(0)
+        last = self.table.rowAt(self.table.viewport().height() - 1)
+        if first < 0:
+            return #nothing on screen
+        self.model.waveform_loaded(path, first, last if last >= 0 else self.model.rowCount() - 1)
+
+    def export(self, file_filter, write):
+        path, _ = QFileDialog.getSaveFileName(self, "Export results", "", file_filter)
+        if path:
+            write(path)
+
+    def clear(self):
+        self.log.clear()
+        self.loader.clear()
+        self.model.sync()
+
+    def showEvent(self, event):
+        self.model.sync()
+        super().showEvent(event)
@@ -0,0 +1,347 @@
+import threading
+
+from dlqueue import JobQueue, DONE, FAILED, INTERRUPTED, PENDING, RUNNING
+
+#the download engine without any gui - runs queued jobs one after another on its own thread.
+#the gui's DownloadWorker and the headless cli/daemon both go through run_job, so every mode and backend
+#behaves the same everywhere. download modules are imported when a job needs them, not at startup
+
+MODES = ("single", "playlist", "large_playlist")
+BACKENDS = ("api", "subprocess")
+
+
+#raised out of the event callback when a job is stopped (see JobControl) - a BaseException, so it goes straight
+#through the download modules' error handling. the yt-dlp process of a subprocess mode is killed on the way out
+#(supervisor.py), in-process downloads stop inside yt_dlp
+class JobInterrupted(BaseException):
+
+    def __init__(self, action):
+        super().__init__(action)
+        self.action = action
+        self.status = {"preempt": "preempted", "pause": "paused", "cancel": "cancelled"}[action]
+
+
+#stop requests for the running job, from the gui / api / a higher priority job coming in.
+#pause and preempt wait for the next entry boundary (nothing half downloaded is thrown away, the job picks up
+#from there later), cancel also stops the entry in progress
+class JobControl:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requested = None
+
+    def request(self, action):
+        with self.lock:
+            if action == "resume":
+                #paused before it took effect - nothing to do
+                if self.requested == "pause":
+                    self.requested = None
+            elif action == "cancel" or self.requested is None:
+                self.requested = action
+
+    def checkpoint(self, boundary=True):
+        action = self.requested
+        if action == "cancel" or (action and boundary):
+            raise JobInterrupted(action)
+
+
+def is_valid_url(url):
+    return "youtube.com" in url or "youtu.be" in url
+
+
+#api submits can override mode/format/profiles/pacing/workers/priority/analyze - anything unknown is ignored. returns (mode, workers, options)
+def apply_overrides(mode, workers, options, overrides):
+    from formats import load_profiles
+    from pacing import PROFILES
+    from dlconcurrent import MAX_WORKERS
+    from bandwidth import PRIORITIES
+
+    options = dict(options)
+    if overrides.get("mode") in MODES:
+        mode = overrides["mode"]
+    known = load_profiles()
+    if overrides.get("format") in known:
+        options["format"] = overrides["format"]
+        options.pop("profiles", None) #a format of its own replaces the app's set of profiles
+    if isinstance(overrides.get("profiles"), list):
+        profiles = [name for name in overrides["profiles"] if isinstance(name, str) and name in known]
+        if profiles:
+            options["profiles"] = profiles
+    if overrides.get("pacing") in PROFILES:
+        options["pacing"] = overrides["pacing"]
+    if isinstance(overrides.get("workers"), int):
+        workers = max(1, min(overrides["workers"], MAX_WORKERS))
+    if overrides.get("priority") in PRIORITIES:
+        options["priority"] = overrides["priority"]
+    if isinstance(overrides.get("analyze"), bool):
+        options["analyze"] = overrides["analyze"]
+    return mode, workers, options
+
+
+#in-process yt_dlp if it can be imported, yt-dlp executable otherwise
+def pick_backend(preferred="api"):
+    if preferred == "api":
+        import dlapi
+        if dlapi.available():
+            return "api"
+    return "subprocess"
+
+
+#run one job from the queue (a dict from JobQueue) to completion - raises whatever the download raises.
+#every event also goes through the job's metrics (metrics.py) and the folder's library index (library.py) on the
+#way to the caller, and the job's downloads share the process-wide connection/bandwidth budget (bandwidth.py).
+#with a control the job can be stopped on the way - JobInterrupted comes out then
+def run_job(job, status_callback, event_callback=None, backend="subprocess", control=None):
+    from metrics import get_metrics
+    from bandwidth import get_budget
+    from library import get_library
+    from analysis import get_analyzer
+
+    job_metrics = get_metrics().start_job(job)
+    library = get_library()
+    control = control or JobControl()
+    #bpm/key/loudness and the waveform overview for every finished file, on the analysis pool (see analysis.py)
+    analyzer = get_analyzer() if (job.get("options") or {}).get("analyze") else None
+    analyzing = []
+
+    def on_event(event):
+        #every entry starts with an "entry" event (before yt-dlp downloads anything) - the boundary to stop at
+        if event.category == "entry":
+            control.checkpoint()
+        job_metrics.update(event)
+        library.record(event, job["output_dir"])
+        if analyzer and event.category == "done" and event.path:
+            analyzing.append(analyzer.submit(event.path, status_callback))
+        if event_callback:
+            event_callback(event)
+        #a cancel doesn't wait for the download in progress
+        if event.category == "progress":
+            control.checkpoint(boundary=False)
+
+    try:
+        with get_budget().join(job) as share:
+            run_download(job, status_callback, on_event, backend, share)
+        #the pool keeps up with the downloads, so only the last few files are left - the job is done once they're tagged
+        if analyzer:
+            analyzer.wait(analyzing)
+    except JobInterrupted as e:
+        job_metrics.finish(status=e.status)
+        raise
+    except Exception as e:
+        job_metrics.finish(str(e))
+        raise
+    job_metrics.finish()
+
+
+def run_download(job, status_callback, event_callback, backend, share=None):
+    from formats import DEFAULT_FORMAT
+    from pacing import DEFAULT_PROFILE
+
+    url, output_dir, mode, workers = job["url"], job["output_dir"], job["mode"], job["workers"]
+    options = job.get("options") or {}
+    pacing = options.get("pacing", DEFAULT_PROFILE)
+    #one output format, or several profiles written from one fetch (see formats.py / pipeline.py)
+    audio_format = options.get("profiles") or options.get("format", DEFAULT_FORMAT)
+
+    if backend == "api":
+        import dlapi
+        if mode == "large_playlist":
+            dlapi.download_playlist(
+                url, output_dir, status_callback, large=True, event_callback=event_callback,
+                pacing=pacing, audio_format=audio_format, share=share
+            )
+        elif mode == "playlist":
+            dlapi.download_playlist(
+                url, output_dir, status_callback, workers, event_callback=event_callback, audio_format=audio_format, share=share
+            )
+        else:
+            dlapi.download_video(url, output_dir, status_callback, event_callback, audio_format, share)
+
+    elif mode == "large_playlist":
+        from dl_large_playlist import download_playlist
+        download_playlist(url, output_dir, status_callback, event_callback, pacing, audio_format, share)
+
+    elif mode == "playlist" and workers > 1:
+        from dlconcurrent import download_playlist
+        download_playlist(url, output_dir, status_callback, workers, event_callback, audio_format, share)
+
+    elif mode == "playlist":
+        from dlplaylist import download_playlist
+        download_playlist(url, output_dir, status_callback, event_callback, audio_format, share)
+
+    else:
+        from dlsingle import download_video
+        download_video(url, output_dir, status_callback, event_callback, audio_format, share)
+
+
+#headless queue worker - takes pending jobs, runs them, records the outcome, publishes to the event hub
+class Runner:
+
+    #defaults = what a submit without overrides gets: {"output_dir", "mode", "workers", "options"}
+    def __init__(self, queue=None, backend="api", hub=None, status_callback=None, event_callback=None, defaults=None):
+        from progress import ProgressTracker
+
+        self.queue = queue or JobQueue()
+        self.defaults = defaults or {}
+        self.backend = pick_backend(backend)
+        self.hub = hub
+        self.status_callback = status_callback
+        self.event_callback = event_callback
+        self.tracker = ProgressTracker()
+        self.current_job = None
+        self.control = None #JobControl of the running job
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        self.queue.recover()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+
+    #something was queued - don't wait for the next poll
+    def notify(self):
+        self.wakeup.set()
+
+    #queue urls with the defaults (+ overrides) - same rules as the gui: youtube urls only, folder fixed by the runner.
+    #also the submit callback for the api server, so it returns a job id (or None) per url.
+    #claimed = queued as this process's own (cli "download" - see run_now), the queue loop never sees them
+    def submit(self, urls, overrides=None, claimed=False):
+        ids = []
+        for url in urls:
+            url = url.strip()
+            if not is_valid_url(url):
+                ids.append(None)
+                continue
+
+            mode, workers, options = apply_overrides(
+                self.defaults.get("mode", "single"), self.defaults.get("workers", 1),
+                self.defaults.get("options", {}), overrides or {}
+            )
+            job_id = self.queue.add(url, self.defaults["output_dir"], mode, workers, options, claimed)
+            self.publish("job", {"id": job_id, "status": RUNNING if claimed else PENDING, "url": url, "mode": mode})
+            ids.append(job_id)
+
+        if not claimed:
+            self.preempt()
+            self.notify()
+        return ids
+
+    #something more urgent is waiting (a single track behind a playlist) - the running job makes way at its next
+    #entry boundary and goes back in line behind it
+    def preempt(self):
+        job, control = self.current_job, self.control
+        if job is None or control is None:
+            return
+        priority = self.queue.next_priority()
+        if priority is not None and priority > job["priority"]:
+            control.request("preempt")
+
+    #pause / resume / cancel a job - the running one through its control, anything else right in the queue.
+    #also the control callback for the api server, returns False if the job isn't in a state the action applies to
+    def control_job(self, job_id, action):
+        job, control = self.current_job, self.control
+        if job is not None and job["id"] == job_id and control is not None:
+            if action == "resume" and control.requested != "pause":
+                return False
+            control.request(action)
+            return True
+
+        changed = getattr(self.queue, action)(job_id)
+        if changed:
+            self.publish("job", self.queue.get(job_id))
+            if action == "resume":
+                self.notify()
+        return changed
+
+    def publish(self, kind, data):
+        if self.hub:
+            self.hub.publish(kind, data)
+
+    def on_status(self, text):
+        self.tracker.set_status(text)
+        if self.status_callback:
+            self.status_callback(text)
+
+    def on_event(self, event):
+        self.tracker.update(event)
+        if self.event_callback:
+            self.event_callback(event)
+
+    def progress(self, job_id):
+        job = self.current_job
+        if job is None or job["id"] != job_id:
+            return None
+        return self.tracker.snapshot()
+
+    def loop(self):
+        while not self.stopped:
+            job = self.queue.take_next()
+            if job is None:
+                self.wakeup.wait(1.0)
+                self.wakeup.clear()
+                continue
+            self.run(job)
+
+    #preemptible=False for jobs that have to finish here (run_now) - they'd go back in the shared queue otherwise
+    def run(self, job, preemptible=True):
+        control = JobControl()
+        self.current_job = job
+        self.control = control
+        self.tracker.reset()
+        self.publish("job", {"id": job["id"], "status": job["status"], "url": job["url"], "mode": job["mode"]})
+
+        #progress goes out at the gui's refresh rate, and only when it changed
+        done = threading.Event()
+        threading.Thread(target=self.publish_progress, args=(job["id"], done), daemon=True).start()
+
+        error = None
+        try:
+            #a higher priority job queued before this one got here
+            if preemptible:
+                self.preempt()
+            run_job(job, self.on_status, self.on_event, self.backend, control)
+        except JobInterrupted as e:
+            self.on_status(f"download {e.status}")
+            self.queue.interrupt(job["id"], e.action)
+            return self.end_job(job, INTERRUPTED[e.action])
+        except Exception as e:
+            error = str(e)
+            self.on_status(f"download failed: {error}")
+        finally:
+            done.set()
+
+        self.queue.finish(job["id"], error)
+        return self.end_job(job, DONE if error is None else FAILED)
+
+    def end_job(self, job, status):
+        self.current_job = None
+        self.control = None
+        self.publish("job", self.queue.get(job["id"]))
+        return status
+
+    def publish_progress(self, job_id, done):
+        from progress import REFRESH_HZ
+
+        shown = -1
+        while not done.wait(1 / REFRESH_HZ):
+            snap = self.tracker.snapshot()
+            if snap["version"] != shown:
+                shown = snap["version"]
+                self.publish("progress", {"job": job_id, **snap})
+
+    #run jobs queued with submit(claimed=True) on the calling thread (cli "download") - {job id: how it ended},
+    #the status it was found in for one that wasn't this process's to run anymore
+    def run_now(self, job_ids):
+        outcomes = {}
+        for job_id in job_ids:
+            job = self.queue.get(job_id)
+            if job is None or job["status"] != RUNNING:
+                outcomes[job_id] = job["status"] if job else "missing"
+                continue
+            outcomes[job_id] = self.run(job, preemptible=False)
+        return outcomes
@@ -0,0 +1,236 @@
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#local api on 127.0.0.1 - the browser extension and scripts queue downloads here.
+#one thread per connection, so a long-lived event stream or a slow client never blocks a submit.
+#  POST /download  {"url": ...}            -> {"id": job id}
+#  POST /batch     {"urls": [...], ...}    -> {"ids": [job id or null per url]}
+#  GET  /jobs[?limit=n]                    -> newest jobs first
+#  GET  /jobs/<id>                         -> one job (+ live progress while it runs)
+#  POST /jobs/<id>/pause|resume|cancel     -> {"ok": true} (409 if the job can't do that right now)
+#                                             needs Content-Type: application/json, refused from web pages
+#  GET  /events                            -> server-sent events: job / progress
+#  GET  /metrics[?format=json]             -> counters and histograms (prometheus text, see metrics.py)
+#submits can also carry mode, format, profiles (list of profile names), pacing, workers, priority and analyze - the folder is always the one set in the app
+
+PORT = 48721
+
+MAX_BATCH = 500
+KEEPALIVE = 15 #seconds between ": ping" comments on an idle event stream
+SUBSCRIBER_BACKLOG = 256 #events buffered per slow client before it starts missing progress ticks
+
+#the only endpoints a web page / the extension may call (preflights for anything else are refused)
+CORS_PATHS = ("/download", "/batch")
+
+
+#fan-out for the event stream - publish never blocks, a client that stopped reading just loses events
+class EventHub:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = []
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_BACKLOG)
+        with self.lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def publish(self, kind, data):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((kind, data))
+            except queue.Full:
+                pass
+
+
+#prevent previous server instances from blocking connection
+class ApiServer(ThreadingHTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    #submit(urls, options) -> job id (or None if rejected) per url, progress(job id) -> live progress dict or None,
+    #control(job id, action) -> True if the job was paused/resumed/cancelled
+    def __init__(self, address, submit, jobs, hub, progress=None, control=None):
+        super().__init__(address, ApiRequestHandler)
+        self.submit = submit
+        self.jobs = jobs
+        self.hub = hub
+        self.progress = progress
+        self.control = control
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+
+    #only the submit endpoints are open to the extension/other origins - job history isn't readable from a web page
+    def _set_cors_headers(self): #defining CORS
+        self.send_header("Access-Control-Allow-Origin", "*") #allow any website/extension to make requests to this server
+        self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS") #server accepts post and options requests
+        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+
+    def log_message(self, format, *args):
+        pass #no console spam per request
+
+    def send_json(self, status, payload, cors=False):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        if cors:
+            self._set_cors_headers()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    #pre flight check - only the submit endpoints pass
+    def do_OPTIONS(self):
+        if self.path not in CORS_PATHS:
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200) #response of 200 = good to go
+        self._set_cors_headers()
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path.startswith("/jobs/"):
+            self.control_job()
+            return
+
+        if self.path not in ("/download", "/batch"):
+            self.send_json(404, {"error": "not found"}, cors=True)
+            return
+
+        try:
+            content_length = int(self.headers.get("Content-Length", 0)) #this tells python exactly how much data to read
+            data = json.loads(self.rfile.read(content_length))
+            urls = [data["url"]] if self.path == "/download" else list(data["urls"])
+            if not urls or len(urls) > MAX_BATCH or not all(isinstance(url, str) for url in urls):
+                raise ValueError("bad url list")
+        except (ValueError, KeyError, TypeError):
+            self.send_json(400, {"error": "expected {\"url\": ...} or {\"urls\": [...]}"}, cors=True)
+            return
+
+        options = {key: data[key] for key in ("mode", "format", "profiles", "pacing", "workers", "priority", "analyze") if key in data}
+        ids = self.server.submit(urls, options)
+
+        if self.path == "/download":
+            if ids[0] is None:
+                self.send_json(400, {"error": "url rejected"}, cors=True)
+            else:
+                self.send_json(200, {"id": ids[0]}, cors=True)
+        else:
+            self.send_json(200, {"ids": ids}, cors=True)
+
+    #not for web pages: a bodyless or form POST is a cors "simple request" the browser sends without asking, so
+    #no cors headers alone wouldn't stop one. browsers put an Origin on every cross-origin POST (the cli and
+    #scripts don't), and a json content type needs a preflight, which do_OPTIONS refuses for this path
+    def control_job(self):
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if self.headers.get("Origin") or content_type != "application/json":
+            self.send_json(403, {"error": "job control needs Content-Type: application/json and no Origin"})
+            return
+
+        job_id, _, action = self.path[len("/jobs/"):].partition("/")
+        try:
+            job_id = int(job_id)
+        except ValueError:
+            job_id = None
+        if job_id is None or action not in ("pause", "resume", "cancel") or self.server.control is None:
+            self.send_json(404, {"error": "not found"})
+            return
+        if self.server.jobs.get(job_id) is None:
+            self.send_json(404, {"error": "no such job"})
+            return
+
+        if self.server.control(job_id, action):
+            self.send_json(200, {"ok": True})
+        else:
+            self.send_json(409, {"error": f"job can't {action} now"})
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+
+        if path == "/jobs":
+            params = dict(part.partition("=")[::2] for part in query.split("&") if part)
+            try:
+                limit = max(1, min(int(params.get("limit", 100)), 1000))
+            except ValueError:
+                limit = 100
+            self.send_json(200, {"jobs": self.server.jobs.list(limit)})
+
+        elif path.startswith("/jobs/"):
+            try:
+                job = self.server.jobs.get(int(path[len("/jobs/"):]))
+            except ValueError:
+                job = None
+            if job is None:
+                self.send_json(404, {"error": "no such job"})
+                return
+            if self.server.progress:
+                job["progress"] = self.server.progress(job["id"])
+            self.send_json(200, job)
+
+        elif path == "/events":
+            self.stream_events()
+
+        elif path == "/metrics":
+            self.send_metrics(query)
+
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def send_metrics(self, query):
+        from metrics import get_metrics
+
+        if "format=json" in query:
+            self.send_json(200, get_metrics().snapshot())
+            return
+
+        body = get_metrics().render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    #server-sent events until the client goes away
+    def stream_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        subscriber = self.server.hub.subscribe()
+        try:
+            while True:
+                try:
+                    kind, data = subscriber.get(timeout=KEEPALIVE)
+                    chunk = f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+                except queue.Empty:
+                    chunk = ": ping\n\n"
+                self.wfile.write(chunk.encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+        finally:
+            self.server.hub.unsubscribe(subscriber)
+
+
+#runs the server on a daemon thread, returns it (or None if the port is taken by another instance)
+def start_server(submit, jobs, hub, progress=None, port=PORT, control=None):
+    try:
+        server = ApiServer(("127.0.0.1", port), submit, jobs, hub, progress, control)
+    except OSError:
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
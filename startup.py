@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+
+from appdata import data_path
+
+#startup phase timer - gui.py imports this first, marks each phase (imports, ui build, style, server bind,
+#first event loop tick) and dumps the timings with --startup-profile (or CRATEPLUG_STARTUP_PROFILE=1).
+#the window has to be interactive within BUDGET_MS, since the extension posts urls into it right after launch
+
+STARTED = time.perf_counter()
+
+BUDGET_MS = 800
+FLAG = "--startup-profile"
+
+
+def enabled(argv=None):
+    return FLAG in (argv or sys.argv) or os.getenv("CRATEPLUG_STARTUP_PROFILE") == "1"
+
+
+class PhaseTimer:
+
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.last = started
+        self.phases = []
+
+    #close the current phase
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last) * 1000))
+        self.last = now
+
+    def total(self):
+        return (self.last - self.started) * 1000
+
+    def report(self):
+        lines = [f"{name:<12} {ms:8.1f} ms" for name, ms in self.phases]
+        total = self.total()
+        verdict = "ok" if total <= BUDGET_MS else f"over budget by {total - BUDGET_MS:.0f} ms"
+        lines.append(f"{'total':<12} {total:8.1f} ms  (budget {BUDGET_MS} ms: {verdict})")
+        return "\n".join(lines)
+
+    #stdout plus a log in the data folder (the windows build has no console)
+    def dump(self):
+        report = self.report()
+        print(report, flush=True)
+        with open(data_path("startup.log"), "a", encoding="utf-8") as f:
+            f.write(time.strftime("%Y-%m-%d %H:%M:%S") + "\n" + report + "\n\n")
+
+
+TIMER = PhaseTimer()
+
+
+#pre-scaled copy of an image asset - keyed by size and mtime of the source, so a new logo regenerates it
+def scaled_asset_path(source, width):
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return None
+    stem = os.path.splitext(os.path.basename(source))[0]
+    folder = data_path("assets")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{stem}-{width}w-{int(stat.st_mtime)}-{stat.st_size}.png")
@@ -0,0 +1,196 @@
+import atexit
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from binaries import POPEN_FLAGS
+from classifier import FAILURES
+
+#watchdog for the yt-dlp processes - a child stuck on a dead connection or a fragment that never comes
+#would otherwise block its download thread (and the queue behind it) forever.
+#each process is watched per stage, from the events it prints:
+#  extract      entry started (or the previous one finished) -> first byte: EXTRACT_LIMIT
+#  download     no new bytes for STALL_LIMIT
+#  postprocess  all bytes in -> file in place (ffmpeg): POSTPROCESS_LIMIT
+#past a limit the whole process tree is killed (yt-dlp and the ffmpeg it started) and supervised_events starts
+#the command again, up to STALL_RETRIES times per entry - the affected entry goes back in, finished ones are skipped.
+#an entry that keeps hanging is reported failed and, in the playlist modes, left out of the next start
+
+EXTRACT_LIMIT = 300
+STALL_LIMIT = 90
+POSTPROCESS_LIMIT = 900
+STALL_RETRIES = 2
+
+CHECK_INTERVAL = 1.0
+KILL_GRACE = 5 #seconds between asking nicely and SIGKILL
+
+#own session on linux/mac so the tree can be killed as a group - windows uses taskkill /T instead
+SESSION_FLAGS = {} if sys.platform == "win32" else {"start_new_session": True}
+
+#line fed to the parser when the watchdog killed a process - shows up as a "stalled" failure (see classifier.py)
+STALL_LINE = "ERROR: [crateplug] {video_id}: download stalled - {reason}"
+
+_running = set()
+_running_lock = threading.Lock()
+
+
+def kill_tree(process):
+    if process.poll() is not None:
+        return
+    if sys.platform == "win32":
+        subprocess.run(
+            ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+            **POPEN_FLAGS,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return
+
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(KILL_GRACE)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    except OSError:
+        pass
+
+
+#children live in their own session, so they don't die with us by themselves
+@atexit.register
+def kill_all():
+    with _running_lock:
+        running = list(_running)
+    for process in running:
+        kill_tree(process)
+
+
+class Supervised:
+
+    def __init__(self, command, **popen):
+        self.lock = threading.Lock()
+        self.stage = "extract"
+        self.since = time.monotonic()
+        self.bytes = None
+        self.video_id = None
+        self.index = None #playlist position of the entry in progress
+        self.stalled = None #why the watchdog killed it, None while it behaves
+
+        self.process = subprocess.Popen(
+            command,
+            **POPEN_FLAGS,
+            **SESSION_FLAGS,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            **popen,
+        )
+        with _running_lock:
+            _running.add(self.process)
+        threading.Thread(target=self.watch, daemon=True).start()
+
+    def set_stage(self, stage, now):
+        self.stage = stage
+        self.since = now
+
+    #move the stage clock along with what the process reports
+    def observe(self, event):
+        now = time.monotonic()
+        with self.lock:
+            if event.category == "entry":
+                self.video_id = event.video_id or self.video_id
+                self.index = event.index or self.index
+                self.bytes = None
+                self.set_stage("extract", now)
+
+            elif event.category == "progress":
+                self.video_id = event.video_id or self.video_id
+                self.index = event.index or self.index
+                downloaded, total = event.data.downloaded, event.data.total
+                if downloaded != self.bytes:
+                    self.bytes = downloaded
+                    self.set_stage("download", now)
+                if downloaded and total and downloaded >= total and self.stage != "postprocess":
+                    self.set_stage("postprocess", now)
+
+            elif event.category in ("done", "archived") or event.message:
+                #finished or failed - next up is the next entry's extraction
+                if event.category in ("done", "archived") or event.category in FAILURES:
+                    self.video_id = self.index = None #a hang from here on isn't this entry's
+                self.bytes = None
+                self.set_stage("extract", now)
+
+    def limit(self):
+        return {"extract": EXTRACT_LIMIT, "download": STALL_LIMIT, "postprocess": POSTPROCESS_LIMIT}[self.stage]
+
+    def watch(self):
+        while self.process.poll() is None:
+            time.sleep(CHECK_INTERVAL)
+            with self.lock:
+                limit = self.limit()
+                overdue = time.monotonic() - self.since > limit
+                if overdue:
+                    self.stalled = f"no {'progress' if self.stage == 'download' else self.stage} for {limit}s"
+            if overdue:
+                kill_tree(self.process)
+                return
+
+    #raw output lines - during extraction any output counts as a sign of life (the flat listing prints nothing else)
+    def lines(self):
+        try:
+            for line in self.process.stdout:
+                if self.stage == "extract":
+                    with self.lock:
+                        if self.stage == "extract":
+                            self.since = time.monotonic()
+                yield line
+            self.process.wait()
+        finally:
+            if self.process.poll() is None:
+                kill_tree(self.process) #caller stopped reading half way
+            self.process.stdout.close()
+            with _running_lock:
+                _running.discard(self.process)
+
+    def events(self, parser):
+        for line in self.lines():
+            event = parser.feed(line)
+            if event:
+                self.observe(event)
+                yield event
+
+    #failure event for the entry in progress when the watchdog had to step in
+    def stall_event(self, parser, reason):
+        return parser.feed(STALL_LINE.format(video_id=self.video_id or "NA", reason=reason))
+
+
+#events of a yt-dlp command run under the watchdog - a stalled run is started again, so the entry it hung on
+#gets another go (up to retries times per entry - a long playlist can hit several unrelated stalls).
+#command can be a function, so a restart can leave out what got done meanwhile.
+#an entry out of retries gets a last failure event; leave_out(index, video_id) (the playlist modes) then takes it
+#out of the command and returns True if there's anything left to run - otherwise that's the end, same as when
+#the entry can't be told or hangs again after all (the restart got nowhere)
+def supervised_events(command, parser, retries=STALL_RETRIES, leave_out=None, **popen):
+    stalls = {}
+    while True:
+        process = Supervised(command() if callable(command) else command, **popen)
+        yield from process.events(parser)
+        if not process.stalled:
+            return
+
+        key = process.index or process.video_id
+        stalls[key] = stalls.get(key, 0) + 1
+        given_up = stalls[key] > retries
+        event = process.stall_event(parser, process.stalled + (f", gave up after {stalls[key]} tries" if given_up else ""))
+        if event:
+            yield event
+        if not given_up:
+            continue
+        if stalls[key] > retries + 1 or key is None or leave_out is None or not leave_out(process.index, process.video_id):
+            return
@@ -0,0 +1,176 @@
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+from appdata import data_path
+
+#overview of a finished track for the results view - min, max and rms of BUCKETS stretches of the whole file,
+#however long it is. made in the analysis worker (see analysis.py), from the same decode:
+#  - every decoded chunk goes to a scratch file as mono int16 - nothing of the track is kept in memory
+#  - how wide a bucket is depends on the length, known once the decode is done, so then the scratch file is
+#    mapped BLOCK samples at a time and reduced with numpy - memory stays at one block, for a 3 hour mix too
+#  - the result (3 bytes per bucket) goes next to the track in .waveforms/<file name>.wf and into the analysis
+#    cache, so a re-run or a deleted sidecar costs no decode
+#reading a sidecar doesn't need numpy - the gui draws straight from it
+
+BUCKETS = 1000
+BLOCK = 1 << 21 #samples per mapped block (4MB of int16)
+FOLDER = ".waveforms"
+SCRATCH_AGE = 3600 #seconds - scratch files older than this were left by a worker that died
+
+MAGIC = b"CPWF"
+FORMAT = 1
+HEADER = struct.Struct("<4sBHf") #magic, format, buckets, seconds
+
+
+def sidecar_path(path):
+    return os.path.join(os.path.dirname(path), FOLDER, os.path.basename(path) + ".wf")
+
+
+#min/max/rms per bucket of the int16 samples in a scratch file, one mapped block at a time
+def reduce(path, frames, buckets=BUCKETS):
+    import numpy as np
+
+    buckets = min(buckets, frames) #every bucket gets at least one sample
+    edges = np.linspace(0, frames, buckets + 1).astype(np.int64)
+    low = np.full(buckets, np.inf)
+    high = np.full(buckets, -np.inf)
+    squares = np.zeros(buckets)
+
+    for start in range(0, frames, BLOCK):
+        count = min(BLOCK, frames - start)
+        block = np.memmap(path, dtype=np.int16, mode="r", offset=start * 2, shape=(count,))
+        samples = block.astype(np.float32) / 32768
+        del block #unmapped again - the pages it read don't pile up
+
+        #buckets this block touches, and where each starts inside it - the first and last can carry on
+        #into the blocks either side, so everything is combined with what's there already
+        first = int(np.searchsorted(edges, start, "right")) - 1
+        last = int(np.searchsorted(edges, start + count - 1, "right")) - 1
+        ids = np.arange(first, last + 1)
+        starts = np.maximum(edges[ids], start) - start
+        low[ids] = np.minimum(low[ids], np.minimum.reduceat(samples, starts))
+        high[ids] = np.maximum(high[ids], np.maximum.reduceat(samples, starts))
+        squares[ids] += np.add.reduceat(samples * samples, starts, dtype=np.float64)
+
+    return low, high, np.sqrt(squares / np.diff(edges))
+
+
+#header + min and max as int8, rms as uint8
+def pack(low, high, rms, seconds):
+    import numpy as np
+
+    def quantize(values, scale, dtype):
+        return np.clip(np.round(values * scale), -scale, scale).astype(dtype).tobytes()
+
+    return (
+        HEADER.pack(MAGIC, FORMAT, len(low), seconds)
+        + quantize(low, 127, np.int8) + quantize(high, 127, np.int8) + quantize(rms, 255, np.uint8)
+    )
+
+
+#mono copy of a decode on disk - with-block, the file is gone when it ends
+class Scratch:
+
+    def __init__(self):
+        folder = data_path("scratch")
+        os.makedirs(folder, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix=".pcm", dir=folder)
+        self.file = os.fdopen(fd, "wb")
+        self.frames = 0
+        self.failed = False #disk full etc - the analysis carries on without an overview
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    #(frames, 2) float32
+    def write(self, chunk):
+        import numpy as np
+
+        if self.failed:
+            return
+        try:
+            np.clip(chunk.mean(axis=1) * 32768, -32768, 32767).astype(np.int16).tofile(self.file)
+        except OSError:
+            self.failed = True
+        self.frames += len(chunk)
+
+    #the packed overview, None if there's nothing to show
+    def overview(self, seconds):
+        try:
+            self.file.flush()
+        except OSError:
+            self.failed = True
+        if self.failed or not self.frames:
+            return None
+        return pack(*reduce(self.path, self.frames), seconds)
+
+
+#scratch files of workers that were killed half way through a decode
+def clean_scratch():
+    folder = data_path("scratch")
+    try:
+        entries = list(os.scandir(folder))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.name.endswith(".pcm") and time.time() - entry.stat().st_mtime > SCRATCH_AGE:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def hide(folder):
+    if sys.platform == "win32":
+        import ctypes
+        ctypes.windll.kernel32.SetFileAttributesW(folder, 2) #FILE_ATTRIBUTE_HIDDEN
+
+
+#the overview of the track at path - False if the folder isn't writable
+def write_sidecar(path, overview):
+    target = sidecar_path(path)
+    folder = os.path.dirname(target)
+    try:
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+            hide(folder)
+        with open(target + ".part", "wb") as f:
+            f.write(overview)
+        os.replace(target + ".part", target)
+        return True
+    except OSError:
+        return False
+
+
+#the overview of the track at path as {"seconds", "low", "high", "rms"} (arrays, -127..127 and 0..255),
+#None if there isn't one (yet)
+def load(path):
+    try:
+        with open(sidecar_path(path), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, version, buckets, seconds = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT or len(data) != HEADER.size + 3 * buckets:
+        return None
+
+    body = data[HEADER.size:]
+    return {
+        "seconds": seconds,
+        "low": array("b", body[:buckets]),
+        "high": array("b", body[buckets:2 * buckets]),
+        "rms": array("B", body[2 * buckets:]),
+    }